@@ -0,0 +1,137 @@
+"""Measure the word chunking of the PDF chatbot tutorial on large documents.
+
+The prefix sum chunking of ``PDFChunker.chunk_by_words`` and the streaming
+``PDFChunker.iter_chunks`` are compared with a copy of the previous algorithm, which
+sliced and rescanned the remaining words for every chunk. The memory of text chunks is
+then compared with ``Chunk`` spans of one cleaned text, counting that text once, along
+with the time to compute their overlap statistics. The tutorial requirements,
+including pypdf, must be installed. Run from the repository root:
+
+    python benchmarks/bench_chunker.py
+    python benchmarks/bench_chunker.py --words 100000,400000 --chunk-size 500
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import string
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "tutorials", "pdf-chatbot")
+)
+
+from chunker import PDFChunker  # noqa: E402
+
+
+def rescanning_chunk_by_words(chunker: PDFChunker, text: str) -> list[str]:
+    """Chunk the text with the previous algorithm."""
+    words = text.split()
+    chunks = []
+    start_idx = 0
+    while start_idx < len(words):
+        end_idx = start_idx + chunker._words_in_chunk(words[start_idx:])
+        end_idx = min(end_idx, len(words))
+        chunks.append(" ".join(words[start_idx:end_idx]))
+        if end_idx >= len(words):
+            break
+        overlap_words = chunker._words_in_overlap(words[start_idx:end_idx])
+        start_idx = max(start_idx + 1, end_idx - overlap_words)
+    return chunks
+
+
+def document(count: int) -> str:
+    """Return a text of ``count`` random words."""
+    return " ".join(
+        "".join(random.choices(string.ascii_lowercase, k=random.randint(1, 12)))
+        for _ in range(count)
+    )
+
+
+def timed(chunk, text: str) -> tuple[list[str], float]:
+    """Return the chunks of the text and the seconds it took to compute them."""
+    start = time.perf_counter()
+    chunks = chunk(text)
+    return chunks, time.perf_counter() - start
+
+
+def allocated(build) -> tuple[list, int]:
+    """Return the result of ``build`` and the bytes it allocated and kept."""
+    tracemalloc.start()
+    result = build()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, used
+
+
+def shared_source(chunks: list, text: str) -> int:
+    """Return the bytes of the document text that spans keep alive without a copy.
+
+    ``chunk_spans`` reuses an already normalized text as the source of its spans, so
+    the text is allocated before the measurement but still retained by the chunks.
+    """
+    if chunks and getattr(chunks[0], "source", None) is text:
+        return sys.getsizeof(text)
+    return 0
+
+
+def stats_seconds(chunker: PDFChunker, chunks: list) -> float:
+    """Return the seconds ``print_chunk_stats`` takes, without its output."""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        chunker.print_chunk_stats(chunks)
+    return time.perf_counter() - start
+
+
+def main():
+    """Chunk documents of several sizes with every algorithm and print the times."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--words",
+        type=lambda value: [int(count) for count in value.split(",")],
+        default=[100_000, 200_000, 400_000],
+        help="comma separated document sizes in words",
+    )
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--overlap-size", type=int, default=100)
+    args = parser.parse_args()
+
+    random.seed(0)
+    chunker = PDFChunker(args.chunk_size, args.overlap_size)
+    algorithms = {
+        "rescanning": lambda text: rescanning_chunk_by_words(chunker, text),
+        "prefix sums": chunker.chunk_by_words,
+        "streaming": lambda text: list(chunker.iter_chunks(text.split())),
+    }
+    for count in args.words:
+        text = document(count)
+        results = {name: timed(chunk, text) for name, chunk in algorithms.items()}
+        expected = results["rescanning"][0]
+        for name, (chunks, seconds) in results.items():
+            if chunks != expected:
+                raise AssertionError(f"{name} chunks differ from the previous output")
+            print(
+                f"{count:>8} words  {name:<12} {len(chunks):>7} chunks"
+                f"  {seconds * 1000:9.1f} ms"
+            )
+
+        for name, build in {
+            "strings": lambda: chunker.chunk_by_words(text),
+            "spans": lambda: chunker.chunk_spans(text),
+        }.items():
+            chunks, used = allocated(build)
+            source = shared_source(chunks, text)
+            print(
+                f"{count:>8} words  {name:<12} {(used + source) / 1024 / 1024:7.1f} MiB"
+                f"  stats {stats_seconds(chunker, chunks) * 1000:9.1f} ms"
+                + (f"  (source text {source / 1024 / 1024:.1f} MiB)" if source else "")
+            )
+            del chunks
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Compare the JSON codecs on realistic embedding and search payloads.
+
+Run from the repository root:
+
+    PYTHONPATH=src python benchmarks/bench_codec.py
+"""
+
+import argparse
+import base64
+import random
+import string
+import timeit
+from array import array
+
+from sandbox import discovery_sandbox
+from sandbox.discovery_sandbox import (
+    Credential,
+    JSONCodec,
+    MsgspecCodec,
+    OrjsonCodec,
+    Processor,
+    Server,
+)
+
+
+def words(count: int) -> str:
+    """Return a string of random words."""
+    return " ".join(
+        "".join(random.choices(string.ascii_lowercase, k=random.randint(3, 9)))
+        for _ in range(count)
+    )
+
+
+def embedding_response(dimensions: int = 1536) -> dict:
+    """Return an OpenAI embeddings response as returned by the sandbox."""
+    return {
+        "embeddings": [
+            {"embedding": [random.uniform(-1, 1) for _ in range(dimensions)]}
+        ],
+        "model": "text-embedding-3-small",
+        "usage": {"promptTokens": 8, "totalTokens": 8},
+    }
+
+
+def base64_embedding_response(dimensions: int = 1536) -> dict:
+    """Return an embeddings response with a base64 encoded float32 vector."""
+    response = embedding_response(dimensions)
+    vector = array("f", response["embeddings"][0]["embedding"])
+    response["embeddings"][0]["embedding"] = base64.b64encode(vector).decode()
+    return response
+
+
+def search_response(hits: int = 100) -> dict:
+    """Return an Elasticsearch search response with full documents."""
+    return {
+        "took": 12,
+        "hits": {
+            "total": {"value": hits, "relation": "eq"},
+            "max_score": 12.5,
+            "hits": [
+                {
+                    "_index": "test_search",
+                    "_id": str(index),
+                    "_score": random.uniform(0, 12.5),
+                    "_source": {
+                        "title": words(8),
+                        "description": words(30),
+                        "contents": words(400),
+                        "url": "https://example.com/" + words(1),
+                        "publication_date": "2025-01-01",
+                    },
+                }
+                for index in range(hits)
+            ],
+        },
+    }
+
+
+def vector_search_request(dimensions: int = 1536) -> dict:
+    """Return the request body of an Elasticsearch vector search processor."""
+    server = Server(
+        "elasticsearch",
+        {"servers": ["https://localhost:9200"]},
+        Credential("elasticsearch", {"username": "elastic", "password": "secret"}),
+    )
+    processor = Processor(
+        "elasticsearch",
+        {
+            "action": "vector",
+            "field": "vector",
+            "index": "test_search",
+            "vector": [random.uniform(-1, 1) for _ in range(dimensions)],
+            "function": "cosineSimilarity",
+            "maxResults": 10,
+        },
+        server,
+    )
+    return {"processor": processor, "input": {}}
+
+
+def available_codecs() -> list:
+    """Return an instance of every codec whose backend is installed."""
+    codecs = [JSONCodec()]
+    if discovery_sandbox.orjson is not None:
+        codecs.append(OrjsonCodec())
+    if discovery_sandbox.msgspec is not None:
+        codecs.append(MsgspecCodec())
+    return codecs
+
+
+def main():
+    """Time encoding and decoding of each payload with every available codec."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    random.seed(0)
+    reference = JSONCodec()
+    responses = {
+        "embedding response": reference.encode(embedding_response()),
+        "search response": reference.encode(search_response()),
+    }
+    request = vector_search_request()
+
+    print(f"{'payload':<28}{'codec':<10}{'size':>10}{'time':>14}")
+    for codec in available_codecs():
+        seconds = timeit.timeit(lambda: codec.encode(request), number=args.number)
+        size = len(codec.encode(request))
+        print(
+            f"{'encode vector request':<28}{codec.name:<10}{size:>10}"
+            f"{seconds / args.number * 1e6:>11.1f} us"
+        )
+    for name, body in responses.items():
+        for codec in available_codecs():
+            seconds = timeit.timeit(lambda: codec.decode(body), number=args.number)
+            print(
+                f"{'decode ' + name:<28}{codec.name:<10}{len(body):>10}"
+                f"{seconds / args.number * 1e6:>11.1f} us"
+            )
+
+    embedding_responses = {
+        "floats": reference.encode(embedding_response()),
+        "base64": reference.encode(base64_embedding_response()),
+    }
+    codec = discovery_sandbox.default_codec()
+    for name, body in embedding_responses.items():
+        for embeddings in discovery_sandbox.EMBEDDING_FORMATS:
+            if embeddings == "numpy" and discovery_sandbox.numpy is None:
+                continue
+            seconds = timeit.timeit(
+                lambda: discovery_sandbox._decode_embeddings(
+                    codec.decode(body), embeddings
+                ),
+                number=args.number,
+            )
+            print(
+                f"{'embedding ' + name + ' to ' + embeddings:<28}{codec.name:<10}"
+                f"{len(body):>10}{seconds / args.number * 1e6:>11.1f} us"
+            )
+
+
+if __name__ == "__main__":
+    main()
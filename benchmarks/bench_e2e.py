@@ -0,0 +1,218 @@
+"""Measure end-to-end throughput and latency of the clients at several concurrency levels.
+
+Every scenario runs against a local stand-in of the sandbox API, so no QueryFlow
+instance or network is needed. Run from the repository root:
+
+    PYTHONPATH=src python benchmarks/bench_e2e.py
+    PYTHONPATH=src python benchmarks/bench_e2e.py --latency 20 --json results.json
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sandbox.discovery_sandbox import (
+    AsyncQueryFlowClient,
+    QueryFlowClient,
+    QueryFlowSequence,
+    QueryFlowSequenceProcessor,
+)
+from sandbox.resilience import AdaptiveConcurrency, RetryPolicy
+from standin import StandInServer
+
+SEQUENCE = QueryFlowSequence(
+    [
+        QueryFlowSequenceProcessor("embeddings", name="embeddings"),
+        QueryFlowSequenceProcessor("search", name="search"),
+        QueryFlowSequenceProcessor("completion", name="completion"),
+    ]
+)
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    """Return the nearest-rank percentile of sorted values."""
+    return ordered[max(0, min(len(ordered) - 1, round(q * len(ordered)) - 1))]
+
+
+def summarize(latencies: list[float], elapsed: float) -> dict:
+    """Return the throughput and latency percentiles of a run, in milliseconds."""
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "throughput": len(ordered) / elapsed,
+        "p50": percentile(ordered, 0.50) * 1000,
+        "p95": percentile(ordered, 0.95) * 1000,
+        "p99": percentile(ordered, 0.99) * 1000,
+    }
+
+
+def run_threads(call, requests: int, concurrency: int) -> dict:
+    """Run the call ``requests`` times from ``concurrency`` threads."""
+
+    def timed(_):
+        start = time.perf_counter()
+        call()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(timed, range(requests)))
+    return summarize(latencies, time.perf_counter() - start)
+
+
+async def run_tasks(call, requests: int, concurrency: int) -> dict:
+    """Await the call ``requests`` times from ``concurrency`` tasks."""
+    latencies = []
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def sync_scenarios(client: QueryFlowClient) -> dict:
+    """Return the synchronous calls to benchmark, by name."""
+    return {
+        "text_to_text": lambda: client.text_to_text("processor", {"text": "hello"}),
+        "text_to_stream": lambda: sum(
+            1 for _ in client.text_to_stream("processor", {"text": "hello"})
+        ),
+        "execute": lambda: client.execute(SEQUENCE, {"text": "hello"}),
+    }
+
+
+def async_scenarios(client: AsyncQueryFlowClient) -> dict:
+    """Return the asynchronous calls to benchmark, by name."""
+
+    async def stream():
+        async for _ in client.text_to_stream("processor", {"text": "hello"}):
+            pass
+
+    return {
+        "text_to_text": lambda: client.text_to_text("processor", {"text": "hello"}),
+        "text_to_stream": stream,
+        "execute": lambda: client.execute(SEQUENCE, {"text": "hello"}),
+    }
+
+
+def run_sync(url: str, args, retry, concurrency) -> list[dict]:
+    """Run every synchronous scenario at every concurrency level."""
+    results = []
+    with QueryFlowClient(url, "key", retry=retry, concurrency=concurrency) as client:
+        scenarios = sync_scenarios(client)
+        for name in args.scenarios:
+            for concurrency in args.concurrency:
+                run_threads(scenarios[name], min(args.requests, 20), concurrency)
+                result = run_threads(scenarios[name], args.requests, concurrency)
+                results.append(
+                    {"client": "sync", "scenario": name, "concurrency": concurrency}
+                    | result
+                )
+                report(results[-1])
+    return results
+
+
+async def run_async(url: str, args, retry, concurrency) -> list[dict]:
+    """Run every asynchronous scenario at every concurrency level."""
+    results = []
+    async with AsyncQueryFlowClient(
+        url, "key", retry=retry, concurrency=concurrency
+    ) as client:
+        scenarios = async_scenarios(client)
+        for name in args.scenarios:
+            for concurrency in args.concurrency:
+                await run_tasks(scenarios[name], min(args.requests, 20), concurrency)
+                result = await run_tasks(scenarios[name], args.requests, concurrency)
+                results.append(
+                    {"client": "async", "scenario": name, "concurrency": concurrency}
+                    | result
+                )
+                report(results[-1])
+    return results
+
+
+def report(result: dict) -> None:
+    """Print one benchmark result."""
+    print(
+        f"{result['client']:<5} {result['scenario']:<14} c={result['concurrency']:<4}"
+        f" {result['throughput']:9.1f} req/s"
+        f"  p50 {result['p50']:8.3f} ms"
+        f"  p95 {result['p95']:8.3f} ms"
+        f"  p99 {result['p99']:8.3f} ms"
+    )
+
+
+def main():
+    """Run the scenarios and optionally save the results for later comparison."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument(
+        "--concurrency",
+        type=lambda value: [int(level) for level in value.split(",")],
+        default=[1, 8, 32],
+        help="comma separated concurrency levels",
+    )
+    parser.add_argument(
+        "--scenarios",
+        type=lambda value: value.split(","),
+        default=["text_to_text", "text_to_stream", "execute"],
+    )
+    parser.add_argument("--clients", default="sync,async")
+    parser.add_argument("--latency", type=float, default=0, help="server latency in ms")
+    parser.add_argument("--jitter", type=float, default=0, help="latency jitter in ms")
+    parser.add_argument("--payload-size", type=int, default=256)
+    parser.add_argument("--events", type=int, default=20)
+    parser.add_argument("--event-interval", type=float, default=0, help="in ms")
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument(
+        "--capacity", type=int, help="requests the server handles at once, then 429"
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="limit the requests in flight with AdaptiveConcurrency",
+    )
+    parser.add_argument("--json", help="file to write the results to")
+    args = parser.parse_args()
+
+    # Injected errors are retried so failed calls do not end the run.
+    retry = None
+    if args.error_rate or args.capacity:
+        retry = RetryPolicy(max_attempts=100, backoff=0.001, max_backoff=0.1)
+    concurrency = None
+    if args.adaptive:
+        concurrency = AdaptiveConcurrency(max_limit=max(args.concurrency))
+    results = []
+    with StandInServer(
+        latency=args.latency / 1000,
+        jitter=args.jitter / 1000,
+        payload_size=args.payload_size,
+        events=args.events,
+        event_interval=args.event_interval / 1000,
+        error_rate=args.error_rate,
+        capacity=args.capacity,
+        seed=0,
+        backlog=max(128, *args.concurrency),
+    ) as server:
+        if "sync" in args.clients.split(","):
+            results += run_sync(server.url, args, retry, concurrency)
+        if "async" in args.clients.split(","):
+            results += asyncio.run(run_async(server.url, args, retry, concurrency))
+        if server.rejected:
+            print(f"{server.rejected} of {server.requests} requests over capacity")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
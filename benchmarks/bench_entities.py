@@ -0,0 +1,143 @@
+"""Measure the memory and construction time of the slotted entities.
+
+The entities are compared with copies of the original plain classes, which kept their
+fields in an instance ``__dict__``, with the fields the steps have today. Run from the
+repository root:
+
+    PYTHONPATH=src python benchmarks/bench_entities.py
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from sandbox.discovery_sandbox import (
+    Credential,
+    Processor,
+    QueryFlowSequenceProcessor,
+    Server,
+)
+
+
+class DictCredential:
+    """The original Credential."""
+
+    def __init__(self, type, secret):
+        """Initialize the fields."""
+        self.type = type
+        self.secret = secret
+
+
+class DictServer:
+    """The original Server."""
+
+    def __init__(self, type, config, credential=None):
+        """Initialize the fields."""
+        self.type = type
+        self.config = config
+        self.credential = credential
+
+
+class DictProcessor:
+    """The original Processor."""
+
+    def __init__(self, type, config, server=None):
+        """Initialize the fields."""
+        self.type = type
+        self.config = config
+        self.server = server
+
+
+class DictSequenceProcessor:
+    """The original QueryFlowSequenceProcessor, with the fields added since."""
+
+    def __init__(self, processor, timeout=None, concurrency=None, name=None):
+        """Initialize the fields."""
+        self.processor = processor
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.name = name
+
+
+def build(classes, count: int, **options) -> list:
+    """Build ``count`` steps, each with its own processor, server and credential."""
+    credential, server, processor, step = classes
+    config = {"action": "embeddings"}
+    return [
+        step(
+            processor(
+                "openai",
+                config,
+                server(
+                    "openai", config, credential("openai", config, **options), **options
+                ),
+                **options,
+            ),
+            **options,
+        )
+        for _ in range(count)
+    ]
+
+
+def measure(name: str, classes, count: int, **options) -> dict:
+    """Return the bytes per step and the seconds to build ``count`` steps."""
+    start = time.perf_counter()
+    build(classes, count, **options)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    steps = build(classes, count, **options)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del steps
+    return {"name": name, "bytes": used / count, "us": elapsed / count * 1e6}
+
+
+def main():
+    """Build many entities with each layout and print their cost."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=100_000)
+    args = parser.parse_args()
+
+    results = [
+        measure(
+            "dict",
+            (DictCredential, DictServer, DictProcessor, DictSequenceProcessor),
+            args.count,
+        ),
+        measure(
+            "slots",
+            (Credential, Server, Processor, QueryFlowSequenceProcessor),
+            args.count,
+        ),
+        measure(
+            "slots frozen",
+            (Credential, Server, Processor, QueryFlowSequenceProcessor),
+            args.count,
+            frozen=True,
+        ),
+    ]
+    baseline = results[0]["bytes"]
+    for result in results:
+        print(
+            f"{result['name']:<13} {result['bytes']:7.1f} bytes/step"
+            f" ({result['bytes'] / baseline:5.1%})  {result['us']:6.2f} us/step"
+        )
+
+    processors = build(
+        (Credential, Server, Processor, QueryFlowSequenceProcessor),
+        args.count,
+        frozen=True,
+    )
+    start = time.perf_counter()
+    unique = set(processors)
+    elapsed = time.perf_counter() - start
+    print(
+        f"deduplicated {len(processors)} frozen steps into {len(unique)}"
+        f" in {elapsed * 1000:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
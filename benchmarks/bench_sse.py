@@ -0,0 +1,75 @@
+"""Measure SSEDecoder throughput on multi-megabyte event streams.
+
+Run from the repository root:
+
+    PYTHONPATH=src python benchmarks/bench_sse.py
+"""
+
+import argparse
+import json
+import time
+
+from sandbox.discovery_sandbox import SSEDecoder
+
+
+def token_stream(size: int) -> bytes:
+    """Return a stream of small LLM token events of roughly the given size."""
+    events = []
+    total = 0
+    index = 0
+    while total < size:
+        event = (
+            "data: "
+            + json.dumps({"choices": [{"delta": {"content": f" token{index}:"}}]})
+            + "\n\n"
+        ).encode()
+        events.append(event)
+        total += len(event)
+        index += 1
+    return b"".join(events)
+
+
+def large_event_stream(size: int) -> bytes:
+    """Return a single event made of many data lines of roughly the given size."""
+    line = b"data: " + b"x" * 74 + b"\n"
+    return line * (size // len(line)) + b"\n"
+
+
+def chunked(stream: bytes, chunk_size: int) -> list[bytes]:
+    """Split the stream the way a network read would."""
+    return [stream[i : i + chunk_size] for i in range(0, len(stream), chunk_size)]
+
+
+def decode(chunks: list[bytes]) -> int:
+    """Decode every chunk and return the number of events."""
+    decoder = SSEDecoder()
+    count = 0
+    for chunk in chunks:
+        count += len(decoder.feed(chunk))
+    return count + len(decoder.close())
+
+
+def main():
+    """Decode each stream shape and report throughput."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megabytes", type=int, default=16)
+    parser.add_argument("--chunk-size", type=int, default=4096)
+    args = parser.parse_args()
+
+    size = args.megabytes * 1024 * 1024
+    for name, stream in (
+        ("token events", token_stream(size)),
+        ("one large event", large_event_stream(size)),
+    ):
+        chunks = chunked(stream, args.chunk_size)
+        start = time.perf_counter()
+        events = decode(chunks)
+        seconds = time.perf_counter() - start
+        print(
+            f"{name:<16} {len(stream) / 1e6:7.1f} MB  {events:>8} events"
+            f"  {seconds:6.3f} s  {len(stream) / 1e6 / seconds:7.1f} MB/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Compare per-request latency of one-shot ``httpx.post`` calls and the pooled client.
+
+Run from the repository root:
+
+    PYTHONPATH=src python benchmarks/bench_transport.py
+"""
+
+import argparse
+import statistics
+import time
+
+import httpx
+
+from sandbox.discovery_sandbox import QueryFlowClient
+from standin import StandInServer
+
+
+def one_shot(url: str, api_key: str, requests: int) -> list[float]:
+    """Send requests through module-level ``httpx.post`` (no connection reuse)."""
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        httpx.post(
+            url=url + QueryFlowClient.SANDBOX_PATH + "processor",
+            json={"text": "hello"},
+            headers={"x-api-key": api_key},
+            timeout=None,
+        ).raise_for_status().json()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def pooled(url: str, api_key: str, requests: int) -> list[float]:
+    """Send requests through a QueryFlowClient that keeps connections alive."""
+    latencies = []
+    with QueryFlowClient(url, api_key) as client:
+        for _ in range(requests):
+            start = time.perf_counter()
+            client.text_to_text("processor", {"text": "hello"})
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(name: str, latencies: list[float]) -> None:
+    """Print latency percentiles in milliseconds."""
+    ordered = sorted(latencies)
+    p99 = ordered[int(len(ordered) * 0.99) - 1]
+    print(
+        f"{name:<10} mean {statistics.mean(ordered) * 1000:7.3f} ms"
+        f"  p50 {statistics.median(ordered) * 1000:7.3f} ms"
+        f"  p99 {p99 * 1000:7.3f} ms"
+    )
+
+
+def main():
+    """Run both transports against a local stand-in server."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    with StandInServer() as server:
+        # Warm up both paths so imports and thread start-up are not measured.
+        one_shot(server.url, "key", 10)
+        pooled(server.url, "key", 10)
+        report("one-shot", one_shot(server.url, "key", args.requests))
+        report("pooled", pooled(server.url, "key", args.requests))
+
+
+if __name__ == "__main__":
+    main()
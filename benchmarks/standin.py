@@ -0,0 +1,201 @@
+"""Local stand-in for the QueryFlow ``/v2/sandbox/`` API used by the benchmarks."""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _SandboxHandler(BaseHTTPRequestHandler):
+    """Answer sandbox requests the way the server's configuration asks."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        """Read the request body and reply with JSON, an event stream or an error."""
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        standin = self.server.standin
+        status = standin._next_status()
+        try:
+            standin._wait()
+            if status != 200:
+                self._send_error(status)
+            elif "text/event-stream" in self.headers.get("Accept", ""):
+                self._send_stream(standin)
+            else:
+                self._send_body(200, standin._body, "application/json")
+        finally:
+            standin._finish()
+
+    def _send_body(self, status: int, body: bytes, content_type: str, headers=()):
+        """Send a complete response."""
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int):
+        """Send an injected error response."""
+        body = json.dumps({"status": status, "error": "injected"}).encode()
+        headers = [("Retry-After", "0")] if status in (429, 503) else []
+        self._send_body(status, body, "application/json", headers)
+
+    def _send_stream(self, standin: "StandInServer"):
+        """Send the configured events as a chunked ``text/event-stream`` response."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for index in range(standin.events):
+            if index and standin.event_interval:
+                time.sleep(standin.event_interval)
+            self._write_chunk(standin._event)
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data: bytes):
+        """Write one chunk of a chunked response, an empty one ends the body."""
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        """Silence the per-request access log."""
+
+
+class _StandInHTTPServer(ThreadingHTTPServer):
+    """A threading HTTP server whose listen backlog fits concurrent benchmarks.
+
+    The default backlog of 5 resets or delays connections as soon as more clients
+    connect at once, which would measure the server instead of the client.
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class StandInServer:
+    """A threaded local HTTP server that mimics the QueryFlow sandbox API.
+
+    Requests that accept ``text/event-stream`` receive a stream of events, and every
+    other request receives a JSON document. Latency, payload sizes and failures are
+    configurable so benchmarks can reproduce the shape of real traffic offline.
+
+    Attributes:
+        url (str): The base url the server is listening on.
+        latency (float): Seconds to wait before answering each request.
+        jitter (float): Maximum random seconds added to the latency.
+        events (int): Number of events sent to streaming requests.
+        event_interval (float): Seconds between consecutive stream events.
+        error_rate (float): Fraction of requests answered with ``error_status``.
+        error_status (int): Status code of injected errors.
+        capacity (int): Requests handled at once, or None for no limit.
+        requests (int): Number of requests received.
+        errors (int): Number of injected errors.
+        rejected (int): Number of requests answered with 429 for exceeding capacity.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        payload_size: int = 0,
+        events: int = 10,
+        event_interval: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        capacity: int | None = None,
+        seed: int | None = None,
+        backlog: int = 128,
+    ):
+        """Bind the server to the given host and port.
+
+        Args:
+            host (str): The interface to listen on.
+            port (int): The port to listen on, 0 picks a free port.
+            latency (float): Seconds to wait before answering each request.
+            jitter (float): Maximum random seconds added to the latency.
+            payload_size (int): Approximate size in bytes of each JSON response and
+                stream event, 0 for a minimal document.
+            events (int): Number of events sent to streaming requests.
+            event_interval (float): Seconds between consecutive stream events.
+            error_rate (float): Fraction of requests answered with ``error_status``.
+            error_status (int): Status code of injected errors.
+            capacity (int): Requests handled at once, further requests are answered
+                with 429 like an upstream that is over its rate limit. None for no
+                limit.
+            seed (int): Seed of the random jitter and error injection.
+            backlog (int): Connections the listening socket queues before they are
+                accepted, at least the number of concurrent clients.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.events = events
+        self.event_interval = event_interval
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.capacity = capacity
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self._in_flight = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        filler = "x" * max(0, payload_size - 32)
+        self._body = json.dumps({"status": "ok", "data": filler}).encode()
+        self._event = (
+            b"data: " + json.dumps({"token": "ok", "data": filler}).encode() + b"\n\n"
+        )
+        self._server = _StandInHTTPServer(
+            (host, port), _SandboxHandler, bind_and_activate=False
+        )
+        self._server.request_queue_size = backlog
+        try:
+            self._server.server_bind()
+            self._server.server_activate()
+        except BaseException:
+            self._server.server_close()
+            raise
+        self._server.standin = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self.url = "http://%s:%d" % self._server.server_address[:2]
+
+    def __enter__(self):
+        """Start serving in a background thread."""
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        """Stop the server and release the socket."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _next_status(self):
+        """Count a request and return the status it should be answered with."""
+        with self._lock:
+            self.requests += 1
+            self._in_flight += 1
+            if self.capacity is not None and self._in_flight > self.capacity:
+                self.rejected += 1
+                return 429
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.errors += 1
+                return self.error_status
+            return 200
+
+    def _finish(self):
+        """Count a request as answered."""
+        with self._lock:
+            self._in_flight -= 1
+
+    def _wait(self):
+        """Sleep for the configured latency and jitter."""
+        with self._lock:
+            delay = self.latency + (self._random.random() * self.jitter)
+        if delay:
+            time.sleep(delay)
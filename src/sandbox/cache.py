@@ -0,0 +1,278 @@
+"""Response caching and request coalescing for the Sandbox SDK."""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable, Iterable
+from concurrent.futures import Future
+
+
+class ResponseCache:
+    """An in-process LRU cache of sandbox responses with optional expiration.
+
+    Entries are keyed by ``(processor_key, input_key)``, where the processor key is a
+    stable hash of the serialized processor (or the UUID of an existing processor) and
+    the input key is a hash of the serialized input. The cache is safe to share across
+    threads and clients.
+
+    Attributes:
+        maxsize (int): Maximum number of cached responses.
+        ttl (float): Seconds a response stays valid, or None to keep it until evicted.
+        processor_types (frozenset[str]): Processor types whose responses are cached,
+            or None to cache every processor type.
+        processor_ids (frozenset[str]): UUIDs of existing processors whose responses
+            are cached, or None to cache every processor ID.
+        hits (int): Number of lookups answered from the cache.
+        misses (int): Number of lookups that were not in the cache.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float | None = None,
+        processor_types: Iterable[str] | None = None,
+        processor_ids: Iterable[str] | None = None,
+    ):
+        """Initialize the ResponseCache with size, expiration and opt-in filters.
+
+        Args:
+            maxsize (int): Maximum number of cached responses.
+            ttl (float): Seconds a response stays valid, or None to keep it until evicted.
+            processor_types (Iterable[str]): Processor types whose responses are cached,
+                or None to cache every processor type.
+            processor_ids (Iterable[str]): UUIDs of existing processors whose responses
+                are cached, or None to cache every processor ID.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.processor_types = (
+            frozenset(processor_types) if processor_types is not None else None
+        )
+        self.processor_ids = (
+            frozenset(processor_ids) if processor_ids is not None else None
+        )
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return the number of cached responses, including expired ones not yet evicted."""
+        return len(self._entries)
+
+    def accepts(self, processor_type: str | None, processor_id: str | None):
+        """Return whether responses of the given processor should be cached.
+
+        Args:
+            processor_type (str): The type of a Processor entity, or None.
+            processor_id (str): The UUID of an existing processor, or None.
+
+        Returns:
+            bool: Whether the processor opted in to caching.
+        """
+        if processor_id is not None:
+            return self.processor_ids is None or processor_id in self.processor_ids
+        return self.processor_types is None or processor_type in self.processor_types
+
+    def get(self, key: tuple[str, str], default=None):
+        """Return a cached response and mark it as recently used.
+
+        Args:
+            key (tuple[str, str]): The ``(processor_key, input_key)`` of the request.
+            default: The value to return if the response is not cached.
+
+        Returns:
+            The cached response, or ``default`` if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires is None or expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: tuple[str, str], value):
+        """Cache a response, evicting the least recently used one if the cache is full.
+
+        Args:
+            key (tuple[str, str]): The ``(processor_key, input_key)`` of the request.
+            value: The response to cache.
+        """
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, processor_key: str | None = None, input_key: str | None = None):
+        """Remove cached responses.
+
+        Args:
+            processor_key (str): Only remove responses of this processor, or None for all.
+            input_key (str): Only remove responses for this input, or None for all.
+
+        Returns:
+            int: The number of removed responses.
+        """
+        with self._lock:
+            if processor_key is None and input_key is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                return removed
+            keys = [
+                key
+                for key in self._entries
+                if (processor_key is None or key[0] == processor_key)
+                and (input_key is None or key[1] == input_key)
+            ]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self):
+        """Remove every cached response and reset the hit and miss counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class SingleFlight:
+    """Coalesces identical concurrent calls so only one of them is executed.
+
+    While a call with a given key is in flight, later calls with the same key wait
+    for its outcome instead of executing again. Safe to use from multiple threads.
+
+    Attributes:
+        calls (int): Number of calls that were executed.
+        coalesced (int): Number of calls that waited on an identical call in flight.
+    """
+
+    def __init__(self):
+        """Initialize the SingleFlight with no calls in flight."""
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def do(
+        self,
+        key: Hashable,
+        function: Callable[[], object],
+        timeout: float | None = None,
+        share: bool = True,
+    ):
+        """Execute the function, or wait for the identical call already in flight.
+
+        Args:
+            key (Hashable): Identifies identical calls.
+            function (Callable[[], object]): The call to execute.
+            timeout (float): Seconds to wait for an identical call in flight, or None
+                to wait until it completes. The call executed by this caller is not
+                bounded by it.
+            share (bool): Whether later identical calls may wait for the call when
+                this caller executes it. Calls bounded by a caller's own deadline
+                are not shared, so other callers do not inherit that deadline.
+
+        Returns:
+            The return value of the call.
+
+        Raises:
+            Exception: The exception raised by the call.
+            TimeoutError: If the timeout passes while waiting for the identical call
+                in flight, which keeps running for its other callers.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if not leader:
+                self.coalesced += 1
+            else:
+                self.calls += 1
+                if share:
+                    future = self._in_flight[key] = Future()
+        if not leader:
+            return future.result(timeout)
+        if future is None:
+            return function()
+        try:
+            result = function()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+
+class AsyncSingleFlight:
+    """Coalesces identical concurrent coroutine calls within one event loop.
+
+    The call runs as its own task, which every caller awaits through
+    ``asyncio.shield``. A caller that is cancelled, for example by its deadline,
+    stops waiting without cancelling the call for the other callers. The call is
+    only cancelled once every caller has stopped waiting for it.
+
+    Attributes:
+        calls (int): Number of calls that were executed.
+        coalesced (int): Number of calls that waited on an identical call in flight.
+    """
+
+    def __init__(self):
+        """Initialize the AsyncSingleFlight with no calls in flight."""
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight = {}
+
+    async def do(
+        self, key: Hashable, function: Callable[[], Awaitable], share: bool = True
+    ):
+        """Await the function, or wait for the identical call already in flight.
+
+        Args:
+            key (Hashable): Identifies identical calls.
+            function (Callable[[], Awaitable]): Returns the awaitable call to execute.
+            share (bool): Whether later identical calls may wait for the call when
+                this caller executes it.
+
+        Returns:
+            The result of the call.
+
+        Raises:
+            Exception: The exception raised by the call.
+        """
+        entry = self._in_flight.get(key)
+        if entry is None and not share:
+            self.calls += 1
+            return await function()
+        if entry is None:
+            task = asyncio.ensure_future(function())
+            entry = self._in_flight[key] = [task, 0]
+            task.add_done_callback(lambda _: self._forget(key, task))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            entry[1] -= 1
+            if not entry[1] and not task.done():
+                task.cancel()
+
+    def _forget(self, key: Hashable, task: asyncio.Future):
+        """Remove the finished call, unless a newer call with the key replaced it."""
+        entry = self._in_flight.get(key)
+        if entry is not None and entry[0] is task:
+            del self._in_flight[key]
@@ -2,13 +2,457 @@
 
 import sys
 import json
+import asyncio
+import base64
+import contextvars
+import hashlib
+import queue
+import re
+import threading
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    FIRST_EXCEPTION,
+    ThreadPoolExecutor,
+    wait,
+)
+from array import array
+from collections.abc import Awaitable, Callable, Iterable
 
 import httpx
 from httpx import HTTPStatusError
 from multimethod import multimethod
 
+from sandbox.cache import AsyncSingleFlight, ResponseCache, SingleFlight
+from sandbox.observers import RequestEvent, RequestTrace, current_stage, stage
+from sandbox.resilience import (
+    AdaptiveConcurrency,
+    CircuitBreaker,
+    DeadlineExceeded,
+    HedgingPolicy,
+    RateLimiter,
+    RetryPolicy,
+)
 
-class Credential:
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the installed extras
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover - depends on the installed extras
+    msgspec = None
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - depends on the installed extras
+    numpy = None
+
+
+_set_slot = object.__setattr__
+
+
+def _to_plain(value):
+    """Return a copy of a field value with entities converted to dictionaries."""
+    if isinstance(value, _Entity):
+        return value.to_dict()
+    if isinstance(value, dict):
+        return {key: _to_plain(item) for key, item in value.items()}
+    if isinstance(value, list | tuple):
+        return [_to_plain(item) for item in value]
+    return value
+
+
+class _FrozenDict(dict):
+    """A dictionary that rejects modifications, used for the fields of frozen entities.
+
+    It is a ``dict`` subclass, so every codec serializes it like a dictionary.
+    """
+
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwargs):
+        """Reject the modification.
+
+        Raises:
+            TypeError: Always.
+        """
+        raise TypeError("the dictionaries of a frozen entity cannot be modified")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        """Return the constructor arguments that recreate the dictionary."""
+        return type(self), (dict(self),)
+
+
+def _freeze_value(value):
+    """Return an immutable copy of a field value, freezing the entities it holds.
+
+    Values that are already read-only are returned as they are, so frozen entities
+    can share them.
+    """
+    if isinstance(value, _Entity):
+        return value.freeze()
+    if isinstance(value, _FrozenDict):
+        return value
+    if isinstance(value, dict):
+        return _FrozenDict((key, _freeze_value(item)) for key, item in value.items())
+    if isinstance(value, list | tuple):
+        items = tuple(_freeze_value(item) for item in value)
+        if isinstance(value, tuple) and all(
+            item is original for item, original in zip(items, value)
+        ):
+            return value
+        return items
+    return value
+
+
+class _FrozenEntity:
+    """Mixin of the frozen variant of every entity type, which rejects assignments.
+
+    Freezing an entity switches it to this variant of its type, so mutable entities
+    keep the default attribute assignment and are as fast to build as plain objects.
+    """
+
+    __slots__ = ()
+    _frozen = True
+
+    def __setattr__(self, name, value):
+        """Set a private attribute.
+
+        Raises:
+            AttributeError: If a public attribute is assigned.
+        """
+        if not name.startswith("_"):
+            raise AttributeError(
+                f"cannot assign to field {name!r} of a frozen {type(self).__name__}"
+            )
+        _set_slot(self, name, value)
+
+    def __delattr__(self, name):
+        """Reject the deletion.
+
+        Raises:
+            AttributeError: Always.
+        """
+        raise AttributeError(
+            f"cannot delete field {name!r} of a frozen {type(self).__name__}"
+        )
+
+
+class _Entity:
+    """Base class for the value types that describe sandbox requests.
+
+    Entities are slotted, so they have no instance dictionary and their fields are
+    listed in ``_fields``. Subclasses assign their fields in ``__init__`` and freeze
+    the entity when it is created with ``frozen=True``.
+
+    Entities compare equal when their fields are equal. Frozen entities reject
+    assignments, also to the dictionaries and lists they hold, and are hashable by
+    content, so they can be used as cache keys, deduplicated in sets and shared
+    between threads. Only frozen entities cache their serialized payload and content
+    hash, in the slots listed in ``_caches``, since nothing can change them. Freezing
+    an entity also freezes the entities it references.
+    """
+
+    __slots__ = ("_hash",)
+    _fields = ()
+    _caches = ("_hash",)
+    _frozen = False
+
+    def __init_subclass__(cls, **kwargs):
+        """Create the frozen variant of the entity type, with the same name."""
+        super().__init_subclass__(**kwargs)
+        if issubclass(cls, _FrozenEntity):
+            return
+        cls._type = cls
+        cls._frozen_type = type(
+            cls.__name__,
+            (_FrozenEntity, cls),
+            {
+                "__slots__": (),
+                "__module__": cls.__module__,
+                "__qualname__": cls.__qualname__,
+            },
+        )
+
+    def __reduce__(self):
+        """Return the constructor arguments that recreate the entity when unpickled."""
+        values = tuple(getattr(self, name) for name in self._fields)
+        return self._type, values + (self._frozen,)
+
+    def __eq__(self, other):
+        """Return whether the other object is an entity of this type and value.
+
+        Lists and the tuples of frozen entities compare equal when their items are.
+        """
+        if self is other:
+            return True
+        if not isinstance(other, _Entity) or self._type is not other._type:
+            return NotImplemented
+        return all(
+            _to_plain(getattr(self, name)) == _to_plain(getattr(other, name))
+            for name in self._fields
+        )
+
+    def __hash__(self):
+        """Return the hash of the content of a frozen entity.
+
+        Raises:
+            TypeError: If the entity is not frozen.
+        """
+        if not self._frozen:
+            raise TypeError(
+                f"unhashable type: {type(self).__name__!r} is not frozen, create it "
+                "with frozen=True"
+            )
+        return hash(self.content_hash())
+
+    def __repr__(self):
+        """Return the fields of the entity."""
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self._fields)
+        return f"{type(self).__name__}({fields})"
+
+    @property
+    def frozen(self):
+        """bool: Whether the entity rejects assignments to its fields."""
+        return self._frozen
+
+    def freeze(self):
+        """Make the entity and every entity it references immutable.
+
+        Dictionaries and lists in the fields are replaced by read-only copies, so
+        lists are stored as tuples.
+
+        Returns:
+            _Entity: The entity itself.
+        """
+        if not self._frozen:
+            for name in self._fields:
+                setattr(self, name, _freeze_value(getattr(self, name)))
+            for name in self._caches:
+                setattr(self, name, None)
+            self.__class__ = self._frozen_type
+        return self
+
+    def to_dict(self):
+        """Return the fields of the entity as a dictionary.
+
+        Referenced entities are converted too, so the result only contains plain
+        values and is a copy that can be modified freely.
+
+        Returns:
+            dict: The fields of the entity, by name.
+        """
+        return {name: _to_plain(getattr(self, name)) for name in self._fields}
+
+    def content_hash(self):
+        """Return a stable hash of the content of the entity.
+
+        The hash is the BLAKE2b digest of the JSON of the entity with sorted keys,
+        encoded with the json built-in module, so it is the same across processes,
+        runs and codecs. It is only cached for frozen entities.
+
+        Returns:
+            str: The hexadecimal digest.
+
+        Raises:
+            TypeError: If a field holds a value that cannot be serialized to JSON.
+        """
+        if self._frozen and self._hash is not None:
+            return self._hash
+        data = _CANONICAL_ENCODER.encode(self).encode()
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        if self._frozen:
+            self._hash = digest
+        return digest
+
+
+def _encode_entity(entity: _Entity):
+    """Return the public attributes of an entity for JSON serialization.
+
+    Embedding vectors decoded as ``array('f')`` or NumPy arrays are encoded as lists
+    of floats, so they can be sent back in the input or config of a processor.
+
+    Args:
+        entity (_Entity): The entity to encode.
+
+    Returns:
+        dict: The entity attributes, without private bookkeeping fields.
+
+    Raises:
+        TypeError: If the object is not an entity or a vector.
+    """
+    if isinstance(entity, array) or (
+        numpy is not None and isinstance(entity, numpy.ndarray)
+    ):
+        return entity.tolist()
+    if not isinstance(entity, _Entity):
+        raise TypeError(
+            f"Object of type {type(entity).__name__} is not JSON serializable"
+        )
+    return {name: getattr(entity, name) for name in entity._fields}
+
+
+_CANONICAL_ENCODER = json.JSONEncoder(
+    default=_encode_entity, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+)
+
+
+class JSONCodec:
+    """Encodes request bodies and decodes response bodies using the json built-in module.
+
+    Subclasses provide faster backends. Every codec encodes entities through
+    ``_encode_entity`` and produces compact UTF-8 JSON.
+
+    Attributes:
+        name (str): The name of the backend.
+    """
+
+    name = "json"
+
+    def encode(self, obj) -> bytes:
+        """Serialize an object into JSON.
+
+        Args:
+            obj: The object to serialize, which may contain entities.
+
+        Returns:
+            bytes: The UTF-8 encoded JSON document.
+        """
+        return json.dumps(
+            obj, default=_encode_entity, separators=(",", ":"), ensure_ascii=False
+        ).encode()
+
+    def decode(self, data: bytes):
+        """Deserialize a JSON document.
+
+        Args:
+            data (bytes): The UTF-8 encoded JSON document.
+
+        Returns:
+            The deserialized object.
+        """
+        return json.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    """JSON codec backed by the optional ``orjson`` package."""
+
+    name = "orjson"
+
+    def __init__(self):
+        """Initialize the codec.
+
+        Raises:
+            ImportError: If ``orjson`` is not installed.
+        """
+        if orjson is None:
+            raise ImportError("The orjson codec requires the 'orjson' package")
+
+    def encode(self, obj) -> bytes:
+        """Serialize an object into JSON."""
+        return orjson.dumps(
+            obj, default=_encode_entity, option=orjson.OPT_NON_STR_KEYS
+        )
+
+    def decode(self, data: bytes):
+        """Deserialize a JSON document."""
+        return orjson.loads(data)
+
+
+class MsgspecCodec(JSONCodec):
+    """JSON codec backed by the optional ``msgspec`` package."""
+
+    name = "msgspec"
+
+    def __init__(self):
+        """Initialize the codec.
+
+        Raises:
+            ImportError: If ``msgspec`` is not installed.
+        """
+        if msgspec is None:
+            raise ImportError("The msgspec codec requires the 'msgspec' package")
+        self._encoder = msgspec.json.Encoder(enc_hook=_encode_entity)
+        self._decoder = msgspec.json.Decoder()
+
+    def encode(self, obj) -> bytes:
+        """Serialize an object into JSON."""
+        return self._encoder.encode(obj)
+
+    def decode(self, data: bytes):
+        """Deserialize a JSON document."""
+        return self._decoder.decode(data)
+
+
+def default_codec() -> JSONCodec:
+    """Return the fastest available JSON codec.
+
+    Returns:
+        JSONCodec: An ``orjson`` or ``msgspec`` codec if installed, otherwise the
+        json built-in module codec.
+    """
+    if orjson is not None:
+        return OrjsonCodec()
+    if msgspec is not None:
+        return MsgspecCodec()
+    return JSONCodec()
+
+
+EMBEDDING_FORMATS = ("list", "array", "numpy")
+
+
+def _unpack_embedding(embedding: list | str, format: str):
+    """Return an embedding vector in the requested format.
+
+    Args:
+        embedding (list | str): The vector as a list of floats, or as base64 encoded
+            little-endian float32 values.
+        format (str): One of ``EMBEDDING_FORMATS``.
+
+    Returns:
+        list[float] | array | numpy.ndarray: The vector.
+    """
+    if isinstance(embedding, str):
+        data = base64.b64decode(embedding)
+        if format == "numpy":
+            return numpy.frombuffer(data, dtype="<f4").astype(numpy.float32)
+        vector = array("f")
+        vector.frombytes(data)
+        if sys.byteorder == "big":
+            vector.byteswap()
+        return vector if format == "array" else vector.tolist()
+    if format == "array":
+        return array("f", embedding)
+    if format == "numpy":
+        return numpy.asarray(embedding, dtype=numpy.float32)
+    return embedding
+
+
+def _decode_embeddings(body, format: str):
+    """Convert the vectors of an embeddings response in place.
+
+    Args:
+        body: The decoded response body. Bodies without an ``embeddings`` list are
+            left unchanged.
+        format (str): One of ``EMBEDDING_FORMATS``.
+
+    Returns:
+        The response body.
+    """
+    embeddings = body.get("embeddings") if isinstance(body, dict) else None
+    if isinstance(embeddings, list):
+        for item in embeddings:
+            if isinstance(item, dict) and "embedding" in item:
+                item["embedding"] = _unpack_embedding(item["embedding"], format)
+    return body
+
+
+class Credential(_Entity):
     """Credential to authenticate requests to a Server.
 
     Attributes:
@@ -16,18 +460,28 @@ class Credential:
         secret (dict): Dictionary containing the secret data.
     """
 
-    def __init__(self, type: str, secret: dict):
+    __slots__ = ("type", "secret")
+    _fields = __slots__
+
+    def __init__(self, type: str, secret: dict, frozen: bool = False):
         """Initialize the Credential with type and secret.
 
         Args:
             type (str): The credential type.
             secret (dict): Dictionary containing the secret data.
+            frozen (bool): Whether the credential is immutable and hashable.
         """
         self.type = type
         self.secret = secret
+        if frozen:
+            self.freeze()
+
+    def __repr__(self):
+        """Return the fields of the credential, hiding the secret."""
+        return f"Credential(type={self.type!r}, secret=...)"
 
 
-class Server:
+class Server(_Entity):
     """Remote server with its connection details.
 
     Attributes:
@@ -36,20 +490,34 @@ class Server:
         credential (Credential): Credential object for authentication.
     """
 
-    def __init__(self, type: str, config: dict, credential: Credential = None):
+    __slots__ = ("type", "config", "credential", "_payload")
+    _fields = __slots__[:3]
+    _caches = _Entity._caches + ("_payload",)
+
+    def __init__(
+        self,
+        type: str,
+        config: dict,
+        credential: Credential = None,
+        frozen: bool = False,
+    ):
         """Initialize the Server with type, config and credential.
 
         Args:
             type (str): The server type.
             config (dict): Dictionary containing the configuration for the server.
             credential (Credential): Credential object for authentication.
+            frozen (bool): Whether the server and its credential are immutable and
+                hashable.
         """
         self.type = type
         self.config = config
         self.credential = credential
+        if frozen:
+            self.freeze()
 
 
-class Processor:
+class Processor(_Entity):
     """A processor to be executed.
 
     Attributes:
@@ -58,232 +526,2383 @@ class Processor:
         server (Server): The server to be used during processor execution.
     """
 
-    def __init__(self, type: str, config: dict, server: Server = None):
+    __slots__ = ("type", "config", "server", "_payload")
+    _fields = __slots__[:3]
+    _caches = _Entity._caches + ("_payload",)
+
+    def __init__(
+        self, type: str, config: dict, server: Server = None, frozen: bool = False
+    ):
         """Initialize the Processor with type, config and server.
 
         Args:
             type (str): The processor type.
             config (dict): Dictionary containing the configuration for the processor.
             server (Server): The server to be used during processor execution.
+            frozen (bool): Whether the processor and its server are immutable and
+                hashable.
         """
         self.type = type
         self.config = config
         self.server = server
+        if frozen:
+            self.freeze()
 
 
-class QueryFlowSequenceProcessor:
+class QueryFlowSequenceProcessor(_Entity):
     """A processor to be executed as part of a QueryFlowSequence.
 
     Attributes:
         processor (str | Processor): A Processor entity or UUID of an existing processor to execute.
         timeout (str):  The timeout parameter for the processor execution, in ISO 8601 format.
+        concurrency (int): Number of inputs this processor handles at once in
+            ``execute_many``, or None to use the client default.
+        name (str): The stage name reported to observers, or None to use the
+            position of the step in its sequence.
     """
 
-    def __init__(self, processor: str | Processor, timeout: str = None):
-        """Initialize the QueryFlowSequenceProcessor with processor and timeout.
+    __slots__ = ("processor", "timeout", "concurrency", "name")
+    _fields = __slots__
+
+    def __init__(
+        self,
+        processor: str | Processor,
+        timeout: str = None,
+        concurrency: int | None = None,
+        name: str | None = None,
+        frozen: bool = False,
+    ):
+        """Initialize the QueryFlowSequenceProcessor with processor, timeout and concurrency.
 
         Args:
             processor (str | Processor): A Processor entity or UUID of an existing processor to execute.
             timeout (str):  The timeout parameter for the processor execution, in ISO 8601 format.
+            concurrency (int): Number of inputs this processor handles at once in
+                ``execute_many``, or None to use the client default.
+            name (str): The stage name reported to observers, or None to use the
+                position of the step in its sequence.
+            frozen (bool): Whether the step and its processor are immutable and
+                hashable.
         """
         self.processor = processor
         self.timeout = timeout
+        self.concurrency = concurrency
+        self.name = name
+        if frozen:
+            self.freeze()
 
 
-class QueryFlowSequence:
+class QueryFlowSequence(_Entity):
     """List of QueryFlow processors to be executed sequentially.
 
+    A step of the sequence can also be a QueryFlowParallel, whose branches run
+    concurrently before the sequence continues with their merged output.
+
     Attributes:
-        processors (list[QueryFlowSequenceProcessor]): The list of processors to execute.
+        processors (list[QueryFlowSequenceProcessor | QueryFlowParallel]): The list of steps to execute.
     """
 
-    def __init__(self, processors: list[QueryFlowSequenceProcessor]):
+    __slots__ = ("processors",)
+    _fields = __slots__
+
+    def __init__(
+        self,
+        processors: list["QueryFlowSequenceProcessor | QueryFlowParallel"],
+        frozen: bool = False,
+    ):
         """Initialize the QueryFlowSequence with processors.
 
         Args:
-            processors (list[QueryFlowSequenceProcessor]): The list of processors to execute.
+            processors (list[QueryFlowSequenceProcessor | QueryFlowParallel]): The list of steps to execute.
+            frozen (bool): Whether the sequence and its steps are immutable and
+                hashable. The steps of a frozen sequence are stored as a tuple.
         """
         self.processors = processors
+        if frozen:
+            self.freeze()
 
 
-class QueryFlowClient:
-    """A client class to execute QueryFlow requests.
+def _merge_outputs(outputs: dict[str, dict]):
+    """Return the outputs of the branches keyed by branch name."""
+    return outputs
+
+
+class QueryFlowParallel(_Entity):
+    """A step of a QueryFlowSequence that runs several branches concurrently.
+
+    Every branch receives the input of the step, and the merge function combines
+    the outputs of all branches into the input of the next step. A branch can be an
+    empty QueryFlowSequence to pass the input of the step through to the merge.
+
+    The merge function is not a field: it is left out of ``to_dict``, the
+    serialized step and the content hash, and steps only compare equal when they
+    use the same merge function.
 
     Attributes:
-        url (str): The base url for the request.
-        api_key (str): The api key to use in the request.
-        SANDBOX_PATH (str): The api path to use in the request.
+        branches (dict[str, QueryFlowSequence]): The branches to run, by name.
+        merge (Callable[[dict[str, dict]], dict]): Combines the outputs of the
+            branches, keyed by branch name, into the output of the step.
+        concurrency (int): Number of inputs this step handles at once in
+            ``execute_many``, or None to use the client default.
+        name (str): The stage name reported to observers, or None to use the
+            position of the step in its sequence. Steps of a branch are reported
+            as ``<step>.<branch>.<inner step>``.
     """
 
-    SANDBOX_PATH = "/v2/sandbox/"
+    __slots__ = ("branches", "concurrency", "name", "merge")
+    _fields = __slots__[:3]
 
-    def __init__(self, url: str, api_key: str):
-        """Initialize the client with url and api key.
+    def __init__(
+        self,
+        branches: dict[
+            str, "QueryFlowSequence | QueryFlowSequenceProcessor | QueryFlowParallel"
+        ],
+        merge: Callable[[dict[str, dict]], dict] = _merge_outputs,
+        concurrency: int | None = None,
+        name: str | None = None,
+        frozen: bool = False,
+    ):
+        """Initialize the QueryFlowParallel with branches, merge function and concurrency.
 
         Args:
-            url (str): The base url for the request.
-            api_key (str): The api key to use in the request.
+            branches (dict[str, QueryFlowSequence | QueryFlowSequenceProcessor | QueryFlowParallel]):
+                The branches to run, by name. Single steps are wrapped in a sequence.
+            merge (Callable[[dict[str, dict]], dict]): Combines the outputs of the
+                branches, keyed by branch name, into the output of the step. By
+                default the output is the dictionary of branch outputs itself.
+            concurrency (int): Number of inputs this step handles at once in
+                ``execute_many``, or None to use the client default.
+            name (str): The stage name reported to observers, or None to use the
+                position of the step in its sequence.
+            frozen (bool): Whether the step and its branches are immutable and
+                hashable.
         """
-        self.url = url
-        self.api_key = api_key
+        self.branches = {
+            name: (
+                branch
+                if isinstance(branch, QueryFlowSequence)
+                else QueryFlowSequence([branch])
+            )
+            for name, branch in branches.items()
+        }
+        self.merge = merge
+        self.concurrency = concurrency
+        self.name = name
+        if frozen:
+            self.freeze()
 
-    @multimethod
-    def text_to_text(
-        self, processor: Processor, input: dict, timeout: str | None = None
+    def __reduce__(self):
+        """Return the constructor arguments that recreate the step when unpickled."""
+        return self._type, (
+            self.branches,
+            self.merge,
+            self.concurrency,
+            self.name,
+            self._frozen,
+        )
+
+    def __eq__(self, other):
+        """Return whether the other step has equal fields and merge function."""
+        equal = super().__eq__(other)
+        if equal is True:
+            return self.merge is other.merge
+        return equal
+
+    __hash__ = _Entity.__hash__
+
+
+class BatchResult:
+    """The outcome of executing one input of a batch.
+
+    Attributes:
+        index (int): The position of the input in the batch.
+        input (dict): The input sent to the processor.
+        output (dict): The response data, or None if the execution failed.
+        error (Exception): The exception raised by the execution, or None if it succeeded.
+    """
+
+    def __init__(
+        self,
+        index: int,
+        input: dict,
+        output: dict | None = None,
+        error: Exception | None = None,
     ):
-        """Execute a processor with the given input.
+        """Initialize the BatchResult with index, input, output and error.
 
         Args:
-            processor (Processor): The processor to execute.
-            input (dict): The input to send to the processor.
-            timeout (str): The timeout parameter for the request, in ISO 8601 format.
+            index (int): The position of the input in the batch.
+            input (dict): The input sent to the processor.
+            output (dict): The response data, or None if the execution failed.
+            error (Exception): The exception raised by the execution, or None if it succeeded.
+        """
+        self.index = index
+        self.input = input
+        self.output = output
+        self.error = error
 
-        Returns:
-            dict: The response data from the request.
+    @property
+    def ok(self):
+        """bool: Whether the execution succeeded."""
+        return self.error is None
+
+
+class ServerSentEvent:
+    """An event received from a ``text/event-stream`` response.
+
+    Attributes:
+        event (str): The event type, ``message`` unless the server sets one.
+        data (str): The event data, with multiple data lines joined by newlines.
+        id (str): The last event ID set by the stream, if any.
+        retry (int): The reconnection time in milliseconds set by the stream, if any.
+    """
+
+    def __init__(
+        self,
+        data: str,
+        event: str = "message",
+        id: str | None = None,
+        retry: int | None = None,
+    ):
+        """Initialize the ServerSentEvent with data, event, id and retry.
+
+        Args:
+            data (str): The event data.
+            event (str): The event type.
+            id (str): The last event ID set by the stream.
+            retry (int): The reconnection time in milliseconds set by the stream.
         """
-        request_data = json.dumps(
-            {
-                "processor": processor,
-                "input": input,
-            },
-            default=vars,
-        )
+        self.data = data
+        self.event = event
+        self.id = id
+        self.retry = retry
 
-        response = httpx.post(
-            url=self.url + self.SANDBOX_PATH,
-            params={"timeout": timeout} if timeout is not None else {},
-            content=request_data,
-            headers={"x-api-key": self.api_key, "Content-Type": "application/json"},
-            timeout=None,
+    def __eq__(self, other):
+        """Return whether both events have the same fields."""
+        if not isinstance(other, ServerSentEvent):
+            return NotImplemented
+        return vars(self) == vars(other)
+
+    def __repr__(self):
+        """Return a developer friendly representation of the event."""
+        return (
+            f"ServerSentEvent(data={self.data!r}, event={self.event!r}, "
+            f"id={self.id!r}, retry={self.retry!r})"
         )
 
-        if response.status_code == 204:
-            return {}
-        return response.raise_for_status().json()
 
-    @multimethod
-    def text_to_text(self, processor_id: str, input: dict, timeout: str | None = None):
-        """Execute a processor by ID with the given input.
+class SSEDecoder:
+    """Incremental decoder for ``text/event-stream`` bodies.
+
+    Bytes are fed as they arrive from the network, so events and lines may span
+    any number of chunks. Only bytes that were not scanned yet are searched for
+    line endings and data lines are joined once per event, which keeps decoding
+    linear in the size of the stream.
+    """
+
+    def __init__(self):
+        """Initialize an empty decoder."""
+        self._buffer = bytearray()
+        self._scanned = 0
+        self._started = False
+        self._pending_cr = False
+        self._data = []
+        self._event = ""
+        self._last_event_id = None
+        self._retry = None
+
+    def feed(self, chunk: bytes):
+        """Decode a chunk of the stream.
 
         Args:
-            processor_id (str): The UUID of the processor to execute.
-            input (dict): The input to send to the processor.
-            timeout (str): The timeout parameter for the request, in ISO 8601 format.
+            chunk (bytes): The next bytes received from the stream.
 
         Returns:
-            dict: The response data from the request.
+            list[ServerSentEvent]: The events completed by this chunk.
         """
-        response = httpx.post(
-            url=self.url + self.SANDBOX_PATH + processor_id,
-            params={"timeout": timeout} if timeout is not None else {},
-            json=input,
-            headers={"x-api-key": self.api_key},
-            timeout=None,
-        )
+        if not self._started and chunk:
+            self._started = True
+            if chunk.startswith(b"\xef\xbb\xbf"):
+                chunk = chunk[3:]
+        if self._pending_cr and chunk.startswith(b"\n"):
+            chunk = chunk[1:]
+        if b"\r" in chunk:
+            self._pending_cr = chunk.endswith(b"\r")
+            chunk = chunk.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+        elif chunk:
+            self._pending_cr = False
 
-        if response.status_code == 204:
-            return {}
-        return response.raise_for_status().json()
+        buffer = self._buffer
+        buffer += chunk
+        events = []
+        start = 0
+        end = buffer.find(b"\n", self._scanned)
+        while end != -1:
+            event = self._process_line(bytes(buffer[start:end]))
+            if event is not None:
+                events.append(event)
+            start = end + 1
+            end = buffer.find(b"\n", start)
+        if start:
+            del buffer[:start]
+        self._scanned = len(buffer)
+        return events
 
-    @multimethod
-    def text_to_stream(self, processor: Processor, input: dict, timeout: str = None):
-        """Execute a processor with the given input.
+    def close(self):
+        """Finish decoding at the end of the stream.
 
-        Args:
-            processor (Processor): The processor to execute.
-            input (dict): The input to send to the processor.
-            timeout (str): The timeout parameter for the request, in ISO 8601 format.
+        An event that was not terminated by a blank line is still dispatched, so
+        servers that close the stream right after the last data line lose nothing.
 
-        Yields:
-            str: Each response chunk's data field as decoded text.
+        Returns:
+            list[ServerSentEvent]: The events completed by the end of the stream.
         """
-        request_data = json.dumps(
-            {
-                "processor": processor,
-                "input": input,
-            },
-            default=vars,
+        events = []
+        if self._buffer:
+            event = self._process_line(bytes(self._buffer))
+            if event is not None:
+                events.append(event)
+            self._buffer.clear()
+            self._scanned = 0
+        event = self._dispatch()
+        if event is not None:
+            events.append(event)
+        return events
+
+    def _process_line(self, line: bytes):
+        """Apply one line of the stream and return the event it completes, if any."""
+        if not line:
+            return self._dispatch()
+        if line.startswith(b":"):
+            return None
+        field, _, value = line.partition(b":")
+        if value.startswith(b" "):
+            value = value[1:]
+        if field == b"data":
+            self._data.append(value.decode("utf-8", "replace"))
+        elif field == b"event":
+            self._event = value.decode("utf-8", "replace")
+        elif field == b"id":
+            if b"\0" not in value:
+                self._last_event_id = value.decode("utf-8", "replace")
+        elif field == b"retry":
+            if value.isdigit():
+                self._retry = int(value)
+        return None
+
+    def _dispatch(self):
+        """Return the event built from the buffered fields and reset them."""
+        if not self._data:
+            self._event = ""
+            return None
+        event = ServerSentEvent(
+            "\n".join(self._data),
+            self._event or "message",
+            self._last_event_id,
+            self._retry,
         )
+        self._data = []
+        self._event = ""
+        return event
 
-        with httpx.stream(
-            "POST",
-            url=self.url + self.SANDBOX_PATH,
-            params={"timeout": timeout} if timeout is not None else {},
-            content=request_data,
-            headers={
-                "x-api-key": self.api_key,
-                "Content-Type": "application/json",
-                "Accept": "text/event-stream",
-            },
-            timeout=None,
-        ) as response:
-            for chunk in response.iter_text():
-                yield self._parse_data(chunk)
 
-    @multimethod
-    def text_to_stream(self, processor_id: str, input: dict, timeout: str = None):
-        """Execute a processor by ID with the given input.
+def _digest(data: bytes) -> str:
+    """Return a short stable hash of the given bytes."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
 
-        Args:
-            processor_id (str): The UUID of the processor to execute.
-            input (dict): The input to send to the processor.
-            timeout (str): The timeout parameter for the request, in ISO 8601 format.
 
-        Yields:
-            str: Each response chunk's data field as decoded text.
-        """
-        with httpx.stream(
-            "POST",
-            url=self.url + self.SANDBOX_PATH + processor_id,
-            params={"timeout": timeout} if timeout is not None else {},
-            json=input,
-            headers={"x-api-key": self.api_key, "Accept": "text/event-stream"},
-            timeout=None,
-        ) as response:
-            for chunk in response.iter_text():
-                yield self._parse_data(chunk)
+class _Call:
+    """A prepared sandbox request and the metadata the client needs to handle it.
 
-    def execute(self, sequence: QueryFlowSequence, input_data: dict):
-        """Executes a QueryFlow processor sequence.
+    Attributes:
+        request (dict): Keyword arguments for the HTTP client request.
+        processor (str | Processor): The Processor entity or UUID being executed.
+        processor_key (str): Stable hash of the serialized processor, or its UUID.
+        input_data (bytes): The serialized input.
+    """
+
+    def __init__(
+        self,
+        request: dict,
+        processor: str | Processor,
+        processor_key: str,
+        input_data: bytes,
+    ):
+        """Initialize the _Call with request, processor, processor key and input.
 
         Args:
-            sequence (QueryFlowSequence): The sequence of QueryFlowSequenceProcessors to execute.
-            input_data (dict): The initial input with which to start the execution.
+            request (dict): Keyword arguments for the HTTP client request.
+            processor (str | Processor): The Processor entity or UUID being executed.
+            processor_key (str): Stable hash of the serialized processor, or its UUID.
+            input_data (bytes): The serialized input.
+        """
+        self.request = request
+        self.processor = processor
+        self.processor_key = processor_key
+        self.input_data = input_data
 
-        Returns:
-            dict: The final response data from the sequence execution.
+    @property
+    def processor_type(self):
+        """str: The type of the Processor entity, or None for a processor UUID."""
+        return None if isinstance(self.processor, str) else self.processor.type
 
-        Raises:
-            SystemExit: If the execution of any processor fails.
-        """
-        for queryflow_processor in sequence.processors:
-            try:
-                input_data = self.text_to_text(
-                    queryflow_processor.processor,
-                    input_data,
-                    queryflow_processor.timeout,
+    @property
+    def processor_id(self):
+        """str: The UUID of the processor, or None for a Processor entity."""
+        return self.processor if isinstance(self.processor, str) else None
+
+    @property
+    def endpoint(self):
+        """str: The URL of the request, qualified by the processor type for entities."""
+        if isinstance(self.processor, str):
+            return self.request["url"]
+        return f"{self.request['url']} [{self.processor.type}]"
+
+    @property
+    def action(self):
+        """str: The ``action`` configured in the Processor entity, if any."""
+        if isinstance(self.processor, str) or not isinstance(
+            self.processor.config, dict
+        ):
+            return None
+        return self.processor.config.get("action")
+
+    @property
+    def key(self):
+        """tuple[str, str]: The processor key and the hash of the serialized input."""
+        return (self.processor_key, _digest(self.input_data))
+
+    @property
+    def flight_key(self):
+        """tuple: The key of the call and its query parameters, such as ``timeout``."""
+        return self.key + tuple(sorted(self.request["params"].items()))
+
+
+_MISSING = object()
+_DONE = object()
+
+_deadline = contextvars.ContextVar("queryflow_deadline", default=None)
+"""The ``(expires, budget)`` of the running execution, with ``expires`` in
+``time.monotonic`` seconds, or None if it has no deadline."""
+
+_ISO_DURATION = re.compile(
+    r"P(?:(?P<days>\d+(?:\.\d+)?)D)?"
+    r"(?:T(?:(?P<hours>\d+(?:\.\d+)?)H)?"
+    r"(?:(?P<minutes>\d+(?:\.\d+)?)M)?"
+    r"(?:(?P<seconds>\d+(?:\.\d+)?)S)?)?"
+)
+
+
+def _parse_duration(value: str):
+    """Return the seconds of an ISO 8601 duration, or None if it cannot be parsed."""
+    match = _ISO_DURATION.fullmatch(value)
+    if match is None:
+        return None
+    parts = {name: float(part) for name, part in match.groupdict().items() if part}
+    return (
+        parts.get("days", 0) * 86400
+        + parts.get("hours", 0) * 3600
+        + parts.get("minutes", 0) * 60
+        + parts.get("seconds", 0)
+    )
+
+
+def _format_duration(seconds: float):
+    """Return the seconds as an ISO 8601 duration with millisecond precision."""
+    return f"PT{max(seconds, 0.001):.3f}S"
+
+
+def _remaining():
+    """Return the seconds left until the deadline, or None if there is no deadline.
+
+    Raises:
+        DeadlineExceeded: If the deadline has already passed.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    expires, budget = deadline
+    remaining = expires - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded(budget)
+    return remaining
+
+
+async def _await(awaitable: Awaitable):
+    """Await an awaitable, so that it can run as a task."""
+    return await awaitable
+
+
+def _set_deadline(seconds: float | None):
+    """Start a deadline for the current context, keeping an earlier outer deadline.
+
+    Returns:
+        contextvars.Token: The token to reset the deadline, or None if none was set.
+    """
+    if seconds is None:
+        return None
+    expires = time.monotonic() + seconds
+    outer = _deadline.get()
+    if outer is not None and outer[0] <= expires:
+        return _deadline.set(outer)
+    return _deadline.set((expires, seconds))
+
+
+class _BaseQueryFlowClient:
+    """Request building shared by the synchronous and asynchronous clients.
+
+    Attributes:
+        url (str): The base url for the request.
+        api_key (str): The api key to use in the request.
+        codec (JSONCodec): The codec for request and response bodies.
+        cache (ResponseCache): The response cache, or None if caching is disabled.
+        single_flight (SingleFlight | AsyncSingleFlight): Coalesces identical calls in
+            flight, or None if coalescing is disabled.
+        hedging (HedgingPolicy): The hedging policy, or None if hedging is disabled.
+        retry (RetryPolicy): The retry policy, or None if retries are disabled.
+        circuit_breaker (CircuitBreaker): The circuit breaker, or None if disabled.
+        rate_limiter (RateLimiter): The rate limiter, or None if disabled.
+        concurrency (AdaptiveConcurrency): The adaptive concurrency limit, or None if
+            disabled.
+        embeddings (str): The type embedding vectors are decoded to, one of
+            ``EMBEDDING_FORMATS``.
+        base64_embeddings (bool): Whether embeddings processors are asked for base64
+            encoded float32 vectors.
+        SANDBOX_PATH (str): The api path to use in the request.
+        BASE64_EMBEDDING_TYPES (frozenset[str]): The processor types whose embeddings
+            action can return base64 encoded vectors.
+    """
+
+    SANDBOX_PATH = "/v2/sandbox/"
+    BASE64_EMBEDDING_TYPES = frozenset({"openai"})
+
+    def __init__(
+        self,
+        url: str,
+        api_key: str,
+        codec: JSONCodec | None = None,
+        cache: ResponseCache | None = None,
+        single_flight: SingleFlight | AsyncSingleFlight | None = None,
+        hedging: HedgingPolicy | None = None,
+        retry: RetryPolicy | None = None,
+        circuit_breaker: CircuitBreaker | None = None,
+        rate_limiter: RateLimiter | None = None,
+        concurrency: AdaptiveConcurrency | None = None,
+        embeddings: str = "list",
+        base64_embeddings: bool = False,
+    ):
+        """Initialize the client with url, api key, codec, cache and request policies.
+
+        Args:
+            url (str): The base url for the request.
+            api_key (str): The api key to use in the request.
+            codec (JSONCodec): The codec for request and response bodies, defaults to
+                the fastest available one.
+            cache (ResponseCache): The cache for ``text_to_text`` responses, or None to
+                disable caching.
+            single_flight (SingleFlight | AsyncSingleFlight): Coalesces identical
+                ``text_to_text`` calls in flight, or None to send every call.
+            hedging (HedgingPolicy): Hedges slow ``text_to_text`` calls to idempotent
+                processors, or None to never hedge.
+            retry (RetryPolicy): Retries ``text_to_text`` calls that failed with a
+                transient error, or None to never retry.
+            circuit_breaker (CircuitBreaker): Rejects ``text_to_text`` calls to
+                unhealthy endpoints, or None to always send them.
+            rate_limiter (RateLimiter): Paces ``text_to_text`` calls per server type,
+                or None to send them as soon as possible.
+            concurrency (AdaptiveConcurrency): Adapts the number of ``text_to_text``
+                calls in flight per server type to its capacity, or None to not
+                limit them.
+            embeddings (str): Decode the vectors of embeddings responses to lists of
+                floats with ``"list"``, to ``array('f')`` with ``"array"`` or to NumPy
+                float32 arrays with ``"numpy"``.
+            base64_embeddings (bool): Whether to ask embeddings processors of the
+                ``BASE64_EMBEDDING_TYPES`` for base64 encoded float32 vectors, which
+                are smaller and faster to decode. Their config can override it with
+                its own ``encodingFormat``.
+
+        Raises:
+            ValueError: If the embeddings format is unknown.
+            ImportError: If the embeddings format is ``"numpy"`` and NumPy is not
+                installed.
+        """
+        if embeddings not in EMBEDDING_FORMATS:
+            raise ValueError(f"Unknown embeddings format: {embeddings}")
+        if embeddings == "numpy" and numpy is None:
+            raise ImportError(
+                "The numpy embeddings format requires the 'numpy' package"
+            )
+        self.url = url
+        self.api_key = api_key
+        self.codec = codec if codec is not None else default_codec()
+        self.cache = cache
+        self.single_flight = single_flight
+        self.hedging = hedging
+        self.retry = retry
+        self.circuit_breaker = circuit_breaker
+        self.rate_limiter = rate_limiter
+        self.concurrency = concurrency
+        self.embeddings = embeddings
+        self.base64_embeddings = base64_embeddings
+        self._observers = ()
+        self._observers_lock = threading.Lock()
+
+    def add_observer(self, observer: Callable[[RequestEvent], None]):
+        """Register a function that is called with the RequestEvent of every request.
+
+        Observers are called on the thread or task that sent the request, right after
+        it completes, so they should return quickly. While no observer is registered
+        requests are not instrumented at all.
+
+        Args:
+            observer (Callable[[RequestEvent], None]): The function to call.
+        """
+        with self._observers_lock:
+            self._observers = self._observers + (observer,)
+
+    def remove_observer(self, observer: Callable[[RequestEvent], None]):
+        """Unregister an observer.
+
+        Args:
+            observer (Callable[[RequestEvent], None]): The function to stop calling.
+
+        Raises:
+            ValueError: If the observer is not registered.
+        """
+        with self._observers_lock:
+            observers = list(self._observers)
+            observers.remove(observer)
+            self._observers = tuple(observers)
+
+    def _trace(self, call: _Call, stream: bool = False):
+        """Return a RequestTrace for the call, or None if no observer is registered."""
+        if not self._observers:
+            return None
+        event = RequestEvent(
+            call.processor_type,
+            call.processor_id,
+            call.endpoint,
+            stream,
+            current_stage(),
+        )
+        return RequestTrace(event, len(call.request["content"]))
+
+    def _notify(self, event: RequestEvent):
+        """Call every registered observer with the event."""
+        for observer in self._observers:
+            observer(event)
+
+    @staticmethod
+    def _limits(max_connections, max_keepalive_connections, keepalive_expiry):
+        """Return the connection pool limits for the underlying HTTP client."""
+        return httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+
+    def invalidate_cache(
+        self, processor: str | Processor | None = None, input: dict | None = None
+    ):
+        """Remove cached responses.
+
+        Args:
+            processor (str | Processor): Only remove responses of this Processor entity
+                or processor UUID, or None for every processor.
+            input (dict): Only remove responses for this input, or None for every input.
+
+        Returns:
+            int: The number of removed responses.
+        """
+        if self.cache is None:
+            return 0
+        processor_key = None
+        if isinstance(processor, str):
+            processor_key = processor
+        elif processor is not None:
+            processor_key = self._processor_key(processor)
+        input_key = _digest(self.codec.encode(input)) if input is not None else None
+        return self.cache.invalidate(processor_key, input_key)
+
+    def _processor_call(self, processor: Processor, input: dict, timeout: str | None):
+        """Prepare a request that executes a Processor entity.
+
+        Args:
+            processor (Processor): The processor to execute.
+            input (dict): The input to send to the processor.
+            timeout (str): The timeout parameter for the request, in ISO 8601 format.
+
+        Returns:
+            _Call: The prepared request.
+        """
+        input_data = self.codec.encode(input)
+        payload, processor_key = self._processor_payload(processor)
+        request_data = (
+            b'{"processor":'
+            + payload
+            + b',"input":'
+            + input_data
+            + b"}"
+        )
+        request = {
+            "url": self.url + self.SANDBOX_PATH,
+            "params": {"timeout": timeout} if timeout is not None else {},
+            "content": request_data,
+            "headers": {"x-api-key": self.api_key, "Content-Type": "application/json"},
+            "timeout": None,
+        }
+        return _Call(request, processor, processor_key, input_data)
+
+    def _asks_base64(self, processor: Processor):
+        """Return whether to ask the embeddings processor for base64 vectors."""
+        config = processor.config
+        return (
+            self.base64_embeddings
+            and processor.type in self.BASE64_EMBEDDING_TYPES
+            and isinstance(config, dict)
+            and config.get("action") == "embeddings"
+            and "encodingFormat" not in config
+        )
+
+    def _processor_payload(self, processor: Processor):
+        """Return the serialized processor and its stable hash.
+
+        Processors can be modified in place, including their nested dictionaries,
+        so they are serialized on every call. Frozen processors cannot change, so
+        their payload is cached on the processor for the codec of this client. A
+        processor built around a shared frozen server only serializes its type and
+        config, and the cached payload of the server is spliced in. Embeddings
+        processors that should return base64 vectors are serialized with
+        ``encodingFormat`` added to their config, without copying the processor.
+
+        Args:
+            processor (Processor): The processor to serialize.
+
+        Returns:
+            tuple[bytes, str]: The JSON representation of the processor and its hash.
+        """
+        base64 = self._asks_base64(processor)
+        cached = processor._payload if processor._frozen else None
+        if cached is not None and cached[0] is self.codec and cached[1] == base64:
+            return cached[2], cached[3]
+        config = processor.config
+        if base64:
+            config = config | {"encodingFormat": "base64"}
+        server = processor.server
+        if isinstance(server, Server) and server._frozen:
+            payload = (
+                b'{"type":'
+                + self.codec.encode(processor.type)
+                + b',"config":'
+                + self.codec.encode(config)
+                + b',"server":'
+                + self._server_payload(server)
+                + b"}"
+            )
+        elif base64:
+            payload = self.codec.encode(
+                {"type": processor.type, "config": config, "server": server}
+            )
+        else:
+            payload = self.codec.encode(processor)
+        key = _digest(payload)
+        if processor._frozen:
+            processor._payload = (self.codec, base64, payload, key)
+        return payload, key
+
+    def _server_payload(self, server: Server):
+        """Return the serialized frozen server, cached on it for the client codec."""
+        cached = server._payload
+        if cached is not None and cached[0] is self.codec:
+            return cached[1]
+        payload = self.codec.encode(server)
+        server._payload = (self.codec, payload)
+        return payload
+
+    def _processor_key(self, processor: Processor):
+        """Return the stable hash of the serialized processor."""
+        return self._processor_payload(processor)[1]
+
+    def _processor_id_call(self, processor_id: str, input: dict, timeout: str | None):
+        """Prepare a request that executes a processor by ID.
+
+        Args:
+            processor_id (str): The UUID of the processor to execute.
+            input (dict): The input to send to the processor.
+            timeout (str): The timeout parameter for the request, in ISO 8601 format.
+
+        Returns:
+            _Call: The prepared request.
+        """
+        input_data = self.codec.encode(input)
+        request = {
+            "url": self.url + self.SANDBOX_PATH + processor_id,
+            "params": {"timeout": timeout} if timeout is not None else {},
+            "content": input_data,
+            "headers": {"x-api-key": self.api_key, "Content-Type": "application/json"},
+            "timeout": None,
+        }
+        return _Call(request, processor_id, processor_id, input_data)
+
+    @staticmethod
+    def _deadline_request(request: dict):
+        """Return the request arguments bounded by the deadline of the execution.
+
+        Both the ``timeout`` query parameter sent to the sandbox and the client socket
+        timeout are capped to the remaining time, so retries and later stages only
+        get what is left of the budget.
+
+        Raises:
+            DeadlineExceeded: If the deadline has already passed.
+        """
+        remaining = _remaining()
+        if remaining is None:
+            return request
+        timeout = request["params"].get("timeout")
+        if timeout is not None:
+            seconds = _parse_duration(timeout)
+            if seconds is not None and seconds < remaining:
+                return {**request, "timeout": remaining}
+        return {
+            **request,
+            "params": {**request["params"], "timeout": _format_duration(remaining)},
+            "timeout": remaining,
+        }
+
+    @staticmethod
+    def _stream_request(request: dict):
+        """Return the request arguments with the SSE ``Accept`` header added."""
+        request["headers"]["Accept"] = "text/event-stream"
+        return request
+
+    def _cache_key(self, call: _Call):
+        """Return the cache key of the call, or None if it must not be cached."""
+        if self.cache is None or not self.cache.accepts(
+            call.processor_type, call.processor_id
+        ):
+            return None
+        return call.key
+
+    def _before_attempt(self, call: _Call):
+        """Check the circuit breaker before sending an attempt of the call.
+
+        Raises:
+            CircuitOpenError: If the endpoint of the call is unhealthy.
+        """
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.before(call.endpoint)
+
+    def _attempt_succeeded(self, call: _Call):
+        """Record a successful attempt of the call."""
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.success(call.endpoint)
+
+    def _attempt_failed(self, call: _Call, error: BaseException, attempt: int):
+        """Record a failed attempt of the call and decide whether to retry it.
+
+        Args:
+            call (_Call): The call that failed.
+            error (BaseException): The error raised by the attempt.
+            attempt (int): The number of the failed attempt, starting at 1.
+
+        Returns:
+            float: Seconds to wait before retrying, or None to raise the error.
+        """
+        if not isinstance(error, Exception):
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.abandon(call.endpoint)
+            return None
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.failure(call.endpoint, error)
+        if self.retry is None:
+            return None
+        delay = self.retry.delay(error, attempt, call.action)
+        deadline = _deadline.get()
+        if delay is not None and deadline is not None:
+            if time.monotonic() + delay >= deadline[0]:
+                return None
+        return delay
+
+    def _upstream(self, call: _Call):
+        """Return the upstream that rate and concurrency limits of the call apply to.
+
+        Returns:
+            tuple[str, str]: The ``Server.type`` of the processor, or its own type
+                when it has no server, or None for a processor UUID, and a hash of
+                the credential when a limit is kept per credential, or None.
+        """
+        processor = call.processor
+        if isinstance(processor, str):
+            return None, None
+        server = processor.server
+        if server is None:
+            return processor.type, None
+        credential = None
+        if server.credential is not None and any(
+            policy is not None and policy.per_credential
+            for policy in (self.rate_limiter, self.concurrency)
+        ):
+            credential = _digest(self.codec.encode(server.credential))
+        return server.type, credential
+
+    def _rate_delay(self, upstream: tuple):
+        """Reserve a rate limiter token for the upstream and return the wait.
+
+        Raises:
+            DeadlineExceeded: If the wait would outlive the deadline.
+        """
+        delay = self.rate_limiter.reserve(*upstream)
+        if delay:
+            remaining = _remaining()
+            if remaining is not None and delay >= remaining:
+                raise DeadlineExceeded(_deadline.get()[1])
+        return delay
+
+    @staticmethod
+    def _split_stream_sequence(sequence: QueryFlowSequence):
+        """Return the steps before the streamed last step, and the last step.
+
+        Raises:
+            ValueError: If the sequence is empty or its last step is not a
+                QueryFlowSequenceProcessor.
+        """
+        steps = sequence.processors
+        if not steps or not isinstance(steps[-1], QueryFlowSequenceProcessor):
+            raise ValueError(
+                "The last step of a streamed sequence must be a "
+                "QueryFlowSequenceProcessor"
+            )
+        last = steps[-1]
+        return QueryFlowSequence(steps[:-1]), last, last.name or str(len(steps) - 1)
+
+    def _hedges(self, call: _Call):
+        """Return whether the call is eligible for hedging."""
+        return self.hedging is not None and self.hedging.accepts(
+            call.processor_type, call.action
+        )
+
+    @staticmethod
+    def _response_body(response: httpx.Response):
+        """Return the body of a response, or None for 204.
+
+        Raises:
+            HTTPStatusError: If the response has an error status code.
+        """
+        if response.status_code == 204:
+            return None
+        return response.raise_for_status().content
+
+    def _decode(self, body: bytes | None):
+        """Return the decoded JSON body, or an empty dict for a response without body.
+
+        The vectors of embeddings responses are converted to the embeddings format of
+        the client.
+        """
+        if body is None:
+            return {}
+        decoded = self.codec.decode(body)
+        if self.embeddings != "list" or self.base64_embeddings:
+            return _decode_embeddings(decoded, self.embeddings)
+        return decoded
+
+
+class QueryFlowClient(_BaseQueryFlowClient):
+    """A client class to execute QueryFlow requests.
+
+    The client owns a pooled ``httpx.Client``, so connections are kept alive and
+    reused across calls. Close it with ``close()`` or use the client as a context
+    manager once it is no longer needed.
+
+    Attributes:
+        url (str): The base url for the request.
+        api_key (str): The api key to use in the request.
+        codec (JSONCodec): The codec for request and response bodies.
+        cache (ResponseCache): The response cache, or None if caching is disabled.
+        single_flight (SingleFlight | AsyncSingleFlight): Coalesces identical calls in
+            flight, or None if coalescing is disabled.
+        hedging (HedgingPolicy): The hedging policy, or None if hedging is disabled.
+        retry (RetryPolicy): The retry policy, or None if retries are disabled.
+        circuit_breaker (CircuitBreaker): The circuit breaker, or None if disabled.
+        rate_limiter (RateLimiter): The rate limiter, or None if disabled.
+        concurrency (AdaptiveConcurrency): The adaptive concurrency limit, or None if
+            disabled.
+        embeddings (str): The type embedding vectors are decoded to, one of
+            ``EMBEDDING_FORMATS``.
+        base64_embeddings (bool): Whether embeddings processors are asked for base64
+            encoded float32 vectors.
+        SANDBOX_PATH (str): The api path to use in the request.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        api_key: str,
+        max_connections: int | None = 100,
+        max_keepalive_connections: int | None = 20,
+        keepalive_expiry: float | None = 5.0,
+        codec: JSONCodec | None = None,
+        cache: ResponseCache | None = None,
+        coalesce: bool = False,
+        hedging: HedgingPolicy | None = None,
+        retry: RetryPolicy | None = None,
+        circuit_breaker: CircuitBreaker | None = None,
+        rate_limiter: RateLimiter | None = None,
+        concurrency: AdaptiveConcurrency | None = None,
+        embeddings: str = "list",
+        base64_embeddings: bool = False,
+        transport: httpx.BaseTransport | None = None,
+    ):
+        """Initialize the client with url and api key.
+
+        Args:
+            url (str): The base url for the request.
+            api_key (str): The api key to use in the request.
+            max_connections (int): Maximum number of open connections in the pool.
+            max_keepalive_connections (int): Maximum number of idle connections kept alive.
+            keepalive_expiry (float): Seconds an idle connection is kept before closing it.
+            codec (JSONCodec): The codec for request and response bodies, defaults to
+                the fastest available one.
+            cache (ResponseCache): The cache for ``text_to_text`` responses, or None to
+                disable caching.
+            coalesce (bool): Whether identical ``text_to_text`` calls in flight share
+                a single request.
+            hedging (HedgingPolicy): Hedges slow ``text_to_text`` calls to idempotent
+                processors, or None to never hedge.
+            retry (RetryPolicy): Retries ``text_to_text`` calls that failed with a
+                transient error, or None to never retry.
+            circuit_breaker (CircuitBreaker): Rejects ``text_to_text`` calls to
+                unhealthy endpoints, or None to always send them.
+            rate_limiter (RateLimiter): Paces ``text_to_text`` calls per server type,
+                or None to send them as soon as possible.
+            concurrency (AdaptiveConcurrency): Adapts the number of ``text_to_text``
+                calls in flight per server type to its capacity, or None to not
+                limit them.
+            embeddings (str): Decode the vectors of embeddings responses to lists of
+                floats with ``"list"``, to ``array('f')`` with ``"array"`` or to NumPy
+                float32 arrays with ``"numpy"``.
+            base64_embeddings (bool): Whether to ask embeddings processors of the
+                ``BASE64_EMBEDDING_TYPES`` for base64 encoded float32 vectors, which
+                are smaller and faster to decode. Their config can override it with
+                its own ``encodingFormat``.
+            transport (httpx.BaseTransport): The transport that sends the requests,
+                such as a ``RecordingTransport`` or ``ReplayTransport``, or None for
+                the pooled HTTP transport. The connection limits only apply to the
+                default transport.
+
+        Raises:
+            ValueError: If the embeddings format is unknown.
+            ImportError: If the embeddings format is ``"numpy"`` and NumPy is not
+                installed.
+        """
+        super().__init__(
+            url,
+            api_key,
+            codec,
+            cache,
+            SingleFlight() if coalesce else None,
+            hedging,
+            retry,
+            circuit_breaker,
+            rate_limiter,
+            concurrency,
+            embeddings,
+            base64_embeddings,
+        )
+        # Hedged calls run both requests on worker threads, so the executor needs a
+        # worker for every request the connection pool can have in flight.
+        self._hedge_workers = 2 * (max_connections or 100)
+        self._hedge_executor = None
+        self._hedge_lock = threading.Lock()
+        self._client = httpx.Client(
+            limits=self._limits(
+                max_connections, max_keepalive_connections, keepalive_expiry
+            ),
+            timeout=None,
+            transport=transport,
+        )
+
+    def __enter__(self):
+        """Return the client to be used as a context manager."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Close the client when leaving the context."""
+        self.close()
+
+    def close(self):
+        """Close the underlying HTTP connection pool."""
+        with self._hedge_lock:
+            if self._hedge_executor is not None:
+                self._hedge_executor.shutdown(wait=False)
+        self._client.close()
+
+    @multimethod
+    def text_to_text(
+        self, processor: Processor, input: dict, timeout: str | None = None
+    ):
+        """Execute a processor with the given input.
+
+        Args:
+            processor (Processor): The processor to execute.
+            input (dict): The input to send to the processor.
+            timeout (str): The timeout parameter for the request, in ISO 8601 format.
+
+        Returns:
+            dict: The response data from the request.
+        """
+        return self._decode(
+            self._execute(self._processor_call(processor, input, timeout))
+        )
+
+    @multimethod
+    def text_to_text(self, processor_id: str, input: dict, timeout: str | None = None):
+        """Execute a processor by ID with the given input.
+
+        Args:
+            processor_id (str): The UUID of the processor to execute.
+            input (dict): The input to send to the processor.
+            timeout (str): The timeout parameter for the request, in ISO 8601 format.
+
+        Returns:
+            dict: The response data from the request.
+        """
+        return self._decode(
+            self._execute(self._processor_id_call(processor_id, input, timeout))
+        )
+
+    def text_to_text_many(
+        self,
+        processor: str | Processor,
+        inputs: Iterable[dict],
+        max_concurrency: int = 8,
+        timeout: str | None = None,
+    ):
+        """Execute a processor concurrently for each of the given inputs.
+
+        Failures are reported per item instead of aborting the batch.
+
+        Args:
+            processor (str | Processor): A Processor entity or UUID of an existing processor to execute.
+            inputs (Iterable[dict]): The inputs to send to the processor.
+            max_concurrency (int): Maximum number of requests in flight at once.
+            timeout (str): The timeout parameter for each request, in ISO 8601 format.
+
+        Returns:
+            list[BatchResult]: One result per input, in input order.
+        """
+        inputs = list(inputs)
+        results = [None] * len(inputs)
+        for result in self.text_to_text_imap(
+            processor, inputs, max_concurrency, timeout
+        ):
+            results[result.index] = result
+        return results
+
+    def text_to_text_imap(
+        self,
+        processor: str | Processor,
+        inputs: Iterable[dict],
+        max_concurrency: int = 8,
+        timeout: str | None = None,
+    ):
+        """Execute a processor concurrently and yield each result as it finishes.
+
+        Inputs are consumed lazily, so at most ``max_concurrency`` requests are in
+        flight and arbitrarily long iterables can be processed.
+
+        Args:
+            processor (str | Processor): A Processor entity or UUID of an existing processor to execute.
+            inputs (Iterable[dict]): The inputs to send to the processor.
+            max_concurrency (int): Maximum number of requests in flight at once.
+            timeout (str): The timeout parameter for each request, in ISO 8601 format.
+
+        Yields:
+            BatchResult: The result of each input, in completion order.
+        """
+
+        def run(index: int, input: dict):
+            try:
+                return BatchResult(
+                    index, input, self.text_to_text(processor, input, timeout)
+                )
+            except Exception as e:
+                return BatchResult(index, input, error=e)
+
+        pending_inputs = enumerate(inputs)
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            in_flight = set()
+            for index, input in pending_inputs:
+                in_flight.add(executor.submit(run, index, input))
+                if len(in_flight) >= max_concurrency:
+                    break
+            while in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+                    next_input = next(pending_inputs, None)
+                    if next_input is not None:
+                        in_flight.add(executor.submit(run, *next_input))
+
+    @multimethod
+    def text_to_stream(self, processor: Processor, input: dict, timeout: str = None):
+        """Execute a processor with the given input.
+
+        Args:
+            processor (Processor): The processor to execute.
+            input (dict): The input to send to the processor.
+            timeout (str): The timeout parameter for the request, in ISO 8601 format.
+
+        Yields:
+            str: The data field of each received event.
+        """
+        yield from self._stream(self._processor_call(processor, input, timeout))
+
+    @multimethod
+    def text_to_stream(self, processor_id: str, input: dict, timeout: str = None):
+        """Execute a processor by ID with the given input.
+
+        Args:
+            processor_id (str): The UUID of the processor to execute.
+            input (dict): The input to send to the processor.
+            timeout (str): The timeout parameter for the request, in ISO 8601 format.
+
+        Yields:
+            str: The data field of each received event.
+        """
+        yield from self._stream(
+            self._processor_id_call(processor_id, input, timeout)
+        )
+
+    def _execute(self, call: _Call):
+        """Return the response body of a call, answering from the cache when possible.
+
+        Identical calls already in flight are awaited instead of sent again when
+        coalescing is enabled. A call with a deadline waits at most until its
+        deadline, and is not shared when it is sent, so that other callers never
+        inherit its deadline.
+
+        Args:
+            call (_Call): The prepared request.
+
+        Returns:
+            bytes: The response body, or None for a response without content.
+        """
+        key = self._cache_key(call)
+        if key is not None:
+            body = self.cache.get(key, _MISSING)
+            if body is not _MISSING:
+                return body
+        if self.single_flight is not None:
+            remaining = _remaining()
+            try:
+                body = self.single_flight.do(
+                    call.flight_key,
+                    lambda: self._request(call),
+                    remaining,
+                    share=remaining is None,
+                )
+            except TimeoutError as e:
+                # The request raises DeadlineExceeded for its own timeouts, so any
+                # other TimeoutError means the deadline passed while waiting.
+                if isinstance(e, DeadlineExceeded):
+                    raise
+                raise DeadlineExceeded(_deadline.get()[1]) from e
+        else:
+            body = self._request(call)
+        if key is not None:
+            self.cache.put(key, body)
+        return body
+
+    def _request(self, call: _Call):
+        """Send a call applying the client's request policies.
+
+        Every attempt is checked against the circuit breaker, hedged if eligible, and
+        retried after a backoff while the retry policy allows it.
+        """
+        attempt = 1
+        while True:
+            self._before_attempt(call)
+            try:
+                if self._hedges(call):
+                    body = self._send_hedged(call)
+                else:
+                    body = self._send(call)
+            except BaseException as e:
+                delay = self._attempt_failed(call, e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+            else:
+                self._attempt_succeeded(call)
+                return body
+
+    def _send_hedged(self, call: _Call):
+        """Send a call and hedge it with a second request if it is slow.
+
+        The losing request cannot be interrupted, so it is left to finish in the
+        background and its response is discarded.
+        """
+        hedging = self.hedging
+        hedging.start()
+        executor = self._hedge_executor or self._start_hedge_executor()
+        start = time.monotonic()
+        primary = executor.submit(contextvars.copy_context().run, self._send, call)
+        done, _ = wait([primary], timeout=hedging.hedge_delay())
+        if done or not hedging.acquire():
+            body = primary.result()
+            hedging.record(time.monotonic() - start)
+            return body
+
+        pending = {
+            primary,
+            executor.submit(contextvars.copy_context().run, self._send, call),
+        }
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for loser in pending:
+                        loser.cancel()
+                    hedging.record(time.monotonic() - start)
+                    return future.result()
+        return primary.result()
+
+    def _start_hedge_executor(self):
+        """Return the executor of hedged calls, creating it once across threads."""
+        with self._hedge_lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(
+                    max_workers=self._hedge_workers,
+                    thread_name_prefix="queryflow-hedge",
+                )
+            return self._hedge_executor
+
+    def _send(self, call: _Call):
+        """Send a call and return the response body, or None for 204.
+
+        The request first waits for the rate and concurrency limits of its upstream,
+        and its outcome adapts the concurrency limit.
+        """
+        upstream = self._admit(call)
+        if upstream is None:
+            return self._post(call)
+        start, error = time.monotonic(), None
+        try:
+            return self._post(call)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.concurrency.release(*upstream, start, error)
+
+    def _admit(self, call: _Call):
+        """Wait until the rate limiter and the adaptive concurrency admit the call.
+
+        Returns:
+            tuple[str, str]: The upstream whose concurrency slot was taken, or None.
+
+        Raises:
+            DeadlineExceeded: If the deadline passes while waiting.
+        """
+        if self.rate_limiter is None and self.concurrency is None:
+            return None
+        upstream = self._upstream(call)
+        if self.concurrency is not None:
+            while not self.concurrency.acquire(*upstream, timeout=_remaining()):
+                pass
+        try:
+            delay = self._rate_delay(upstream) if self.rate_limiter else 0
+            if delay:
+                time.sleep(delay)
+        except BaseException:
+            if self.concurrency is not None:
+                self.concurrency.release(*upstream)
+            raise
+        return upstream if self.concurrency is not None else None
+
+    def _post(self, call: _Call):
+        """Post the request of a call and return the response body."""
+        request = self._deadline_request(call.request)
+        trace = self._trace(call)
+        if trace is None:
+            return self._response_body(self._client.post(**request))
+        response = error = None
+        try:
+            response = self._client.post(**request, extensions={"trace": trace.trace})
+            return self._response_body(response)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._notify(trace.finish(response, error))
+
+    def _stream(self, call: _Call):
+        """Send a streaming request and yield the data of each received event."""
+        request = self._deadline_request(self._stream_request(call.request))
+        trace = self._trace(call, stream=True)
+        if trace is not None:
+            request = {**request, "extensions": {"trace": trace.trace}}
+        response = error = None
+        try:
+            with self._client.stream("POST", **request) as response:
+                decoder = SSEDecoder()
+                for chunk in response.iter_bytes():
+                    for event in decoder.feed(chunk):
+                        if trace is not None:
+                            trace.stream_event()
+                        yield event.data
+                for event in decoder.close():
+                    if trace is not None:
+                        trace.stream_event()
+                    yield event.data
+        except GeneratorExit:
+            raise
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            if trace is not None:
+                self._notify(trace.finish(response, error))
+
+    def execute_many(
+        self,
+        sequence: QueryFlowSequence,
+        inputs: Iterable[dict],
+        max_concurrency: int = 8,
+        queue_size: int | None = None,
+    ):
+        """Executes a QueryFlow processor sequence for each of the given inputs.
+
+        Each step of the sequence is a pipeline stage with its own workers,
+        connected to the next stage by a bounded queue. While one stage handles an
+        input the next stage handles the previous one, so throughput is bounded by
+        the slowest stage instead of the sum of all stages. An input whose execution
+        fails skips the remaining stages and the failure is reported in its result.
+
+        Args:
+            sequence (QueryFlowSequence): The sequence of QueryFlowSequenceProcessors to execute.
+            inputs (Iterable[dict]): The initial inputs with which to start each execution.
+            max_concurrency (int): Number of inputs handled at once by stages that do
+                not set their own ``concurrency``.
+            queue_size (int): Maximum number of inputs waiting in front of each stage,
+                or None for twice the concurrency of the stage.
+
+        Returns:
+            list[BatchResult]: One result per input, in input order, whose output is
+                the final response data of the sequence.
+        """
+
+        def work(
+            step: QueryFlowSequenceProcessor | QueryFlowParallel,
+            name: str,
+            source: queue.Queue,
+            target: queue.Queue,
+        ):
+            while True:
+                item = source.get()
+                if item is _DONE:
+                    source.put(_DONE)
+                    return
+                try:
+                    with stage(name):
+                        item.output = self._run_step(step, item.output)
+                except Exception as e:
+                    item.output, item.error = None, e
+                    finished.put(item)
+                else:
+                    target.put(item)
+
+        concurrencies = [
+            step.concurrency or max_concurrency for step in sequence.processors
+        ]
+        finished = queue.Queue()
+        queues = [
+            queue.Queue(queue_size or 2 * concurrency) for concurrency in concurrencies
+        ] + [finished]
+        workers = [
+            [
+                threading.Thread(
+                    target=work,
+                    args=(step, step.name or str(k), queues[k], queues[k + 1]),
                 )
-            except HTTPStatusError as e:
-                sys.exit(e.response.text)
+                for _ in range(concurrency)
+            ]
+            for k, (step, concurrency) in enumerate(
+                zip(sequence.processors, concurrencies)
+            )
+        ]
+        for stage_workers in workers:
+            for worker in stage_workers:
+                worker.start()
+        count = 0
+        try:
+            for index, input in enumerate(inputs):
+                queues[0].put(BatchResult(index, input, input))
+                count += 1
+        finally:
+            for k, stage_workers in enumerate(workers):
+                queues[k].put(_DONE)
+                for worker in stage_workers:
+                    worker.join()
+
+        results = [None] * count
+        while not finished.empty():
+            item = finished.get_nowait()
+            results[item.index] = item
+        return results
+
+    def execute(
+        self,
+        sequence: QueryFlowSequence,
+        input_data: dict,
+        deadline: float | None = None,
+    ):
+        """Executes a QueryFlow processor sequence.
+
+        With a deadline, every request only gets the remaining time budget, both as
+        its ``timeout`` parameter and as the client socket timeout, and the
+        execution stops with ``DeadlineExceeded`` once the budget runs out.
+
+        Args:
+            sequence (QueryFlowSequence): The sequence of QueryFlowSequenceProcessors to execute.
+            input_data (dict): The initial input with which to start the execution.
+            deadline (float): Seconds the whole execution may take, or None for no limit.
+
+        Returns:
+            dict: The final response data from the sequence execution.
+
+        Raises:
+            SystemExit: If the execution of any processor fails.
+            DeadlineExceeded: If the execution did not finish within the deadline.
+        """
+        token = _set_deadline(deadline)
+        try:
+            return self._run_sequence(sequence, input_data)
+        except HTTPStatusError as e:
+            sys.exit(e.response.text)
+        except httpx.TimeoutException as e:
+            if token is None or _deadline.get()[0] > time.monotonic():
+                raise
+            raise DeadlineExceeded(_deadline.get()[1]) from e
+        finally:
+            if token is not None:
+                _deadline.reset(token)
+
+    def execute_stream(
+        self,
+        sequence: QueryFlowSequence,
+        input_data: dict,
+        deadline: float | None = None,
+    ):
+        """Executes a QueryFlow sequence, streaming the output of its last step.
+
+        Every step but the last one runs as in ``execute``, and the last one runs
+        with ``text_to_stream``, so each event is yielded as soon as it arrives. In a
+        retrieval and completion sequence the first token then arrives after the
+        retrieval steps and the first token of the completion, instead of after the
+        whole completion. The execution keeps its own deadline and stage labels, so
+        they do not apply to the code that consumes the events.
+
+        Args:
+            sequence (QueryFlowSequence): The sequence of QueryFlowSequenceProcessors to
+                execute, ending with a QueryFlowSequenceProcessor.
+            input_data (dict): The initial input with which to start the execution.
+            deadline (float): Seconds the whole execution, including the stream, may
+                take, or None for no limit.
+
+        Yields:
+            str: The data field of each event received from the last step.
+
+        Raises:
+            ValueError: If the last step of the sequence is not a
+                QueryFlowSequenceProcessor.
+            SystemExit: If the execution of any processor fails.
+            DeadlineExceeded: If the execution did not finish within the deadline.
+        """
+        context = contextvars.copy_context()
+        events = self._execute_stream(sequence, input_data, deadline)
+        try:
+            while True:
+                try:
+                    data = context.run(next, events)
+                except StopIteration:
+                    return
+                yield data
+        finally:
+            context.run(events.close)
+
+    def _execute_stream(
+        self, sequence: QueryFlowSequence, input_data: dict, deadline: float | None
+    ):
+        """Run the steps of ``execute_stream``, in the context of the execution."""
+        head, last, name = self._split_stream_sequence(sequence)
+        token = _set_deadline(deadline)
+        try:
+            input_data = self._run_sequence(head, input_data)
+            with stage(name):
+                _remaining()
+                events = self.text_to_stream(last.processor, input_data, last.timeout)
+                for data in events:
+                    _remaining()
+                    yield data
+        except HTTPStatusError as e:
+            sys.exit(e.response.text)
+        except httpx.TimeoutException as e:
+            if token is None or _deadline.get()[0] > time.monotonic():
+                raise
+            raise DeadlineExceeded(_deadline.get()[1]) from e
+
+    def _run_sequence(
+        self, sequence: QueryFlowSequence, input_data: dict, prefix: str = ""
+    ):
+        """Run every step of a sequence and return the final response data."""
+        for index, step in enumerate(sequence.processors):
+            with stage(prefix + (step.name or str(index))):
+                input_data = self._run_step(step, input_data)
         return input_data
 
-    def _parse_data(self, event: str):
-        """Return the data field from a SSE.
+    def _run_step(
+        self, step: QueryFlowSequenceProcessor | QueryFlowParallel, input_data: dict
+    ):
+        """Run one step of a sequence and return its response data."""
+        _remaining()
+        if isinstance(step, QueryFlowParallel):
+            return step.merge(self._run_branches(step, input_data))
+        return self.text_to_text(step.processor, input_data, step.timeout)
+
+    def _run_branches(self, step: QueryFlowParallel, input_data: dict):
+        """Run the branches of a parallel step concurrently.
+
+        Returns:
+            dict[str, dict]: The output of each branch, by branch name.
+
+        Raises:
+            Exception: The first exception raised by a branch. Branches that did
+                not start yet are cancelled.
+        """
+        executor = ThreadPoolExecutor(max_workers=len(step.branches) or 1)
+        try:
+            futures = {
+                name: executor.submit(
+                    contextvars.copy_context().run,
+                    self._run_sequence,
+                    branch,
+                    input_data,
+                    f"{current_stage()}.{name}.",
+                )
+                for name, branch in step.branches.items()
+            }
+            done, _ = wait(futures.values(), return_when=FIRST_EXCEPTION)
+            for future in done:
+                if future.exception() is not None:
+                    raise future.exception()
+            return {name: future.result() for name, future in futures.items()}
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class AsyncQueryFlowClient(_BaseQueryFlowClient):
+    """An asyncio client class to execute QueryFlow requests.
+
+    All calls share one pooled ``httpx.AsyncClient``, so a single event loop can keep
+    many requests in flight at once. Close it with ``aclose()`` or use the client as an
+    async context manager once it is no longer needed.
+
+    Attributes:
+        url (str): The base url for the request.
+        api_key (str): The api key to use in the request.
+        codec (JSONCodec): The codec for request and response bodies.
+        cache (ResponseCache): The response cache, or None if caching is disabled.
+        single_flight (SingleFlight | AsyncSingleFlight): Coalesces identical calls in
+            flight, or None if coalescing is disabled.
+        hedging (HedgingPolicy): The hedging policy, or None if hedging is disabled.
+        retry (RetryPolicy): The retry policy, or None if retries are disabled.
+        circuit_breaker (CircuitBreaker): The circuit breaker, or None if disabled.
+        rate_limiter (RateLimiter): The rate limiter, or None if disabled.
+        concurrency (AdaptiveConcurrency): The adaptive concurrency limit, or None if
+            disabled.
+        embeddings (str): The type embedding vectors are decoded to, one of
+            ``EMBEDDING_FORMATS``.
+        base64_embeddings (bool): Whether embeddings processors are asked for base64
+            encoded float32 vectors.
+        SANDBOX_PATH (str): The api path to use in the request.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        api_key: str,
+        max_connections: int | None = 100,
+        max_keepalive_connections: int | None = 20,
+        keepalive_expiry: float | None = 5.0,
+        codec: JSONCodec | None = None,
+        cache: ResponseCache | None = None,
+        coalesce: bool = False,
+        hedging: HedgingPolicy | None = None,
+        retry: RetryPolicy | None = None,
+        circuit_breaker: CircuitBreaker | None = None,
+        rate_limiter: RateLimiter | None = None,
+        concurrency: AdaptiveConcurrency | None = None,
+        embeddings: str = "list",
+        base64_embeddings: bool = False,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        """Initialize the client with url and api key.
 
         Args:
-            event (str): The original SSE string.
+            url (str): The base url for the request.
+            api_key (str): The api key to use in the request.
+            max_connections (int): Maximum number of open connections in the pool.
+            max_keepalive_connections (int): Maximum number of idle connections kept alive.
+            keepalive_expiry (float): Seconds an idle connection is kept before closing it.
+            codec (JSONCodec): The codec for request and response bodies, defaults to
+                the fastest available one.
+            cache (ResponseCache): The cache for ``text_to_text`` responses, or None to
+                disable caching.
+            coalesce (bool): Whether identical ``text_to_text`` calls in flight share
+                a single request.
+            hedging (HedgingPolicy): Hedges slow ``text_to_text`` calls to idempotent
+                processors, or None to never hedge.
+            retry (RetryPolicy): Retries ``text_to_text`` calls that failed with a
+                transient error, or None to never retry.
+            circuit_breaker (CircuitBreaker): Rejects ``text_to_text`` calls to
+                unhealthy endpoints, or None to always send them.
+            rate_limiter (RateLimiter): Paces ``text_to_text`` calls per server type,
+                or None to send them as soon as possible.
+            concurrency (AdaptiveConcurrency): Adapts the number of ``text_to_text``
+                calls in flight per server type to its capacity, or None to not
+                limit them.
+            embeddings (str): Decode the vectors of embeddings responses to lists of
+                floats with ``"list"``, to ``array('f')`` with ``"array"`` or to NumPy
+                float32 arrays with ``"numpy"``.
+            base64_embeddings (bool): Whether to ask embeddings processors of the
+                ``BASE64_EMBEDDING_TYPES`` for base64 encoded float32 vectors, which
+                are smaller and faster to decode. Their config can override it with
+                its own ``encodingFormat``.
+            transport (httpx.AsyncBaseTransport): The transport that sends the
+                requests, such as an ``AsyncRecordingTransport`` or
+                ``AsyncReplayTransport``, or None for the pooled HTTP transport. The
+                connection limits only apply to the default transport.
+
+        Raises:
+            ValueError: If the embeddings format is unknown.
+            ImportError: If the embeddings format is ``"numpy"`` and NumPy is not
+                installed.
+        """
+        super().__init__(
+            url,
+            api_key,
+            codec,
+            cache,
+            AsyncSingleFlight() if coalesce else None,
+            hedging,
+            retry,
+            circuit_breaker,
+            rate_limiter,
+            concurrency,
+            embeddings,
+            base64_embeddings,
+        )
+        self._client = httpx.AsyncClient(
+            limits=self._limits(
+                max_connections, max_keepalive_connections, keepalive_expiry
+            ),
+            timeout=None,
+            transport=transport,
+        )
+
+    async def __aenter__(self):
+        """Return the client to be used as an async context manager."""
+        return self
+
+    async def __aexit__(self, *exc_info):
+        """Close the client when leaving the context."""
+        await self.aclose()
+
+    async def aclose(self):
+        """Close the underlying HTTP connection pool."""
+        await self._client.aclose()
+
+    @multimethod
+    async def text_to_text(
+        self, processor: Processor, input: dict, timeout: str | None = None
+    ):
+        """Execute a processor with the given input.
+
+        Args:
+            processor (Processor): The processor to execute.
+            input (dict): The input to send to the processor.
+            timeout (str): The timeout parameter for the request, in ISO 8601 format.
 
         Returns:
-            str: The data field from the event content.
-        """
-        data = ""
-        for line in event.splitlines():
-            if line.startswith("data:"):
-                content = line.split(":")[1]
-                if content.startswith(" "):
-                    content = content[1:]
-                if data:
-                    data += "\n" + content
+            dict: The response data from the request.
+        """
+        return self._decode(
+            await self._execute(self._processor_call(processor, input, timeout))
+        )
+
+    @multimethod
+    async def text_to_text(
+        self, processor_id: str, input: dict, timeout: str | None = None
+    ):
+        """Execute a processor by ID with the given input.
+
+        Args:
+            processor_id (str): The UUID of the processor to execute.
+            input (dict): The input to send to the processor.
+            timeout (str): The timeout parameter for the request, in ISO 8601 format.
+
+        Returns:
+            dict: The response data from the request.
+        """
+        return self._decode(
+            await self._execute(self._processor_id_call(processor_id, input, timeout))
+        )
+
+    async def text_to_text_many(
+        self,
+        processor: str | Processor,
+        inputs: Iterable[dict],
+        max_concurrency: int = 8,
+        timeout: str | None = None,
+    ):
+        """Execute a processor concurrently for each of the given inputs.
+
+        Failures are reported per item instead of aborting the batch.
+
+        Args:
+            processor (str | Processor): A Processor entity or UUID of an existing processor to execute.
+            inputs (Iterable[dict]): The inputs to send to the processor.
+            max_concurrency (int): Maximum number of requests in flight at once.
+            timeout (str): The timeout parameter for each request, in ISO 8601 format.
+
+        Returns:
+            list[BatchResult]: One result per input, in input order.
+        """
+        inputs = list(inputs)
+        results = [None] * len(inputs)
+        async for result in self.text_to_text_imap(
+            processor, inputs, max_concurrency, timeout
+        ):
+            results[result.index] = result
+        return results
+
+    async def text_to_text_imap(
+        self,
+        processor: str | Processor,
+        inputs: Iterable[dict],
+        max_concurrency: int = 8,
+        timeout: str | None = None,
+    ):
+        """Execute a processor concurrently and yield each result as it finishes.
+
+        Inputs are consumed lazily, so at most ``max_concurrency`` requests are in
+        flight and arbitrarily long iterables can be processed.
+
+        Args:
+            processor (str | Processor): A Processor entity or UUID of an existing processor to execute.
+            inputs (Iterable[dict]): The inputs to send to the processor.
+            max_concurrency (int): Maximum number of requests in flight at once.
+            timeout (str): The timeout parameter for each request, in ISO 8601 format.
+
+        Yields:
+            BatchResult: The result of each input, in completion order.
+        """
+
+        async def run(index: int, input: dict):
+            try:
+                return BatchResult(
+                    index, input, await self.text_to_text(processor, input, timeout)
+                )
+            except Exception as e:
+                return BatchResult(index, input, error=e)
+
+        pending_inputs = enumerate(inputs)
+        in_flight = set()
+        try:
+            for index, input in pending_inputs:
+                in_flight.add(asyncio.ensure_future(run(index, input)))
+                if len(in_flight) >= max_concurrency:
+                    break
+            while in_flight:
+                done, in_flight = await asyncio.wait(
+                    in_flight, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+                    next_input = next(pending_inputs, None)
+                    if next_input is not None:
+                        in_flight.add(asyncio.ensure_future(run(*next_input)))
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+    @multimethod
+    async def text_to_stream(
+        self, processor: Processor, input: dict, timeout: str = None
+    ):
+        """Execute a processor with the given input.
+
+        Args:
+            processor (Processor): The processor to execute.
+            input (dict): The input to send to the processor.
+            timeout (str): The timeout parameter for the request, in ISO 8601 format.
+
+        Yields:
+            str: The data field of each received event.
+        """
+        async for data in self._stream(
+            self._processor_call(processor, input, timeout)
+        ):
+            yield data
+
+    @multimethod
+    async def text_to_stream(self, processor_id: str, input: dict, timeout: str = None):
+        """Execute a processor by ID with the given input.
+
+        Args:
+            processor_id (str): The UUID of the processor to execute.
+            input (dict): The input to send to the processor.
+            timeout (str): The timeout parameter for the request, in ISO 8601 format.
+
+        Yields:
+            str: The data field of each received event.
+        """
+        async for data in self._stream(
+            self._processor_id_call(processor_id, input, timeout)
+        ):
+            yield data
+
+    async def _execute(self, call: _Call):
+        """Return the response body of a call, answering from the cache when possible.
+
+        Identical calls already in flight are awaited instead of sent again when
+        coalescing is enabled. A call with a deadline waits at most until its
+        deadline, and is not shared when it is sent, so that other callers never
+        inherit its deadline.
+
+        Args:
+            call (_Call): The prepared request.
+
+        Returns:
+            bytes: The response body, or None for a response without content.
+        """
+        key = self._cache_key(call)
+        if key is not None:
+            body = self.cache.get(key, _MISSING)
+            if body is not _MISSING:
+                return body
+        if self.single_flight is not None:
+            body = await self.single_flight.do(
+                call.flight_key,
+                lambda: self._request(call),
+                share=_deadline.get() is None,
+            )
+        else:
+            body = await self._request(call)
+        if key is not None:
+            self.cache.put(key, body)
+        return body
+
+    async def _request(self, call: _Call):
+        """Send a call applying the client's request policies.
+
+        Every attempt is checked against the circuit breaker, hedged if eligible, and
+        retried after a backoff while the retry policy allows it.
+        """
+        attempt = 1
+        while True:
+            self._before_attempt(call)
+            try:
+                if self._hedges(call):
+                    body = await self._send_hedged(call)
+                else:
+                    body = await self._send(call)
+            except BaseException as e:
+                delay = self._attempt_failed(call, e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+            else:
+                self._attempt_succeeded(call)
+                return body
+
+    async def _send_hedged(self, call: _Call):
+        """Send a call and hedge it with a second request if it is slow.
+
+        The losing request is cancelled as soon as the other one answers.
+        """
+        hedging = self.hedging
+        hedging.start()
+        start = time.monotonic()
+        primary = asyncio.ensure_future(self._send(call))
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=hedging.hedge_delay())
+            if done or not hedging.acquire():
+                body = await primary
+                hedging.record(time.monotonic() - start)
+                return body
+
+            pending.add(asyncio.ensure_future(self._send(call)))
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        hedging.record(time.monotonic() - start)
+                        return task.result()
+            return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _send(self, call: _Call):
+        """Send a call and return the response body, or None for 204.
+
+        The request first waits for the rate and concurrency limits of its upstream,
+        and its outcome adapts the concurrency limit.
+        """
+        upstream = await self._admit(call)
+        if upstream is None:
+            return await self._post(call)
+        start, error = time.monotonic(), None
+        try:
+            return await self._post(call)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.concurrency.release(*upstream, start, error)
+
+    async def _admit(self, call: _Call):
+        """Wait until the rate limiter and the adaptive concurrency admit the call.
+
+        Returns:
+            tuple[str, str]: The upstream whose concurrency slot was taken, or None.
+
+        Raises:
+            DeadlineExceeded: If the deadline passes while waiting.
+        """
+        if self.rate_limiter is None and self.concurrency is None:
+            return None
+        upstream = self._upstream(call)
+        if self.concurrency is not None:
+            while not await self.concurrency.acquire_async(
+                *upstream, timeout=_remaining()
+            ):
+                pass
+        try:
+            delay = self._rate_delay(upstream) if self.rate_limiter else 0
+            if delay:
+                await asyncio.sleep(delay)
+        except BaseException:
+            if self.concurrency is not None:
+                self.concurrency.release(*upstream)
+            raise
+        return upstream if self.concurrency is not None else None
+
+    async def _post(self, call: _Call):
+        """Post the request of a call and return the response body."""
+        request = self._deadline_request(call.request)
+        trace = self._trace(call)
+        if trace is None:
+            return self._response_body(await self._client.post(**request))
+        response = error = None
+        try:
+            response = await self._client.post(
+                **request, extensions={"trace": trace.atrace}
+            )
+            return self._response_body(response)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._notify(trace.finish(response, error))
+
+    async def _stream(self, call: _Call):
+        """Send a streaming request and yield the data of each received event."""
+        request = self._deadline_request(self._stream_request(call.request))
+        trace = self._trace(call, stream=True)
+        if trace is not None:
+            request = {**request, "extensions": {"trace": trace.atrace}}
+        response = error = None
+        try:
+            async with self._client.stream("POST", **request) as response:
+                decoder = SSEDecoder()
+                async for chunk in response.aiter_bytes():
+                    for event in decoder.feed(chunk):
+                        if trace is not None:
+                            trace.stream_event()
+                        yield event.data
+                for event in decoder.close():
+                    if trace is not None:
+                        trace.stream_event()
+                    yield event.data
+        except GeneratorExit:
+            raise
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            if trace is not None:
+                self._notify(trace.finish(response, error))
+
+    async def execute_many(
+        self,
+        sequence: QueryFlowSequence,
+        inputs: Iterable[dict],
+        max_concurrency: int = 8,
+        queue_size: int | None = None,
+    ):
+        """Executes a QueryFlow processor sequence for each of the given inputs.
+
+        Each step of the sequence is a pipeline stage with its own workers,
+        connected to the next stage by a bounded queue. While one stage handles an
+        input the next stage handles the previous one, so throughput is bounded by
+        the slowest stage instead of the sum of all stages. An input whose execution
+        fails skips the remaining stages and the failure is reported in its result.
+
+        Args:
+            sequence (QueryFlowSequence): The sequence of QueryFlowSequenceProcessors to execute.
+            inputs (Iterable[dict]): The initial inputs with which to start each execution.
+            max_concurrency (int): Number of inputs handled at once by stages that do
+                not set their own ``concurrency``.
+            queue_size (int): Maximum number of inputs waiting in front of each stage,
+                or None for twice the concurrency of the stage.
+
+        Returns:
+            list[BatchResult]: One result per input, in input order, whose output is
+                the final response data of the sequence.
+        """
+
+        async def work(
+            step: QueryFlowSequenceProcessor | QueryFlowParallel,
+            name: str,
+            source: asyncio.Queue,
+            target: asyncio.Queue,
+        ):
+            while True:
+                item = await source.get()
+                if item is _DONE:
+                    source.put_nowait(_DONE)
+                    return
+                try:
+                    with stage(name):
+                        item.output = await self._run_step(step, item.output)
+                except Exception as e:
+                    item.output, item.error = None, e
+                    finished.put_nowait(item)
                 else:
-                    data = content
-        return data
+                    await target.put(item)
+
+        concurrencies = [
+            step.concurrency or max_concurrency for step in sequence.processors
+        ]
+        finished = asyncio.Queue()
+        queues = [
+            asyncio.Queue(queue_size or 2 * concurrency) for concurrency in concurrencies
+        ] + [finished]
+        workers = [
+            [
+                asyncio.ensure_future(
+                    work(step, step.name or str(k), queues[k], queues[k + 1])
+                )
+                for _ in range(concurrency)
+            ]
+            for k, (step, concurrency) in enumerate(
+                zip(sequence.processors, concurrencies)
+            )
+        ]
+        count = 0
+        try:
+            for index, input in enumerate(inputs):
+                await queues[0].put(BatchResult(index, input, input))
+                count += 1
+            for k, stage_workers in enumerate(workers):
+                await queues[k].put(_DONE)
+                await asyncio.gather(*stage_workers)
+        finally:
+            for stage_workers in workers:
+                for worker in stage_workers:
+                    worker.cancel()
+
+        results = [None] * count
+        while not finished.empty():
+            item = finished.get_nowait()
+            results[item.index] = item
+        return results
+
+    async def execute(
+        self,
+        sequence: QueryFlowSequence,
+        input_data: dict,
+        deadline: float | None = None,
+    ):
+        """Executes a QueryFlow processor sequence.
+
+        With a deadline, every request only gets the remaining time budget as its
+        ``timeout`` parameter, and the execution is cancelled with
+        ``DeadlineExceeded`` as soon as the budget runs out.
+
+        Args:
+            sequence (QueryFlowSequence): The sequence of QueryFlowSequenceProcessors to execute.
+            input_data (dict): The initial input with which to start the execution.
+            deadline (float): Seconds the whole execution may take, or None for no limit.
+
+        Returns:
+            dict: The final response data from the sequence execution.
+
+        Raises:
+            SystemExit: If the execution of any processor fails.
+            DeadlineExceeded: If the execution did not finish within the deadline.
+        """
+        token = _set_deadline(deadline)
+        try:
+            if token is None:
+                return await self._run_sequence(sequence, input_data)
+            return await self._within_deadline(self._run_sequence(sequence, input_data))
+        except HTTPStatusError as e:
+            sys.exit(e.response.text)
+        finally:
+            if token is not None:
+                _deadline.reset(token)
+
+    async def execute_stream(
+        self,
+        sequence: QueryFlowSequence,
+        input_data: dict,
+        deadline: float | None = None,
+    ):
+        """Executes a QueryFlow sequence, streaming the output of its last step.
+
+        Every step but the last one runs as in ``execute``, and the last one runs
+        with ``text_to_stream``, so each event is yielded as soon as it arrives. In a
+        retrieval and completion sequence the first token then arrives after the
+        retrieval steps and the first token of the completion, instead of after the
+        whole completion. The execution keeps its own deadline and stage labels, so
+        they do not apply to the code that consumes the events.
+
+        Args:
+            sequence (QueryFlowSequence): The sequence of QueryFlowSequenceProcessors to
+                execute, ending with a QueryFlowSequenceProcessor.
+            input_data (dict): The initial input with which to start the execution.
+            deadline (float): Seconds the whole execution, including the stream, may
+                take, or None for no limit.
+
+        Yields:
+            str: The data field of each event received from the last step.
+
+        Raises:
+            ValueError: If the last step of the sequence is not a
+                QueryFlowSequenceProcessor.
+            SystemExit: If the execution of any processor fails.
+            DeadlineExceeded: If the execution did not finish within the deadline.
+        """
+        context = contextvars.copy_context()
+        loop = asyncio.get_running_loop()
+        events = self._execute_stream(sequence, input_data, deadline)
+        try:
+            while True:
+                try:
+                    step = loop.create_task(_await(anext(events)), context=context)
+                    data = await step
+                except StopAsyncIteration:
+                    return
+                yield data
+        finally:
+            await loop.create_task(_await(events.aclose()), context=context)
+
+    async def _execute_stream(
+        self, sequence: QueryFlowSequence, input_data: dict, deadline: float | None
+    ):
+        """Run the steps of ``execute_stream``, in the context of the execution."""
+        head, last, name = self._split_stream_sequence(sequence)
+        _set_deadline(deadline)
+        try:
+            input_data = await self._within_deadline(
+                self._run_sequence(head, input_data)
+            )
+            with stage(name):
+                _remaining()
+                events = self.text_to_stream(last.processor, input_data, last.timeout)
+                try:
+                    while True:
+                        try:
+                            data = await self._within_deadline(anext(events))
+                        except StopAsyncIteration:
+                            return
+                        yield data
+                finally:
+                    await events.aclose()
+        except HTTPStatusError as e:
+            sys.exit(e.response.text)
+
+    @staticmethod
+    async def _within_deadline(awaitable: Awaitable):
+        """Await within the deadline of the execution, if it has one.
+
+        Raises:
+            DeadlineExceeded: If the deadline passes before the awaitable completes.
+        """
+        deadline = _deadline.get()
+        if deadline is None:
+            return await awaitable
+        expires, budget = deadline
+        try:
+            return await asyncio.wait_for(awaitable, expires - time.monotonic())
+        except (asyncio.TimeoutError, httpx.TimeoutException) as e:
+            if isinstance(e, DeadlineExceeded) or expires > time.monotonic():
+                raise
+            raise DeadlineExceeded(budget) from e
+
+    async def _run_sequence(
+        self, sequence: QueryFlowSequence, input_data: dict, prefix: str = ""
+    ):
+        """Run every step of a sequence and return the final response data."""
+        for index, step in enumerate(sequence.processors):
+            with stage(prefix + (step.name or str(index))):
+                input_data = await self._run_step(step, input_data)
+        return input_data
+
+    async def _run_step(
+        self, step: QueryFlowSequenceProcessor | QueryFlowParallel, input_data: dict
+    ):
+        """Run one step of a sequence and return its response data."""
+        _remaining()
+        if isinstance(step, QueryFlowParallel):
+            return step.merge(await self._run_branches(step, input_data))
+        return await self.text_to_text(step.processor, input_data, step.timeout)
+
+    async def _run_branches(self, step: QueryFlowParallel, input_data: dict):
+        """Run the branches of a parallel step concurrently.
+
+        Returns:
+            dict[str, dict]: The output of each branch, by branch name.
+
+        Raises:
+            Exception: The first exception raised by a branch. The other branches
+                are cancelled.
+        """
+        tasks = {
+            name: asyncio.ensure_future(
+                self._run_sequence(branch, input_data, f"{current_stage()}.{name}.")
+            )
+            for name, branch in step.branches.items()
+        }
+        if not tasks:
+            return {}
+        try:
+            done, _ = await asyncio.wait(
+                tasks.values(), return_when=asyncio.FIRST_EXCEPTION
+            )
+            for task in done:
+                if task.exception() is not None:
+                    raise task.exception()
+            return {name: task.result() for name, task in tasks.items()}
+        finally:
+            for task in tasks.values():
+                task.cancel()
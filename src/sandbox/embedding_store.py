@@ -0,0 +1,141 @@
+"""Persistent storage of text embeddings for the Sandbox SDK."""
+
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+from array import array
+from collections.abc import Callable, Sequence
+
+
+class EmbeddingStore:
+    """A SQLite store of embedding vectors keyed by model name and text hash.
+
+    Vectors are stored as packed little-endian float32 blobs, which takes a quarter of
+    the space of a JSON list of floats and survives process restarts. The store is safe
+    to share across threads.
+
+    Attributes:
+        path (str): The path of the SQLite database, or ``:memory:``.
+    """
+
+    def __init__(self, path: str | os.PathLike = ":memory:"):
+        """Open the store, creating the database if it does not exist.
+
+        Args:
+            path (str | os.PathLike): The path of the SQLite database file, or
+                ``:memory:`` for a store that is not persisted.
+        """
+        self.path = os.fspath(path)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        if self.path != ":memory:":
+            self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, "
+            "text_hash TEXT NOT NULL, "
+            "vector BLOB NOT NULL, "
+            "PRIMARY KEY (model, text_hash))"
+        )
+        self._connection.commit()
+
+    def __enter__(self):
+        """Return the store to be used as a context manager."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Close the store when leaving the context."""
+        self.close()
+
+    def __len__(self):
+        """Return the number of stored vectors."""
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        """Close the database connection."""
+        self._connection.close()
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        """Return the hash that identifies a text in the store.
+
+        Args:
+            text (str): The embedded text.
+
+        Returns:
+            str: The SHA-256 hex digest of the UTF-8 encoded text.
+        """
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def get(self, model: str, text: str):
+        """Return the stored vector of a text.
+
+        Args:
+            model (str): The name of the embedding model.
+            text (str): The embedded text.
+
+        Returns:
+            list[float]: The stored vector, or None if the text was not embedded yet.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT vector FROM embeddings WHERE model = ? AND text_hash = ?",
+                (model, self.text_hash(text)),
+            ).fetchone()
+        return self._unpack(row[0]) if row is not None else None
+
+    def put(self, model: str, text: str, vector: Sequence[float]):
+        """Store the vector of a text, replacing any previous one.
+
+        Args:
+            model (str): The name of the embedding model.
+            text (str): The embedded text.
+            vector (Sequence[float]): The embedding vector.
+        """
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) "
+                "VALUES (?, ?, ?)",
+                (model, self.text_hash(text), self._pack(vector)),
+            )
+            self._connection.commit()
+
+    def get_or_create(
+        self, model: str, text: str, embed: Callable[[str], Sequence[float]]
+    ):
+        """Return the stored vector of a text, embedding and storing it if missing.
+
+        Args:
+            model (str): The name of the embedding model.
+            text (str): The text to embed.
+            embed (Callable[[str], Sequence[float]]): Function that embeds the text
+                with the given model, only called on a miss.
+
+        Returns:
+            list[float]: The embedding vector.
+        """
+        vector = self.get(model, text)
+        if vector is None:
+            vector = embed(text)
+            self.put(model, text, vector)
+        return vector
+
+    @staticmethod
+    def _pack(vector: Sequence[float]) -> bytes:
+        """Return the vector as little-endian float32 bytes."""
+        packed = array("f", vector)
+        if sys.byteorder == "big":
+            packed.byteswap()
+        return packed.tobytes()
+
+    @staticmethod
+    def _unpack(blob: bytes) -> list[float]:
+        """Return the vector stored in little-endian float32 bytes."""
+        unpacked = array("f")
+        unpacked.frombytes(blob)
+        if sys.byteorder == "big":
+            unpacked.byteswap()
+        return unpacked.tolist()
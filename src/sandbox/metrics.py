@@ -0,0 +1,454 @@
+"""In-process metrics of the Sandbox SDK clients, with Prometheus and JSON exports."""
+
+import json
+import math
+import threading
+from bisect import bisect_left
+from collections.abc import Iterable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sandbox.observers import RequestEvent
+
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+"""Upper bounds, in seconds, of the default latency histogram buckets."""
+
+QUANTILES = (0.5, 0.95, 0.99)
+"""Quantiles included in the JSON export of histograms."""
+
+
+class Counter:
+    """A value that only goes up, such as a number of requests.
+
+    Attributes:
+        value (float): The current value.
+    """
+
+    def __init__(self):
+        """Initialize the Counter at zero."""
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        """Increase the counter.
+
+        Args:
+            amount (float): The amount to add, which must not be negative.
+
+        Raises:
+            ValueError: If the amount is negative.
+        """
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        with self._lock:
+            self.value += amount
+
+
+class Histogram:
+    """Counts observations, such as latencies, in cumulative buckets.
+
+    Quantiles are estimated by linear interpolation within the bucket that contains
+    them, the same way Prometheus ``histogram_quantile`` does, so their precision
+    depends on the bucket bounds.
+
+    Attributes:
+        buckets (tuple[float, ...]): The upper bounds of the buckets, ending in infinity.
+        count (int): Number of observations.
+        sum (float): Sum of the observed values.
+    """
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        """Initialize the Histogram with its bucket bounds.
+
+        Args:
+            buckets (Iterable[float]): The upper bounds of the buckets. An infinite
+                bucket is always added.
+        """
+        bounds = sorted(set(buckets) - {math.inf})
+        self.buckets = tuple(bounds) + (math.inf,)
+        self.count = 0
+        self.sum = 0.0
+        self._counts = [0] * len(self.buckets)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        """Record an observation.
+
+        Args:
+            value (float): The observed value.
+        """
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def cumulative_counts(self):
+        """Return the number of observations less than or equal to each bucket bound."""
+        with self._lock:
+            counts = list(self._counts)
+        total = 0
+        for index, count in enumerate(counts):
+            total += count
+            counts[index] = total
+        return counts
+
+    def quantile(self, q: float):
+        """Estimate a quantile of the observations.
+
+        Args:
+            q (float): The quantile, between 0 and 1.
+
+        Returns:
+            float: The estimated value, or None if nothing was observed. Quantiles
+                in the infinite bucket are reported as the largest finite bound.
+        """
+        counts = self.cumulative_counts()
+        total = counts[-1]
+        if total == 0:
+            return None
+        rank = q * total
+        index = bisect_left(counts, rank)
+        if index == len(self.buckets) - 1:
+            return self.buckets[-2] if len(self.buckets) > 1 else None
+        lower = self.buckets[index - 1] if index > 0 else 0.0
+        below = counts[index - 1] if index > 0 else 0
+        in_bucket = counts[index] - below
+        if in_bucket == 0:
+            return lower
+        return lower + (self.buckets[index] - lower) * (rank - below) / in_bucket
+
+
+class _Family:
+    """The metrics that share a name, one per combination of label values."""
+
+    def __init__(self, kind: str, documentation: str, buckets: tuple[float, ...]):
+        """Initialize the family with its type, description and histogram buckets."""
+        self.kind = kind
+        self.documentation = documentation
+        self.buckets = buckets
+        self.children = {}
+
+
+class MetricsRegistry:
+    """An in-process, thread-safe collection of counters and histograms.
+
+    Metrics are identified by name and labels, and are created the first time they
+    are requested.
+    """
+
+    def __init__(self):
+        """Initialize an empty registry."""
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labels: dict | None = None):
+        """Return the counter with the given name and labels, creating it if needed.
+
+        Args:
+            name (str): The metric name, which should end in ``_total``.
+            documentation (str): The description of the metric.
+            labels (dict): The label names and values.
+
+        Returns:
+            Counter: The counter.
+        """
+        return self._child("counter", name, documentation, labels, (), Counter)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labels: dict | None = None,
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ):
+        """Return the histogram with the given name and labels, creating it if needed.
+
+        Args:
+            name (str): The metric name.
+            documentation (str): The description of the metric.
+            labels (dict): The label names and values.
+            buckets (Iterable[float]): The bucket bounds, used when the first
+                histogram of this name is created.
+
+        Returns:
+            Histogram: The histogram.
+        """
+        return self._child(
+            "histogram", name, documentation, labels, tuple(buckets), Histogram
+        )
+
+    def _child(self, kind, name, documentation, labels, buckets, factory):
+        """Return the metric of a family, creating the family and metric if needed."""
+        key = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = _Family(kind, documentation, buckets)
+            elif family.kind != kind:
+                raise ValueError(f"Metric {name} is a {family.kind}, not a {kind}")
+            metric = family.children.get(key)
+            if metric is None:
+                metric = family.children[key] = (
+                    factory(family.buckets) if kind == "histogram" else factory()
+                )
+            return metric
+
+    def _snapshot(self):
+        """Return the families and their metrics, sorted by name and labels."""
+        with self._lock:
+            return [
+                (name, family, sorted(family.children.items()))
+                for name, family in sorted(self._families.items())
+            ]
+
+    def to_prometheus(self):
+        """Return every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics, one family after the other.
+        """
+        lines = []
+        for name, family, children in self._snapshot():
+            lines.append(f"# HELP {name} {_escape_help(family.documentation)}")
+            lines.append(f"# TYPE {name} {family.kind}")
+            for labels, metric in children:
+                if family.kind == "counter":
+                    lines.append(f"{name}{_labels(labels)} {_number(metric.value)}")
+                    continue
+                counts = metric.cumulative_counts()
+                for bound, count in zip(metric.buckets, counts):
+                    bucket_labels = _labels(labels + (("le", _number(bound)),))
+                    lines.append(f"{name}_bucket{bucket_labels} {count}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(metric.sum)}")
+                lines.append(f"{name}_count{_labels(labels)} {counts[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self):
+        """Return every metric as JSON serializable data.
+
+        Returns:
+            dict: The metric families by name. Counters have a ``value`` and
+                histograms a ``count``, ``sum`` and the ``p50``, ``p95`` and ``p99``
+                quantiles.
+        """
+        families = {}
+        for name, family, children in self._snapshot():
+            metrics = []
+            for labels, metric in children:
+                data = {"labels": dict(labels)}
+                if family.kind == "counter":
+                    data["value"] = metric.value
+                else:
+                    data["count"] = metric.count
+                    data["sum"] = metric.sum
+                    for q in QUANTILES:
+                        data[f"p{round(q * 100)}"] = metric.quantile(q)
+                metrics.append(data)
+            families[name] = {
+                "type": family.kind,
+                "help": family.documentation,
+                "metrics": metrics,
+            }
+        return families
+
+    def to_json(self):
+        """Return every metric as a JSON document."""
+        return json.dumps(self.to_dict())
+
+    def serve(self, host: str = "127.0.0.1", port: int = 0):
+        """Serve the metrics over HTTP from a background thread.
+
+        ``/metrics`` returns the Prometheus text format and ``/metrics.json`` the JSON
+        export.
+
+        Args:
+            host (str): The interface to listen on.
+            port (int): The port to listen on, 0 picks a free port.
+
+        Returns:
+            MetricsServer: The running server.
+        """
+        return MetricsServer(self, host, port)
+
+
+def _escape_help(text: str):
+    """Escape the text of a ``# HELP`` line."""
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _labels(labels: tuple[tuple[str, str], ...]):
+    """Return labels in the Prometheus ``{name="value"}`` syntax."""
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in labels
+    )
+    return "{" + pairs + "}"
+
+
+def _number(value: float):
+    """Return a number in the Prometheus text syntax."""
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """Answer scrapes with the metrics of the server's registry."""
+
+    def do_GET(self):
+        """Return the metrics in the format selected by the path."""
+        registry = self.server.registry
+        if self.path == "/metrics":
+            body = registry.to_prometheus().encode()
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path == "/metrics.json":
+            body = registry.to_json().encode()
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Silence the per-request access log."""
+
+
+class MetricsServer:
+    """A local HTTP endpoint that exposes a MetricsRegistry.
+
+    Attributes:
+        url (str): The base url the server is listening on.
+    """
+
+    def __init__(
+        self, registry: MetricsRegistry, host: str = "127.0.0.1", port: int = 0
+    ):
+        """Start serving the registry in a background thread.
+
+        Args:
+            registry (MetricsRegistry): The metrics to serve.
+            host (str): The interface to listen on.
+            port (int): The port to listen on, 0 picks a free port.
+        """
+        self._server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        self._server.daemon_threads = True
+        self._server.registry = registry
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        self.url = "http://%s:%d" % self._server.server_address[:2]
+
+    def __enter__(self):
+        """Return the server to be used as a context manager."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Stop the server when leaving the context."""
+        self.close()
+
+    def close(self):
+        """Stop the server and release the socket."""
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class MetricsObserver:
+    """A client observer that aggregates RequestEvents into a MetricsRegistry.
+
+    Metrics are labeled by processor type and stage. Requests to processors executed
+    by UUID have the ``uuid`` processor type, and requests sent outside of a sequence
+    or ``stage`` block have an empty stage.
+
+    Attributes:
+        registry (MetricsRegistry): The registry the metrics are recorded in.
+        prefix (str): The prefix of every metric name.
+    """
+
+    def __init__(self, registry: MetricsRegistry, prefix: str = "queryflow"):
+        """Initialize the MetricsObserver with its registry.
+
+        Args:
+            registry (MetricsRegistry): The registry to record the metrics in.
+            prefix (str): The prefix of every metric name.
+        """
+        self.registry = registry
+        self.prefix = prefix
+
+    def __call__(self, event: RequestEvent):
+        """Record the metrics of a completed request.
+
+        Args:
+            event (RequestEvent): The event of the request.
+        """
+        registry, prefix = self.registry, self.prefix
+        labels = {
+            "processor_type": event.processor_type or "uuid",
+            "stage": event.stage or "",
+        }
+        status = str(event.status) if event.status is not None else "error"
+        registry.counter(
+            f"{prefix}_requests_total",
+            "Requests sent to the sandbox, by response status.",
+            {**labels, "status": status},
+        ).inc()
+        registry.histogram(
+            f"{prefix}_request_duration_seconds",
+            "Time until the response body was received.",
+            labels,
+        ).observe(event.duration)
+        if event.time_to_first_byte is not None:
+            registry.histogram(
+                f"{prefix}_time_to_first_byte_seconds",
+                "Time until the response headers were received.",
+                labels,
+            ).observe(event.time_to_first_byte)
+        if event.connection_reused is False:
+            registry.counter(
+                f"{prefix}_connections_opened_total",
+                "Requests that had to open a new connection.",
+                labels,
+            ).inc()
+        registry.counter(
+            f"{prefix}_request_bytes_total", "Bytes sent in request bodies.", labels
+        ).inc(event.request_bytes)
+        registry.counter(
+            f"{prefix}_response_bytes_total",
+            "Bytes received in response bodies.",
+            labels,
+        ).inc(event.response_bytes)
+        if event.stream:
+            if event.time_to_first_event is not None:
+                registry.histogram(
+                    f"{prefix}_time_to_first_event_seconds",
+                    "Time until the first event of a stream was received.",
+                    labels,
+                ).observe(event.time_to_first_event)
+            registry.counter(
+                f"{prefix}_stream_events_total",
+                "Events received from streams.",
+                labels,
+            ).inc(event.events)
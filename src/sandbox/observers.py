@@ -0,0 +1,188 @@
+"""Request lifecycle events emitted by the Sandbox SDK clients."""
+
+import contextlib
+import contextvars
+import time
+
+import httpx
+
+_stage = contextvars.ContextVar("queryflow_stage", default=None)
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    """Label the requests sent inside the block with a stage name.
+
+    Sequence executions label each step automatically, so this is only needed to
+    group requests that are sent directly with ``text_to_text``.
+
+    Args:
+        name (str): The name of the stage.
+    """
+    token = _stage.set(name)
+    try:
+        yield
+    finally:
+        _stage.reset(token)
+
+
+def current_stage():
+    """Return the name of the stage being executed, or None outside of a stage."""
+    return _stage.get()
+
+
+class RequestEvent:
+    """Timings and sizes of one HTTP request sent by a client.
+
+    Every attempt is reported, so retried and hedged calls produce one event per
+    request sent. Timings are in seconds since the request started.
+
+    Attributes:
+        processor_type (str): The type of the Processor entity, or None for a UUID.
+        processor_id (str): The UUID of the processor, or None for an entity.
+        endpoint (str): The URL of the request, qualified by the processor type.
+        stream (bool): Whether the request was sent by ``text_to_stream``.
+        stage (str): The stage that sent the request, or None outside of a stage.
+        status (int): The response status code, or None if no response arrived.
+        error (BaseException): The exception raised by the request, or None.
+        connection_reused (bool): Whether a pooled connection was reused, or None if
+            the request failed before a connection was acquired.
+        connect_time (float): Time to open the connection, including TLS, or None if
+            a pooled connection was reused.
+        time_to_first_byte (float): Time until the response headers were received,
+            or None if no response arrived.
+        duration (float): Time until the response body was received.
+        request_bytes (int): Size of the request body.
+        response_bytes (int): Size of the response body as received.
+        time_to_first_event (float): For streams, time until the first event was
+            decoded, or None if no event arrived.
+        events (int): For streams, number of events received.
+    """
+
+    def __init__(
+        self,
+        processor_type: str | None,
+        processor_id: str | None,
+        endpoint: str,
+        stream: bool = False,
+        stage: str | None = None,
+    ):
+        """Initialize the RequestEvent of a request that is about to be sent.
+
+        Args:
+            processor_type (str): The type of the Processor entity, or None for a UUID.
+            processor_id (str): The UUID of the processor, or None for an entity.
+            endpoint (str): The URL of the request, qualified by the processor type.
+            stream (bool): Whether the request was sent by ``text_to_stream``.
+            stage (str): The stage that sent the request, or None outside of a stage.
+        """
+        self.processor_type = processor_type
+        self.processor_id = processor_id
+        self.endpoint = endpoint
+        self.stream = stream
+        self.stage = stage
+        self.status = None
+        self.error = None
+        self.connection_reused = None
+        self.connect_time = None
+        self.time_to_first_byte = None
+        self.duration = None
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.time_to_first_event = None
+        self.events = 0
+
+    @property
+    def ok(self):
+        """bool: Whether the request received a successful response."""
+        return self.error is None
+
+    @property
+    def events_per_second(self):
+        """float: For streams, events received per second of the request, or None."""
+        if not self.stream or not self.duration:
+            return None
+        return self.events / self.duration
+
+    def __repr__(self):
+        """Return a readable summary of the event."""
+        return (
+            f"RequestEvent(endpoint={self.endpoint!r}, status={self.status}, "
+            f"duration={self.duration}, connection_reused={self.connection_reused})"
+        )
+
+
+class RequestTrace:
+    """Builds the RequestEvent of one request from httpcore trace callbacks.
+
+    Attributes:
+        event (RequestEvent): The event being built.
+    """
+
+    def __init__(self, event: RequestEvent, request_bytes: int):
+        """Start timing a request.
+
+        Args:
+            event (RequestEvent): The event to fill in.
+            request_bytes (int): Size of the request body.
+        """
+        self.event = event
+        event.request_bytes = request_bytes
+        self._start = time.monotonic()
+        self._connect_start = None
+
+    def trace(self, name: str, info: dict):
+        """Record a step of the request, as an ``httpx`` ``trace`` extension.
+
+        Args:
+            name (str): The httpcore step, such as ``connection.connect_tcp.started``.
+            info (dict): The arguments or result of the step.
+        """
+        now = time.monotonic()
+        if name == "connection.connect_tcp.started":
+            self._connect_start = now
+        elif name in (
+            "connection.connect_tcp.complete",
+            "connection.start_tls.complete",
+        ):
+            self.event.connect_time = now - self._connect_start
+        elif name.endswith(".send_request_headers.started"):
+            self.event.connection_reused = self._connect_start is None
+        elif name.endswith(".receive_response_headers.complete"):
+            self.event.time_to_first_byte = now - self._start
+
+    async def atrace(self, name: str, info: dict):
+        """Record a step of the request, as an ``httpx.AsyncClient`` extension."""
+        self.trace(name, info)
+
+    def stream_event(self):
+        """Record an event decoded from the stream."""
+        if self.event.events == 0:
+            self.event.time_to_first_event = time.monotonic() - self._start
+        self.event.events += 1
+
+    def finish(
+        self,
+        response: httpx.Response | None = None,
+        error: BaseException | None = None,
+    ):
+        """Complete the event with the response or the error of the request.
+
+        Args:
+            response (httpx.Response): The received response, if any.
+            error (BaseException): The exception raised by the request, if any.
+
+        Returns:
+            RequestEvent: The completed event.
+        """
+        event = self.event
+        event.duration = time.monotonic() - self._start
+        event.error = error
+        if response is None and isinstance(error, httpx.HTTPStatusError):
+            response = error.response
+        if response is not None:
+            event.status = response.status_code
+            event.response_bytes = response.num_bytes_downloaded
+            if not event.response_bytes and not event.stream:
+                event.response_bytes = len(response.content)
+        return event
@@ -0,0 +1,732 @@
+"""Policies that shape how the Sandbox SDK clients send requests."""
+
+import asyncio
+import math
+import random
+import threading
+import time
+from collections import deque
+from collections.abc import Hashable, Iterable, Mapping
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+IDEMPOTENT_ACTIONS = frozenset({"autocomplete", "embeddings", "search", "vector"})
+"""Processor actions that can be safely sent more than once."""
+
+TRANSIENT_STATUSES = frozenset({429, 502, 503, 504})
+"""HTTP status codes of responses that are worth retrying."""
+
+OVERLOAD_STATUSES = frozenset({429, 503})
+"""HTTP status codes of responses that signal the upstream is overloaded."""
+
+
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+"""Transport errors raised before the request reached the upstream."""
+
+
+def _is_transient(error: Exception, statuses: frozenset[int]):
+    """Return whether the error is a transport error or has one of the given statuses."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in statuses
+    return isinstance(error, httpx.TransportError)
+
+
+def _retry_after(error: Exception):
+    """Return the seconds requested by the ``Retry-After`` header of a failed response.
+
+    Args:
+        error (Exception): The error raised by the request.
+
+    Returns:
+        float: The seconds to wait, or None if the response did not set the header.
+    """
+    if not isinstance(error, httpx.HTTPStatusError):
+        return None
+    value = error.response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class CircuitOpenError(Exception):
+    """Raised when a request is rejected because the circuit of its endpoint is open.
+
+    Attributes:
+        endpoint (Hashable): The endpoint whose circuit is open.
+        retry_after (float): Seconds until a trial request will be allowed.
+    """
+
+    def __init__(self, endpoint: Hashable, retry_after: float):
+        """Initialize the CircuitOpenError with endpoint and retry_after.
+
+        Args:
+            endpoint (Hashable): The endpoint whose circuit is open.
+            retry_after (float): Seconds until a trial request will be allowed.
+        """
+        super().__init__(
+            f"Circuit open for {endpoint}, retry in {retry_after:.1f} seconds"
+        )
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when an execution runs out of its time budget before it completes.
+
+    Attributes:
+        deadline (float): The time budget of the execution, in seconds.
+    """
+
+    def __init__(self, deadline: float):
+        """Initialize the DeadlineExceeded with the time budget that ran out.
+
+        Args:
+            deadline (float): The time budget of the execution, in seconds.
+        """
+        super().__init__(f"Deadline of {deadline:.3f} seconds exceeded")
+        self.deadline = deadline
+
+
+class RetryPolicy:
+    """Retries requests that failed with a transient error.
+
+    Waits grow exponentially with full jitter and are capped at ``max_backoff``. A
+    ``Retry-After`` header on the failed response takes precedence over the computed
+    wait, within the same cap.
+
+    Requests to processors whose action is not in ``actions``, or unknown, may have
+    run upstream before a transport error or a gateway status, so they are only
+    retried when they were never sent or the upstream rejected them as overloaded.
+
+    Attributes:
+        max_attempts (int): Maximum number of attempts, including the first one.
+        backoff (float): Seconds to wait before the first retry.
+        max_backoff (float): Maximum seconds to wait between attempts.
+        jitter (bool): Whether waits are randomized between zero and the backoff.
+        statuses (frozenset[int]): HTTP status codes that are retried.
+        actions (frozenset[str]): Processor actions that are retried after the
+            request may have reached the upstream.
+        retries (int): Number of retries that were made.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        jitter: bool = True,
+        statuses: Iterable[int] = TRANSIENT_STATUSES,
+        actions: Iterable[str] = IDEMPOTENT_ACTIONS,
+    ):
+        """Initialize the RetryPolicy.
+
+        Args:
+            max_attempts (int): Maximum number of attempts, including the first one.
+            backoff (float): Seconds to wait before the first retry.
+            max_backoff (float): Maximum seconds to wait between attempts.
+            jitter (bool): Whether waits are randomized between zero and the backoff.
+            statuses (Iterable[int]): HTTP status codes that are retried.
+            actions (Iterable[str]): Processor actions that are retried after the
+                request may have reached the upstream.
+        """
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = frozenset(statuses)
+        self.actions = frozenset(actions)
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def _retryable(self, error: Exception, action: str | None):
+        """Return whether a request of the given action may be sent again."""
+        if action in self.actions:
+            return _is_transient(error, self.statuses)
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in self.statuses & OVERLOAD_STATUSES
+        return isinstance(error, UNSENT_ERRORS)
+
+    def delay(self, error: Exception, attempt: int, action: str | None = None):
+        """Return the seconds to wait before retrying a failed attempt.
+
+        Args:
+            error (Exception): The error raised by the attempt.
+            attempt (int): The number of the failed attempt, starting at 1.
+            action (str): The processor action, or None if it is unknown.
+
+        Returns:
+            float: The seconds to wait, or None if the request must not be retried.
+        """
+        if attempt >= self.max_attempts or not self._retryable(error, action):
+            return None
+        with self._lock:
+            self.retries += 1
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        backoff = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return random.uniform(0, backoff) if self.jitter else backoff
+
+
+class CircuitBreaker:
+    """Fails fast while an endpoint is unhealthy.
+
+    Each endpoint starts closed. After ``failure_threshold`` consecutive transient
+    failures its circuit opens and requests are rejected with ``CircuitOpenError``
+    for ``recovery_time`` seconds. Then a single trial request is let through: the
+    circuit closes if it succeeds and opens again if it fails.
+
+    Attributes:
+        failure_threshold (int): Consecutive failures that open the circuit.
+        recovery_time (float): Seconds the circuit stays open before a trial request.
+        statuses (frozenset[int]): HTTP status codes that count as failures.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        recovery_time: float = 30.0,
+        statuses: Iterable[int] = TRANSIENT_STATUSES | {500},
+    ):
+        """Initialize the CircuitBreaker.
+
+        Args:
+            failure_threshold (int): Consecutive failures that open the circuit.
+            recovery_time (float): Seconds the circuit stays open before a trial request.
+            statuses (Iterable[int]): HTTP status codes that count as failures.
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.statuses = frozenset(statuses)
+        self._failures = {}
+        self._opened_at = {}
+        self._trials = set()
+        self._lock = threading.Lock()
+
+    def state(self, endpoint: Hashable):
+        """Return the state of the circuit of an endpoint.
+
+        Args:
+            endpoint (Hashable): The endpoint.
+
+        Returns:
+            str: ``closed``, ``open`` or ``half-open``.
+        """
+        with self._lock:
+            opened_at = self._opened_at.get(endpoint)
+            if opened_at is None:
+                return self.CLOSED
+            if time.monotonic() - opened_at < self.recovery_time:
+                return self.OPEN
+            return self.HALF_OPEN
+
+    def before(self, endpoint: Hashable):
+        """Check that a request to the endpoint may be sent.
+
+        Args:
+            endpoint (Hashable): The endpoint of the request.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with a trial
+                request already in flight.
+        """
+        with self._lock:
+            opened_at = self._opened_at.get(endpoint)
+            if opened_at is None:
+                return
+            remaining = self.recovery_time - (time.monotonic() - opened_at)
+            if remaining > 0 or endpoint in self._trials:
+                raise CircuitOpenError(endpoint, max(0.0, remaining))
+            self._trials.add(endpoint)
+
+    def success(self, endpoint: Hashable):
+        """Record a successful request and close the circuit of the endpoint.
+
+        Args:
+            endpoint (Hashable): The endpoint of the request.
+        """
+        with self._lock:
+            self._failures.pop(endpoint, None)
+            self._opened_at.pop(endpoint, None)
+            self._trials.discard(endpoint)
+
+    def abandon(self, endpoint: Hashable):
+        """Record a request that was cancelled before it completed.
+
+        Args:
+            endpoint (Hashable): The endpoint of the request.
+        """
+        with self._lock:
+            self._trials.discard(endpoint)
+
+    def failure(self, endpoint: Hashable, error: Exception):
+        """Record a failed request, opening the circuit if the endpoint is unhealthy.
+
+        Errors that do not indicate an unhealthy upstream, such as a 400 response,
+        count as a successful round trip.
+
+        Args:
+            endpoint (Hashable): The endpoint of the request.
+            error (Exception): The error raised by the request.
+        """
+        if not _is_transient(error, self.statuses):
+            self.success(endpoint)
+            return
+        with self._lock:
+            failures = self._failures.get(endpoint, 0) + 1
+            self._failures[endpoint] = failures
+            if endpoint in self._trials or failures >= self.failure_threshold:
+                self._opened_at[endpoint] = time.monotonic()
+            self._trials.discard(endpoint)
+
+
+class HedgingPolicy:
+    """Sends a second identical request when the first one has not answered in time.
+
+    The hedge is sent after ``delay`` seconds or, when ``delay`` is None, once the
+    request takes longer than the given percentile of recently observed latencies.
+    Whichever response arrives first is used. Hedges are paid for with a budget that
+    earns ``budget`` tokens per request, so they add at most that fraction of extra
+    load. Only processors whose action is idempotent are hedged. Processors executed
+    by UUID are never hedged because their action is unknown.
+
+    Attributes:
+        delay (float): Fixed seconds before hedging, or None to use the percentile.
+        percentile (float): Percentile of observed latencies used as the delay.
+        initial_delay (float): Delay used until ``min_samples`` latencies are observed.
+        min_samples (int): Number of latencies needed before the percentile is used.
+        budget (float): Fraction of requests that may be hedged.
+        max_tokens (float): Maximum number of hedges that can be saved up.
+        processor_types (frozenset[str]): Processor types that may be hedged, or None
+            for every type.
+        actions (frozenset[str]): Processor actions that may be hedged.
+        requests (int): Number of requests that were eligible for hedging.
+        hedges (int): Number of hedge requests that were sent.
+    """
+
+    _RESORT_INTERVAL = 32
+
+    def __init__(
+        self,
+        delay: float | None = None,
+        percentile: float = 0.95,
+        initial_delay: float = 1.0,
+        min_samples: int = 20,
+        window: int = 1000,
+        budget: float = 0.1,
+        max_tokens: float = 10.0,
+        processor_types: Iterable[str] | None = None,
+        actions: Iterable[str] = IDEMPOTENT_ACTIONS,
+    ):
+        """Initialize the HedgingPolicy.
+
+        Args:
+            delay (float): Fixed seconds before hedging, or None to use the percentile.
+            percentile (float): Percentile of observed latencies used as the delay.
+            initial_delay (float): Delay used until ``min_samples`` latencies are observed.
+            min_samples (int): Number of latencies needed before the percentile is used.
+            window (int): Number of recent latencies the percentile is computed from.
+            budget (float): Fraction of requests that may be hedged.
+            max_tokens (float): Maximum number of hedges that can be saved up.
+            processor_types (Iterable[str]): Processor types that may be hedged, or None
+                for every type.
+            actions (Iterable[str]): Processor actions that may be hedged.
+        """
+        self.delay = delay
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self.budget = budget
+        self.max_tokens = max_tokens
+        self.processor_types = (
+            frozenset(processor_types) if processor_types is not None else None
+        )
+        self.actions = frozenset(actions)
+        self.requests = 0
+        self.hedges = 0
+        self._latencies = deque(maxlen=window)
+        self._threshold = None
+        self._unsorted = 0
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+
+    def accepts(self, processor_type: str | None, action: str | None):
+        """Return whether requests to the given processor may be hedged.
+
+        Args:
+            processor_type (str): The processor type, or None if it is unknown.
+            action (str): The processor action, or None if it is unknown.
+
+        Returns:
+            bool: Whether the processor is idempotent and opted in to hedging.
+        """
+        if processor_type is None or action not in self.actions:
+            return False
+        return self.processor_types is None or processor_type in self.processor_types
+
+    def hedge_delay(self):
+        """Return the seconds to wait before sending a hedge request."""
+        if self.delay is not None:
+            return self.delay
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return self.initial_delay
+            if self._threshold is None or self._unsorted >= self._RESORT_INTERVAL:
+                ordered = sorted(self._latencies)
+                index = min(len(ordered) - 1, math.ceil(self.percentile * len(ordered)) - 1)
+                self._threshold = ordered[index]
+                self._unsorted = 0
+            return self._threshold
+
+    def start(self):
+        """Count an eligible request and earn its share of the hedging budget."""
+        with self._lock:
+            self.requests += 1
+            self._tokens = min(self.max_tokens, self._tokens + self.budget)
+
+    def acquire(self):
+        """Spend one hedge from the budget.
+
+        Returns:
+            bool: Whether the budget allowed sending a hedge request.
+        """
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            self.hedges += 1
+            return True
+
+    def record(self, latency: float):
+        """Record the latency of an answered request.
+
+        Args:
+            latency (float): Seconds until the response was received.
+        """
+        with self._lock:
+            self._latencies.append(latency)
+            self._unsorted += 1
+
+
+class RateLimiter:
+    """Paces requests with a token bucket per upstream.
+
+    Each bucket refills at the rate of its server type up to ``burst`` tokens, and
+    every request takes one token. When the bucket is empty the request waits until
+    its token has been refilled, so bursts of bulk work are spread out at the
+    configured rate instead of turning into 429 responses. Buckets are keyed by the
+    ``Server.type`` of the processor, or by server type and credential when
+    ``per_credential`` is set, since upstream quotas usually belong to an API key.
+
+    Attributes:
+        rates (dict[str, float]): Requests per second allowed for each server type.
+        default_rate (float): Requests per second for other server types and for
+            processors executed by UUID, or None to not limit them.
+        burst (float): Maximum number of requests sent at once after an idle period,
+            or None for one second worth of requests.
+        per_credential (bool): Whether each credential gets its own buckets.
+        waits (int): Number of requests that had to wait for a token.
+    """
+
+    def __init__(
+        self,
+        rates: Mapping[str, float] | None = None,
+        default_rate: float | None = None,
+        burst: float | None = None,
+        per_credential: bool = False,
+    ):
+        """Initialize the RateLimiter.
+
+        Args:
+            rates (Mapping[str, float]): Requests per second allowed for each server
+                type, such as ``{"openai": 50, "elasticsearch": 500}``.
+            default_rate (float): Requests per second for other server types and for
+                processors executed by UUID, or None to not limit them.
+            burst (float): Maximum number of requests sent at once after an idle
+                period, or None for one second worth of requests.
+            per_credential (bool): Whether each credential gets its own buckets.
+        """
+        self.rates = dict(rates or {})
+        self.default_rate = default_rate
+        self.burst = burst
+        self.per_credential = per_credential
+        self.waits = 0
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def rate(self, server_type: str | None):
+        """Return the requests per second allowed for a server type, or None."""
+        if server_type is None:
+            return self.default_rate
+        return self.rates.get(server_type, self.default_rate)
+
+    def reserve(self, server_type: str | None, credential: Hashable = None):
+        """Take a token for a request and return how long it must wait for it.
+
+        Tokens are reserved in order, so concurrent requests are spaced out evenly.
+
+        Args:
+            server_type (str): The server type of the request, or None if unknown.
+            credential (Hashable): A key of the credential of the request, if any.
+
+        Returns:
+            float: The seconds to wait before sending the request.
+        """
+        rate = self.rate(server_type)
+        if rate is None:
+            return 0.0
+        capacity = self.burst if self.burst is not None else max(1.0, rate)
+        key = (server_type, credential) if self.per_credential else server_type
+        with self._lock:
+            now = time.monotonic()
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate) - 1
+            self._buckets[key] = (tokens, now)
+            if tokens >= 0:
+                return 0.0
+            self.waits += 1
+        return -tokens / rate
+
+
+def _wake(waiter: asyncio.Future):
+    """Resolve a waiting future unless it was already resolved or cancelled."""
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class _Window:
+    """The AIMD state of one upstream of an AdaptiveConcurrency."""
+
+    def __init__(self, limit: float):
+        """Start the window at the given limit."""
+        self.limit = limit
+        self.in_flight = 0
+        self.latency = None
+        self.decreased_at = -math.inf
+        self.waiters = []
+
+
+class AdaptiveConcurrency:
+    """Limits the requests in flight per upstream, adapting the limit with AIMD.
+
+    Every successful request sent while the window is in use grows the limit of its
+    upstream by ``1 / limit``, about one more request per round trip. A response with
+    one of ``statuses``, a timeout, or a latency above ``latency_tolerance`` times
+    the smoothed latency multiplies the limit by ``backoff``. Requests that were sent
+    before the last decrease do not decrease it again, so one congestion event halves
+    the limit once instead of once per request in flight. Throughput then settles
+    near the capacity of the upstream instead of oscillating between 429 storms.
+
+    Windows are keyed by ``Server.type``, or by server type and credential when
+    ``per_credential`` is set. The same instance can be shared by synchronous and
+    asynchronous clients.
+
+    Attributes:
+        initial_limit (float): Requests in flight allowed before any feedback.
+        min_limit (int): The limit never drops below this number of requests.
+        max_limit (int): The limit never grows above this number of requests.
+        backoff (float): Factor applied to the limit on congestion.
+        latency_tolerance (float): Latency, relative to the smoothed latency, that
+            counts as congestion, or None to only react to errors.
+        statuses (frozenset[int]): HTTP status codes that count as congestion.
+        per_credential (bool): Whether each credential gets its own window.
+        decreases (int): Number of times a limit was decreased.
+    """
+
+    _SMOOTHING = 0.05
+
+    def __init__(
+        self,
+        initial_limit: float = 8,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        backoff: float = 0.5,
+        latency_tolerance: float | None = 2.0,
+        statuses: Iterable[int] = OVERLOAD_STATUSES,
+        per_credential: bool = False,
+    ):
+        """Initialize the AdaptiveConcurrency.
+
+        Args:
+            initial_limit (float): Requests in flight allowed before any feedback.
+            min_limit (int): The limit never drops below this number of requests.
+            max_limit (int): The limit never grows above this number of requests.
+            backoff (float): Factor applied to the limit on congestion.
+            latency_tolerance (float): Latency, relative to the smoothed latency,
+                that counts as congestion, or None to only react to errors.
+            statuses (Iterable[int]): HTTP status codes that count as congestion.
+            per_credential (bool): Whether each credential gets its own window.
+        """
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.statuses = frozenset(statuses)
+        self.per_credential = per_credential
+        self.decreases = 0
+        self._windows = {}
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+
+    def _window(self, server_type: str | None, credential: Hashable):
+        """Return the window of an upstream, creating it if needed.
+
+        Must be called with the lock held.
+        """
+        key = (server_type, credential) if self.per_credential else server_type
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = _Window(self.initial_limit)
+        return window
+
+    def _admit(self, window: _Window):
+        """Take a slot of the window if one is free.
+
+        Must be called with the lock held.
+        """
+        if window.in_flight >= max(self.min_limit, int(window.limit)):
+            return False
+        window.in_flight += 1
+        return True
+
+    def limit(self, server_type: str | None, credential: Hashable = None):
+        """Return the current limit of an upstream.
+
+        Args:
+            server_type (str): The server type, or None if unknown.
+            credential (Hashable): A key of the credential, if any.
+
+        Returns:
+            float: The number of requests that may be in flight.
+        """
+        with self._lock:
+            return self._window(server_type, credential).limit
+
+    def acquire(
+        self,
+        server_type: str | None,
+        credential: Hashable = None,
+        timeout: float | None = None,
+    ):
+        """Wait for a free slot in the window of an upstream.
+
+        Args:
+            server_type (str): The server type of the request, or None if unknown.
+            credential (Hashable): A key of the credential of the request, if any.
+            timeout (float): Maximum seconds to wait, or None to wait indefinitely.
+
+        Returns:
+            bool: Whether a slot was acquired before the timeout.
+        """
+        with self._condition:
+            window = self._window(server_type, credential)
+            return self._condition.wait_for(lambda: self._admit(window), timeout)
+
+    async def acquire_async(
+        self,
+        server_type: str | None,
+        credential: Hashable = None,
+        timeout: float | None = None,
+    ):
+        """Wait for a free slot in the window of an upstream without blocking the loop.
+
+        Args:
+            server_type (str): The server type of the request, or None if unknown.
+            credential (Hashable): A key of the credential of the request, if any.
+            timeout (float): Maximum seconds to wait, or None to wait indefinitely.
+
+        Returns:
+            bool: Whether a slot was acquired before the timeout.
+        """
+        loop = asyncio.get_running_loop()
+        expires = None if timeout is None else loop.time() + timeout
+        while True:
+            with self._lock:
+                window = self._window(server_type, credential)
+                if self._admit(window):
+                    return True
+                waiter = loop.create_future()
+                window.waiters.append(waiter)
+            remaining = None if expires is None else expires - loop.time()
+            try:
+                await asyncio.wait_for(waiter, remaining)
+            except TimeoutError:
+                return False
+            finally:
+                with self._lock:
+                    if waiter in window.waiters:
+                        window.waiters.remove(waiter)
+
+    def release(
+        self,
+        server_type: str | None,
+        credential: Hashable = None,
+        start: float | None = None,
+        error: BaseException | None = None,
+    ):
+        """Free the slot of a completed request and adapt the limit to its outcome.
+
+        Args:
+            server_type (str): The server type of the request, or None if unknown.
+            credential (Hashable): A key of the credential of the request, if any.
+            start (float): The ``time.monotonic`` time the request was sent, or None
+                to free the slot without adapting the limit.
+            error (BaseException): The error raised by the request, if any.
+        """
+        now = time.monotonic()
+        with self._condition:
+            window = self._window(server_type, credential)
+            in_use = window.in_flight >= window.limit / 2
+            window.in_flight -= 1
+            if start is not None and isinstance(error, Exception | None):
+                self._adapt(window, start, now - start, in_use, error)
+            self._condition.notify_all()
+            waiters, window.waiters = window.waiters, []
+        for waiter in waiters:
+            waiter.get_loop().call_soon_threadsafe(_wake, waiter)
+
+    def _adapt(
+        self,
+        window: _Window,
+        start: float,
+        latency: float,
+        in_use: bool,
+        error: Exception | None,
+    ):
+        """Grow or shrink the limit of a window. Must be called with the lock held."""
+        if error is None:
+            congested = (
+                self.latency_tolerance is not None
+                and window.latency is not None
+                and latency > self.latency_tolerance * window.latency
+            )
+            if window.latency is None:
+                window.latency = latency
+            else:
+                window.latency += self._SMOOTHING * (latency - window.latency)
+        elif isinstance(error, httpx.HTTPStatusError):
+            congested = error.response.status_code in self.statuses
+        else:
+            congested = isinstance(error, httpx.TimeoutException)
+        if congested:
+            if start >= window.decreased_at:
+                window.limit = max(self.min_limit, window.limit * self.backoff)
+                window.decreased_at = time.monotonic()
+                self.decreases += 1
+        elif error is None and in_use:
+            window.limit = min(self.max_limit, window.limit + 1 / window.limit)
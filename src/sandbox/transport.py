@@ -0,0 +1,440 @@
+"""Transports that record sandbox traffic to a file and replay it without a network."""
+
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+import httpx
+
+_EXCLUDED_HEADERS = frozenset({"set-cookie"})
+
+
+class ReplayMissError(LookupError):
+    """Raised when a replayed request was not found in the recording."""
+
+
+def _request_key(request: httpx.Request, body: bytes):
+    """Return the key that matches a request with its recorded exchanges.
+
+    Requests are matched by method, path, ``Accept`` header and a digest of the body,
+    so a call and a stream of the same input are told apart. Other headers and the
+    query parameters are ignored, so recordings can be replayed with other API keys
+    and timeouts.
+    """
+    digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+    return request.method, request.url.path, request.headers.get("Accept", ""), digest
+
+
+def _open(path: str | os.PathLike, mode: str):
+    """Open a recording, compressed with gzip if its name ends in ``.gz``."""
+    if os.fspath(path).endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class Exchange:
+    """A recorded request and the response it received, with its timing.
+
+    Only a digest of the request body is kept, so credentials sent in Processor
+    entities are never written to the recording.
+
+    Attributes:
+        key (tuple[str, str, str, str]): The method, path, ``Accept`` header and body
+            digest of the request.
+        status (int): The response status code.
+        headers (list[tuple[str, str]]): The response headers.
+        headers_time (float): Seconds until the response headers were received.
+        chunks (list[tuple[float, bytes]]): The response body as received, with the
+            seconds since the request started at which each chunk arrived.
+    """
+
+    def __init__(
+        self,
+        key: tuple[str, str, str, str],
+        status: int,
+        headers: list[tuple[str, str]],
+        headers_time: float,
+        chunks: list[tuple[float, bytes]] | None = None,
+    ):
+        """Initialize the Exchange.
+
+        Args:
+            key (tuple[str, str, str, str]): The method, path, ``Accept`` header and
+                body digest of the request.
+            status (int): The response status code.
+            headers (list[tuple[str, str]]): The response headers.
+            headers_time (float): Seconds until the response headers were received.
+            chunks (list[tuple[float, bytes]]): The response body chunks with their
+                arrival times.
+        """
+        self.key = key
+        self.status = status
+        self.headers = headers
+        self.headers_time = headers_time
+        self.chunks = chunks if chunks is not None else []
+
+    def to_json(self):
+        """Return the exchange as one line of JSON.
+
+        The body is stored once, as text when it is valid UTF-8 and base64 otherwise,
+        and each chunk is stored as its arrival time and end offset in the body.
+        """
+        body = b"".join(chunk for _, chunk in self.chunks)
+        try:
+            encoding, data = "utf-8", body.decode("utf-8")
+        except UnicodeDecodeError:
+            encoding, data = "base64", base64.b64encode(body).decode("ascii")
+        ends, end = [], 0
+        for offset, chunk in self.chunks:
+            end += len(chunk)
+            ends.append([round(offset, 6), end])
+        return json.dumps(
+            {
+                "method": self.key[0],
+                "path": self.key[1],
+                "accept": self.key[2],
+                "body": self.key[3],
+                "status": self.status,
+                "headers": self.headers,
+                "headers_time": round(self.headers_time, 6),
+                "chunks": ends,
+                "encoding": encoding,
+                "data": data,
+            },
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+
+    @classmethod
+    def from_json(cls, line: str):
+        """Return the exchange stored in one line of JSON."""
+        data = json.loads(line)
+        if data["encoding"] == "base64":
+            body = base64.b64decode(data["data"])
+        else:
+            body = data["data"].encode("utf-8")
+        chunks, start = [], 0
+        for offset, end in data["chunks"]:
+            chunks.append((offset, body[start:end]))
+            start = end
+        return cls(
+            (data["method"], data["path"], data["accept"], data["body"]),
+            data["status"],
+            [tuple(header) for header in data["headers"]],
+            data["headers_time"],
+            chunks,
+        )
+
+
+class _Recording:
+    """Appends exchanges to a recording file from any thread."""
+
+    def __init__(self, path: str | os.PathLike):
+        """Create the recording file, replacing an existing one."""
+        self._file = _open(path, "w")
+        self._lock = threading.Lock()
+
+    def write(self, exchange: Exchange):
+        """Append an exchange to the file."""
+        line = exchange.to_json() + "\n"
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line)
+                self._file.flush()
+
+    def close(self):
+        """Close the file."""
+        with self._lock:
+            self._file.close()
+
+
+def _recorded_response(response: httpx.Response, exchange: Exchange, stream):
+    """Return a copy of the response that reads its body through the given stream."""
+    exchange.headers = [
+        (name, value)
+        for name, value in response.headers.multi_items()
+        if name.lower() not in _EXCLUDED_HEADERS
+    ]
+    return httpx.Response(
+        response.status_code,
+        headers=response.headers,
+        stream=stream,
+        extensions=response.extensions,
+    )
+
+
+class _RecordingStream(httpx.SyncByteStream):
+    """Records the chunks of a response body as they are read."""
+
+    def __init__(
+        self, stream, exchange: Exchange, start: float, recording: _Recording
+    ):
+        """Wrap the body stream of the response being recorded."""
+        self._stream = stream
+        self._exchange = exchange
+        self._start = start
+        self._recording = recording
+
+    def __iter__(self):
+        """Yield the chunks of the body, recording their arrival times."""
+        for chunk in self._stream:
+            self._exchange.chunks.append((time.monotonic() - self._start, chunk))
+            yield chunk
+
+    def close(self):
+        """Close the body stream and write the exchange to the recording."""
+        self._stream.close()
+        self._recording.write(self._exchange)
+
+
+class _AsyncRecordingStream(httpx.AsyncByteStream):
+    """Records the chunks of a response body as they are read."""
+
+    def __init__(
+        self, stream, exchange: Exchange, start: float, recording: _Recording
+    ):
+        """Wrap the body stream of the response being recorded."""
+        self._stream = stream
+        self._exchange = exchange
+        self._start = start
+        self._recording = recording
+
+    async def __aiter__(self):
+        """Yield the chunks of the body, recording their arrival times."""
+        async for chunk in self._stream:
+            self._exchange.chunks.append((time.monotonic() - self._start, chunk))
+            yield chunk
+
+    async def aclose(self):
+        """Close the body stream and write the exchange to the recording."""
+        await self._stream.aclose()
+        self._recording.write(self._exchange)
+
+
+class RecordingTransport(httpx.BaseTransport):
+    """Sends requests through another transport and records every exchange.
+
+    Each exchange is written to the recording once its response body has been read
+    or closed, including the arrival time of every chunk of ``text/event-stream``
+    responses.
+    """
+
+    def __init__(
+        self, path: str | os.PathLike, transport: httpx.BaseTransport | None = None
+    ):
+        """Create the recording and wrap the transport.
+
+        Args:
+            path (str | os.PathLike): The recording file, compressed with gzip if
+                its name ends in ``.gz``. An existing file is replaced.
+            transport (httpx.BaseTransport): The transport that sends the requests,
+                defaults to a new ``httpx.HTTPTransport``.
+        """
+        self._transport = transport if transport is not None else httpx.HTTPTransport()
+        self._recording = _Recording(path)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        """Send the request and record its response as it is read."""
+        key = _request_key(request, request.read())
+        start = time.monotonic()
+        response = self._transport.handle_request(request)
+        exchange = Exchange(key, response.status_code, [], time.monotonic() - start)
+        return _recorded_response(
+            response,
+            exchange,
+            _RecordingStream(response.stream, exchange, start, self._recording),
+        )
+
+    def close(self):
+        """Close the wrapped transport and the recording."""
+        self._transport.close()
+        self._recording.close()
+
+
+class AsyncRecordingTransport(httpx.AsyncBaseTransport):
+    """The asyncio version of RecordingTransport."""
+
+    def __init__(
+        self,
+        path: str | os.PathLike,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        """Create the recording and wrap the transport.
+
+        Args:
+            path (str | os.PathLike): The recording file, compressed with gzip if
+                its name ends in ``.gz``. An existing file is replaced.
+            transport (httpx.AsyncBaseTransport): The transport that sends the
+                requests, defaults to a new ``httpx.AsyncHTTPTransport``.
+        """
+        self._transport = (
+            transport if transport is not None else httpx.AsyncHTTPTransport()
+        )
+        self._recording = _Recording(path)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        """Send the request and record its response as it is read."""
+        key = _request_key(request, await request.aread())
+        start = time.monotonic()
+        response = await self._transport.handle_async_request(request)
+        exchange = Exchange(key, response.status_code, [], time.monotonic() - start)
+        return _recorded_response(
+            response,
+            exchange,
+            _AsyncRecordingStream(response.stream, exchange, start, self._recording),
+        )
+
+    async def aclose(self):
+        """Close the wrapped transport and the recording."""
+        await self._transport.aclose()
+        self._recording.close()
+
+
+class _Replay:
+    """The exchanges of a recording, served in recorded order for each request key."""
+
+    def __init__(self, path: str | os.PathLike):
+        """Load every exchange of the recording."""
+        self._exchanges = {}
+        with _open(path, "r") as file:
+            for line in file:
+                if line.strip():
+                    exchange = Exchange.from_json(line)
+                    self._exchanges.setdefault(exchange.key, []).append(exchange)
+        self._positions = dict.fromkeys(self._exchanges, 0)
+        self._lock = threading.Lock()
+
+    def next(self, request: httpx.Request, body: bytes):
+        """Return the next recorded exchange of the request.
+
+        Requests sent more times than they were recorded cycle through their
+        recorded exchanges again.
+
+        Raises:
+            ReplayMissError: If the request was never recorded.
+        """
+        key = _request_key(request, body)
+        with self._lock:
+            exchanges = self._exchanges.get(key)
+            if exchanges is None:
+                raise ReplayMissError(
+                    f"No recorded response for {request.method} {request.url}"
+                )
+            position = self._positions[key]
+            self._positions[key] = position + 1
+        return exchanges[position % len(exchanges)]
+
+
+class _ReplayStream(httpx.SyncByteStream):
+    """Yields the recorded chunks of a response, optionally at their recorded times."""
+
+    def __init__(self, exchange: Exchange, start: float, speed: float | None):
+        """Replay the body of the exchange for a request sent at ``start``."""
+        self._exchange = exchange
+        self._start = start
+        self._speed = speed
+
+    def __iter__(self):
+        """Yield the recorded chunks of the body."""
+        for offset, chunk in self._exchange.chunks:
+            if self._speed:
+                delay = self._start + offset / self._speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            yield chunk
+
+
+class _AsyncReplayStream(httpx.AsyncByteStream):
+    """Yields the recorded chunks of a response, optionally at their recorded times."""
+
+    def __init__(self, exchange: Exchange, start: float, speed: float | None):
+        """Replay the body of the exchange for a request sent at ``start``."""
+        self._exchange = exchange
+        self._start = start
+        self._speed = speed
+
+    async def __aiter__(self):
+        """Yield the recorded chunks of the body."""
+        for offset, chunk in self._exchange.chunks:
+            if self._speed:
+                delay = self._start + offset / self._speed - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield chunk
+
+
+class ReplayTransport(httpx.BaseTransport):
+    """Answers requests with the responses of a recording, without a network.
+
+    Attributes:
+        speed (float): How much faster than recorded responses are replayed, or None
+            to replay them as fast as possible.
+    """
+
+    def __init__(self, path: str | os.PathLike, speed: float | None = None):
+        """Load the recording.
+
+        Args:
+            path (str | os.PathLike): The file written by a RecordingTransport.
+            speed (float): How much faster than recorded responses are replayed, 1
+                for the recorded timing, or None to replay them as fast as possible.
+        """
+        self.speed = speed
+        self._replay = _Replay(path)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        """Return the recorded response of the request.
+
+        Raises:
+            ReplayMissError: If the request was never recorded.
+        """
+        start = time.monotonic()
+        exchange = self._replay.next(request, request.read())
+        if self.speed:
+            time.sleep(exchange.headers_time / self.speed)
+        return httpx.Response(
+            exchange.status,
+            headers=exchange.headers,
+            stream=_ReplayStream(exchange, start, self.speed),
+        )
+
+
+class AsyncReplayTransport(httpx.AsyncBaseTransport):
+    """The asyncio version of ReplayTransport.
+
+    Attributes:
+        speed (float): How much faster than recorded responses are replayed, or None
+            to replay them as fast as possible.
+    """
+
+    def __init__(self, path: str | os.PathLike, speed: float | None = None):
+        """Load the recording.
+
+        Args:
+            path (str | os.PathLike): The file written by a RecordingTransport.
+            speed (float): How much faster than recorded responses are replayed, 1
+                for the recorded timing, or None to replay them as fast as possible.
+        """
+        self.speed = speed
+        self._replay = _Replay(path)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        """Return the recorded response of the request.
+
+        Raises:
+            ReplayMissError: If the request was never recorded.
+        """
+        start = time.monotonic()
+        exchange = self._replay.next(request, await request.aread())
+        if self.speed:
+            await asyncio.sleep(exchange.headers_time / self.speed)
+        return httpx.Response(
+            exchange.status,
+            headers=exchange.headers,
+            stream=_AsyncReplayStream(exchange, start, self.speed),
+        )
@@ -0,0 +1,326 @@
+"""Tests for the cache module."""
+
+import asyncio
+import random
+import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from mockito import unstub, when
+
+from sandbox.cache import AsyncSingleFlight, ResponseCache, SingleFlight
+
+
+def _key():
+    """Return a random cache key."""
+    return (
+        "".join(random.choices(string.ascii_letters, k=5)),
+        "".join(random.choices(string.ascii_letters, k=5)),
+    )
+
+
+class TestResponseCache:
+    """Tests for the ResponseCache class."""
+
+    def test_get_and_put(self):
+        """Test cached responses are returned and hits and misses are counted."""
+        cache = ResponseCache()
+        key = _key()
+        value = "".join(random.choices(string.ascii_letters, k=5)).encode()
+
+        assert cache.get(key) is None
+        cache.put(key, value)
+
+        assert cache.get(key) is value
+        assert cache.hits == 1
+        assert cache.misses == 1
+
+    def test_get_default(self):
+        """Test the default is returned for a missing key, even if None is cached."""
+        cache = ResponseCache()
+        key = _key()
+        missing = object()
+
+        assert cache.get(key, missing) is missing
+        cache.put(key, None)
+        assert cache.get(key, missing) is None
+
+    def test_lru_eviction(self):
+        """Test the least recently used response is evicted when the cache is full."""
+        cache = ResponseCache(maxsize=2)
+        first, second, third = _key(), _key(), _key()
+        cache.put(first, b"1")
+        cache.put(second, b"2")
+        cache.get(first)
+        cache.put(third, b"3")
+
+        assert len(cache) == 2
+        assert cache.get(first) == b"1"
+        assert cache.get(second) is None
+        assert cache.get(third) == b"3"
+
+    def test_ttl_expiration(self):
+        """Test responses expire once their time to live has passed."""
+        cache = ResponseCache(ttl=10)
+        key = _key()
+        when(time).monotonic().thenReturn(100.0)
+        cache.put(key, b"value")
+
+        when(time).monotonic().thenReturn(109.0)
+        assert cache.get(key) == b"value"
+
+        when(time).monotonic().thenReturn(110.0)
+        assert cache.get(key) is None
+        assert len(cache) == 0
+        unstub()
+
+    def test_accepts(self):
+        """Test the processor type and processor ID opt-in filters."""
+        processor_id = "".join(random.choices(string.ascii_letters, k=5))
+        everything = ResponseCache()
+        filtered = ResponseCache(
+            processor_types=["openai"], processor_ids=[processor_id]
+        )
+
+        assert everything.accepts("elasticsearch", None)
+        assert everything.accepts(None, processor_id)
+        assert filtered.accepts("openai", None)
+        assert not filtered.accepts("elasticsearch", None)
+        assert filtered.accepts(None, processor_id)
+        assert not filtered.accepts(None, "other")
+
+    def test_invalidate(self):
+        """Test responses are removed by processor, by input, or all at once."""
+        cache = ResponseCache()
+        for processor_key in ("a", "b"):
+            for input_key in ("x", "y"):
+                cache.put((processor_key, input_key), b"value")
+
+        assert cache.invalidate(processor_key="a") == 2
+        assert cache.invalidate(input_key="x") == 1
+        assert cache.get(("b", "y")) == b"value"
+        assert cache.invalidate("b", "y") == 1
+        cache.put(("c", "z"), b"value")
+        assert cache.invalidate() == 1
+        assert len(cache) == 0
+
+    def test_clear(self):
+        """Test clear removes every response and resets the counters."""
+        cache = ResponseCache()
+        key = _key()
+        cache.put(key, b"value")
+        cache.get(key)
+        cache.get(_key())
+
+        cache.clear()
+
+        assert len(cache) == 0
+        assert cache.hits == 0
+        assert cache.misses == 0
+
+
+class TestSingleFlight:
+    """Tests for the SingleFlight class."""
+
+    def test_coalesces_concurrent_calls(self):
+        """Test identical calls in flight wait for the first one."""
+        single_flight = SingleFlight()
+        release = threading.Event()
+        executions = []
+
+        def call():
+            executions.append(1)
+            release.wait(5)
+            return "result"
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            futures = [executor.submit(single_flight.do, "key", call) for _ in range(5)]
+            deadline = time.monotonic() + 5
+            while single_flight.coalesced < 4 and time.monotonic() < deadline:
+                time.sleep(0.001)
+            release.set()
+            results = [future.result() for future in futures]
+
+        assert results == ["result"] * 5
+        assert executions == [1]
+        assert single_flight.calls == 1
+        assert single_flight.coalesced == 4
+
+    def test_sequential_calls_are_executed(self):
+        """Test calls that do not overlap are executed every time."""
+        single_flight = SingleFlight()
+
+        assert single_flight.do("key", lambda: 1) == 1
+        assert single_flight.do("key", lambda: 2) == 2
+        assert single_flight.do("other", lambda: 3) == 3
+        assert single_flight.calls == 3
+        assert single_flight.coalesced == 0
+
+    def test_exception_is_shared(self):
+        """Test the exception of the call is raised to every waiting caller."""
+        single_flight = SingleFlight()
+        release = threading.Event()
+
+        def call():
+            release.wait(5)
+            raise ValueError("failed")
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [executor.submit(single_flight.do, "key", call) for _ in range(3)]
+            deadline = time.monotonic() + 5
+            while single_flight.coalesced < 2 and time.monotonic() < deadline:
+                time.sleep(0.001)
+            release.set()
+            for future in futures:
+                with pytest.raises(ValueError):
+                    future.result()
+
+        assert single_flight.do("key", lambda: "recovered") == "recovered"
+
+    def test_wait_timeout(self):
+        """Test a waiting caller gives up after its timeout without the call failing."""
+        single_flight = SingleFlight()
+        release = threading.Event()
+
+        def call():
+            release.wait(5)
+            return "result"
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            leader = executor.submit(single_flight.do, "key", call)
+            while not single_flight.calls:
+                time.sleep(0.001)
+            with pytest.raises(TimeoutError):
+                single_flight.do("key", call, timeout=0.01)
+            release.set()
+
+            assert leader.result() == "result"
+
+    def test_unshared_call(self):
+        """Test identical calls do not wait for a call executed without sharing."""
+        single_flight = SingleFlight()
+        release = threading.Event()
+
+        def call():
+            release.wait(5)
+            return "unshared"
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            unshared = executor.submit(single_flight.do, "key", call, share=False)
+            while not single_flight.calls:
+                time.sleep(0.001)
+
+            assert single_flight.do("key", lambda: "shared") == "shared"
+            release.set()
+            assert unshared.result() == "unshared"
+        assert single_flight.calls == 2
+        assert single_flight.coalesced == 0
+
+
+class TestAsyncSingleFlight:
+    """Tests for the AsyncSingleFlight class."""
+
+    def test_coalesces_concurrent_calls(self):
+        """Test identical coroutine calls in flight wait for the first one."""
+        single_flight = AsyncSingleFlight()
+        executions = []
+
+        async def call():
+            executions.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        async def run():
+            return await asyncio.gather(
+                *(single_flight.do("key", call) for _ in range(5)),
+                single_flight.do("other", call),
+            )
+
+        assert asyncio.run(run()) == ["result"] * 6
+        assert len(executions) == 2
+        assert single_flight.calls == 2
+        assert single_flight.coalesced == 4
+
+    def test_exception_is_shared(self):
+        """Test the exception of the call is raised to every waiting caller."""
+        single_flight = AsyncSingleFlight()
+
+        async def call():
+            await asyncio.sleep(0.01)
+            raise ValueError("failed")
+
+        async def run():
+            return await asyncio.gather(
+                *(single_flight.do("key", call) for _ in range(3)),
+                return_exceptions=True,
+            )
+
+        results = asyncio.run(run())
+        assert all(isinstance(result, ValueError) for result in results)
+        assert single_flight.coalesced == 2
+
+    def test_cancelled_leader(self):
+        """Test cancelling the first caller does not cancel the other callers."""
+        single_flight = AsyncSingleFlight()
+
+        async def call():
+            await asyncio.sleep(0.05)
+            return "result"
+
+        async def run():
+            leader = asyncio.ensure_future(single_flight.do("key", call))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(single_flight.do("key", call))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await leader
+            return await follower
+
+        assert asyncio.run(run()) == "result"
+        assert single_flight.calls == 1
+
+    def test_cancelled_by_every_caller(self):
+        """Test the call is cancelled once no caller waits for it anymore."""
+        single_flight = AsyncSingleFlight()
+        cancelled = []
+
+        async def call():
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+
+        async def run():
+            callers = [
+                asyncio.ensure_future(single_flight.do("key", call)) for _ in range(2)
+            ]
+            await asyncio.sleep(0.01)
+            for caller in callers:
+                caller.cancel()
+            await asyncio.gather(*callers, return_exceptions=True)
+            await asyncio.sleep(0)
+            return await single_flight.do("key", lambda: asyncio.sleep(0, "next"))
+
+        assert asyncio.run(run()) == "next"
+        assert cancelled == [1]
+        assert single_flight.calls == 2
+
+    def test_unshared_call(self):
+        """Test identical calls do not wait for a call executed without sharing."""
+        single_flight = AsyncSingleFlight()
+
+        async def run():
+            unshared = asyncio.ensure_future(
+                single_flight.do("key", lambda: asyncio.sleep(0.05, 1), share=False)
+            )
+            await asyncio.sleep(0)
+            shared = await single_flight.do("key", lambda: asyncio.sleep(0, 2))
+            return shared, await unshared
+
+        assert asyncio.run(run()) == (2, 1)
+        assert single_flight.calls == 2
+        assert single_flight.coalesced == 0
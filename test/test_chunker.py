@@ -0,0 +1,82 @@
+"""Tests for the word chunking of the PDF chatbot tutorial."""
+
+import importlib
+import os
+import random
+import string
+import sys
+import types
+
+import pytest
+
+TUTORIAL = os.path.join(os.path.dirname(__file__), "..", "tutorials", "pdf-chatbot")
+
+
+def rescanning_chunk_by_words(chunk_size: int, overlap_size: int, text: str):
+    """Chunk the text with the original algorithm, which rescans every chunk."""
+
+    def words_in_chunk(words):
+        char_count = word_count = 0
+        for word in words:
+            if char_count + len(word) + 1 > chunk_size and word_count > 0:
+                break
+            char_count += len(word) + 1
+            word_count += 1
+        return max(1, word_count)
+
+    def words_in_overlap(words):
+        char_count = word_count = 0
+        for word in reversed(words):
+            if char_count + len(word) + 1 > overlap_size:
+                break
+            char_count += len(word) + 1
+            word_count += 1
+        return word_count
+
+    words = text.split()
+    chunks = []
+    start_idx = 0
+    while start_idx < len(words):
+        end_idx = min(start_idx + words_in_chunk(words[start_idx:]), len(words))
+        chunks.append(" ".join(words[start_idx:end_idx]))
+        if end_idx >= len(words):
+            break
+        overlap_words = words_in_overlap(words[start_idx:end_idx])
+        start_idx = max(start_idx + 1, end_idx - overlap_words)
+    return chunks
+
+
+@pytest.fixture(scope="module")
+def chunker():
+    """Import the tutorial chunker with a stand-in for the pypdf package."""
+    pypdf = types.ModuleType("pypdf")
+    pypdf.PdfReader = None
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setitem(sys.modules, "pypdf", pypdf)
+        monkeypatch.syspath_prepend(TUTORIAL)
+        monkeypatch.delitem(sys.modules, "chunker", raising=False)
+        yield importlib.import_module("chunker")
+        monkeypatch.delitem(sys.modules, "chunker")
+
+
+class TestPDFChunker:
+    """Tests for the PDFChunker class."""
+
+    def test_same_chunks_as_original(self, chunker):
+        """Test every chunking method returns the chunks of the original algorithm."""
+        generator = random.Random(0)
+        for _ in range(500):
+            chunk_size = generator.randint(1, 60)
+            overlap_size = generator.randint(0, chunk_size + 10)
+            lengths = generator.choices(range(1, 16), k=generator.randint(0, 80))
+            text = "".join(
+                generator.choice([" ", " ", "  ", "\n", "\t "])
+                + "".join(generator.choices(string.ascii_letters, k=length))
+                for length in lengths
+            )
+            pdf_chunker = chunker.PDFChunker(chunk_size, overlap_size)
+            expected = rescanning_chunk_by_words(chunk_size, overlap_size, text)
+
+            assert pdf_chunker.chunk_by_words(text) == expected
+            assert list(pdf_chunker.iter_chunks(iter(text.split()))) == expected
+            assert [chunk.text for chunk in pdf_chunker.chunk_spans(text)] == expected
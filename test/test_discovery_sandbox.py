@@ -1,69 +1,1901 @@
 """Tests for the discovery_sandbox module."""
 
+import asyncio
+import base64
+import hashlib
 import json
+import pickle
 import random
 import string
+import threading
+import time
 import uuid
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 
-import httpx
 import pytest
-from httpx import HTTPStatusError, Response
-from mockito import mock, unstub, when
+from httpx import HTTPStatusError, MockTransport, ReadTimeout, Request, Response
+from mockito import mock, unstub, verify, when
 
+from sandbox import discovery_sandbox
+from sandbox.cache import ResponseCache
+from sandbox.observers import current_stage, stage
+from sandbox.resilience import (
+    AdaptiveConcurrency,
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceeded,
+    HedgingPolicy,
+    RateLimiter,
+    RetryPolicy,
+)
 from sandbox.discovery_sandbox import (
+    AsyncQueryFlowClient,
+    BatchResult,
     Credential,
+    JSONCodec,
+    MsgspecCodec,
+    OrjsonCodec,
     Processor,
     QueryFlowClient,
+    QueryFlowParallel,
     QueryFlowSequence,
     QueryFlowSequenceProcessor,
     Server,
+    ServerSentEvent,
+    SSEDecoder,
+    default_codec,
 )
 
 
-class TestQueryFlowClient:
-    """Tests for the QueryFlowClient class."""
+def _available_codecs():
+    """Return the codec classes whose backend is installed."""
+    codecs = [JSONCodec]
+    if discovery_sandbox.orjson is not None:
+        codecs.append(OrjsonCodec)
+    if discovery_sandbox.msgspec is not None:
+        codecs.append(MsgspecCodec)
+    return codecs
+
+
+class TestJSONCodec:
+    """Tests for the JSONCodec class and its backends."""
+
+    @pytest.fixture(params=_available_codecs(), ids=lambda codec: codec.name)
+    def codec(self, request):
+        """Return an instance of each available codec."""
+        return request.param()
+
+    def test_encode_entities(self, codec):
+        """Test entities are encoded explicitly, without private fields."""
+        processor = Processor(
+            "openai",
+            {"input": "café"},
+            Server("openai", {}, Credential("openai", {"apiKey": "key"})),
+        )
+        processor._payload = "cached"
+
+        encoded = codec.encode({"processor": processor, "input": {}})
+
+        assert isinstance(encoded, bytes)
+        assert json.loads(encoded) == {
+            "processor": {
+                "type": "openai",
+                "config": {"input": "café"},
+                "server": {
+                    "type": "openai",
+                    "config": {},
+                    "credential": {"type": "openai", "secret": {"apiKey": "key"}},
+                },
+            },
+            "input": {},
+        }
+
+    def test_encode_unsupported_type(self, codec):
+        """Test encoding an object that is not an entity raises TypeError."""
+        with pytest.raises(TypeError):
+            codec.encode({"value": object()})
+
+    def test_decode(self, codec):
+        """Test a document encoded by the codec decodes to the same value."""
+        data = {
+            "embeddings": [{"embedding": [random.random() for _ in range(16)]}],
+            "hits": [{"title": "ñandú", "score": 1.5, "tags": None}],
+        }
+        assert codec.decode(codec.encode(data)) == data
+
+    def test_default_codec_fallback(self, monkeypatch):
+        """Test the json built-in module is used when no fast backend is installed."""
+        monkeypatch.setattr(discovery_sandbox, "orjson", None)
+        monkeypatch.setattr(discovery_sandbox, "msgspec", None)
+        assert type(default_codec()) is JSONCodec
+        with pytest.raises(ImportError):
+            OrjsonCodec()
+        with pytest.raises(ImportError):
+            MsgspecCodec()
+
+
+class TestEntities:
+    """Tests for the slotted entity value types."""
+
+    def _processor(self, frozen=False, key="key"):
+        """Return a processor with a server and a credential."""
+        return Processor(
+            "openai",
+            {"action": "embeddings"},
+            Server("openai", {}, Credential("openai", {"apiKey": key})),
+            frozen=frozen,
+        )
+
+    def test_slotted(self):
+        """Test entities have no instance dictionary."""
+        processor = self._processor()
+        with pytest.raises(AttributeError):
+            processor.__dict__
+        with pytest.raises(AttributeError):
+            processor.unknown = 1
+
+    def test_to_dict(self):
+        """Test to_dict converts referenced entities into plain dictionaries."""
+        step = QueryFlowSequenceProcessor(self._processor(), timeout="PT1S")
+
+        assert QueryFlowSequence([step]).to_dict() == {
+            "processors": [
+                {
+                    "processor": {
+                        "type": "openai",
+                        "config": {"action": "embeddings"},
+                        "server": {
+                            "type": "openai",
+                            "config": {},
+                            "credential": {
+                                "type": "openai",
+                                "secret": {"apiKey": "key"},
+                            },
+                        },
+                    },
+                    "timeout": "PT1S",
+                    "concurrency": None,
+                    "name": None,
+                }
+            ]
+        }
+
+    def test_equality(self):
+        """Test entities with the same fields are equal."""
+        assert self._processor() == self._processor(frozen=True)
+        assert self._processor() != self._processor(key="other")
+        assert self._processor() != Server("openai", {})
+
+    def test_content_hash_stable(self):
+        """Test the content hash depends only on the fields, in any key order."""
+        first = Server("elasticsearch", {"a": 1, "b": 2})
+        second = Server("elasticsearch", {"b": 2, "a": 1})
+
+        assert first.content_hash() == second.content_hash()
+        canonical = b'{"config":{"a":1,"b":2},"credential":null,"type":"elasticsearch"}'
+        digest = hashlib.blake2b(canonical, digest_size=16).hexdigest()
+        assert first.content_hash() == digest
+        other = self._processor(key="other")
+        assert self._processor().content_hash() != other.content_hash()
+
+    def test_content_hash_modified(self):
+        """Test the content hash follows changes to a referenced entity."""
+        processor = self._processor()
+        content_hash = processor.content_hash()
+
+        processor.server.credential.secret["apiKey"] = "other"
+
+        assert processor.content_hash() != content_hash
+        assert processor.content_hash() == self._processor(key="other").content_hash()
+
+    def test_frozen(self):
+        """Test frozen entities reject assignments, also in referenced entities."""
+        processor = self._processor(frozen=True)
+
+        with pytest.raises(AttributeError):
+            processor.config = {}
+        with pytest.raises(AttributeError):
+            processor.server.credential.secret = {}
+        with pytest.raises(AttributeError):
+            del processor.server
+        assert processor.server.frozen
+        assert isinstance(processor, Processor)
+        assert repr(processor).startswith("Processor(")
+        assert processor.freeze() is processor
+
+    def test_frozen_nested_values(self):
+        """Test dictionaries and lists of frozen entities are read-only copies."""
+        config = {"action": "vector", "vector": [0.5], "query": {"match_all": {}}}
+        processor = Processor("elasticsearch", config, frozen=True)
+
+        with pytest.raises(TypeError):
+            processor.config["action"] = "search"
+        with pytest.raises(TypeError):
+            processor.config["query"].update({"size": 1})
+        assert processor.config["vector"] == (0.5,)
+        assert processor == Processor("elasticsearch", dict(config))
+        config["action"] = "search"
+        assert processor.config["action"] == "vector"
+        assert pickle.loads(pickle.dumps(processor)) == processor
+        shared = Processor("elasticsearch", processor.config, frozen=True)
+        assert shared.config is processor.config
+
+    def test_hashable_when_frozen(self):
+        """Test frozen entities deduplicate in sets and mutable ones are unhashable."""
+        processors = {self._processor(frozen=True) for _ in range(3)}
+
+        assert len(processors) == 1
+        with pytest.raises(TypeError):
+            hash(self._processor())
+
+    def test_frozen_sequence(self):
+        """Test a frozen sequence stores its steps as a tuple and freezes them."""
+        step = QueryFlowSequenceProcessor(str(uuid.uuid4()))
+        sequence = QueryFlowSequence([step], frozen=True)
+
+        assert sequence.processors == (step,)
+        assert step.frozen
+        assert {sequence: 1}[QueryFlowSequence([step], frozen=True)] == 1
+
+    def test_frozen_parallel_sequence(self):
+        """Test freezing a sequence freezes the branches of its parallel steps."""
+        branch = QueryFlowSequenceProcessor(self._processor())
+        parallel = QueryFlowParallel({"a": branch}, concurrency=2)
+        sequence = QueryFlowSequence([parallel]).freeze()
+
+        assert parallel.frozen
+        assert branch.frozen
+        with pytest.raises(TypeError):
+            parallel.branches["b"] = QueryFlowSequence([])
+        with pytest.raises(AttributeError):
+            parallel.merge = dict
+        assert hash(sequence) == hash(sequence.content_hash())
+        assert sequence.to_dict()["processors"][0] == {
+            "branches": {"a": {"processors": [branch.to_dict()]}},
+            "concurrency": 2,
+            "name": None,
+        }
+        other = QueryFlowParallel({"a": branch}, merge=dict, concurrency=2)
+        assert other != parallel
+        assert other.content_hash() == parallel.content_hash()
+        assert pickle.loads(pickle.dumps(sequence)) == sequence
+
+    def test_pickle(self):
+        """Test entities survive pickling with their fields and frozen state."""
+        for processor in (self._processor(), self._processor(frozen=True)):
+            restored = pickle.loads(pickle.dumps(processor))
+
+            assert restored == processor
+            assert restored.frozen == processor.frozen
+            assert restored.server.credential.frozen == processor.frozen
+
+    def test_repr_hides_secret(self):
+        """Test the representation of a credential does not show its secret."""
+        assert "key" not in repr(Credential("openai", {"apiKey": "key"}))
+        assert repr(Server("openai", {})) == (
+            "Server(type='openai', config={}, credential=None)"
+        )
+
+
+class TestEmbeddings:
+    """Tests for decoding embedding vectors to compact arrays."""
+
+    def setup_method(self):
+        """Prepare an embeddings processor, a vector and the requests received."""
+        text = "".join(random.choices(string.ascii_letters, k=5))
+        self.processor = Processor("openai", {"action": "embeddings", "input": text})
+        self.vector = [random.uniform(-1, 1) for _ in range(16)]
+        self.float32 = array("f", self.vector).tolist()
+        self.configs = []
+
+    def _handler(self, request):
+        """Answer with the vector, base64 encoded if the processor asked for it."""
+        config = json.loads(request.content)["processor"]["config"]
+        self.configs.append(config)
+        embedding = self.vector
+        if config.get("encodingFormat") == "base64":
+            embedding = base64.b64encode(array("f", self.vector).tobytes()).decode()
+        return Response(
+            200, json={"embeddings": [{"embedding": embedding}], "model": "m"}
+        )
+
+    def _client(self, **options):
+        """Return a client that sends its requests to the handler."""
+        return QueryFlowClient(
+            "http://localhost", "key", transport=MockTransport(self._handler), **options
+        )
+
+    def test_list_by_default(self):
+        """Test vectors are lists of floats and the processor config is unchanged."""
+        with self._client() as client:
+            body = client.text_to_text(self.processor, {})
+
+        assert body["embeddings"][0]["embedding"] == self.vector
+        assert self.configs == [self.processor.config]
+
+    def test_array(self):
+        """Test vectors are decoded to float32 arrays."""
+        with self._client(embeddings="array") as client:
+            body = client.text_to_text(self.processor, {})
+
+        embedding = body["embeddings"][0]["embedding"]
+        assert isinstance(embedding, array)
+        assert embedding.typecode == "f"
+        assert embedding.tolist() == self.float32
+        assert body["model"] == "m"
+
+    def test_base64(self):
+        """Test base64 vectors are requested and decoded in every format."""
+        for embeddings in ("list", "array"):
+            with self._client(embeddings=embeddings, base64_embeddings=True) as client:
+                body = client.text_to_text(self.processor, {})
+
+            assert list(body["embeddings"][0]["embedding"]) == self.float32
+        assert self.configs[0]["encodingFormat"] == "base64"
+        assert "encodingFormat" not in self.processor.config
+
+    def test_base64_payload_cached(self):
+        """Test a frozen processor asking for base64 is serialized only once."""
+        encoded = []
+
+        class CountingCodec(JSONCodec):
+            def encode(self, obj):
+                # The inputs are empty, so only processors are counted
+                if obj:
+                    encoded.append(obj)
+                return super().encode(obj)
+
+        processor = Processor("openai", dict(self.processor.config), frozen=True)
+        with self._client(base64_embeddings=True, codec=CountingCodec()) as client:
+            for _ in range(5):
+                client.text_to_text(processor, {})
+            key = client._processor_key(processor)
+
+        assert len(encoded) == 1
+        assert all(config["encodingFormat"] == "base64" for config in self.configs)
+        assert key == client._processor_payload(processor)[1]
+
+    def test_base64_only_for_embeddings(self):
+        """Test other actions, other types and explicit formats are sent unchanged."""
+        processors = [
+            Processor("openai", {"action": "chat-completion"}),
+            Processor("elasticsearch", {"action": "embeddings"}),
+            Processor("openai", {"action": "embeddings", "encodingFormat": "float"}),
+        ]
+        with self._client(base64_embeddings=True) as client:
+            for processor in processors:
+                client.text_to_text(processor, {})
+
+        assert self.configs == [processor.config for processor in processors]
+
+    def test_vectors_are_encoded_as_lists(self):
+        """Test decoded vectors can be sent back in the config of a processor."""
+        vector = array("f", self.vector)
+        for codec in _available_codecs():
+            assert codec().encode({"vector": vector}) == codec().encode(
+                {"vector": vector.tolist()}
+            )
+
+    def test_numpy(self):
+        """Test vectors are decoded to NumPy float32 arrays."""
+        numpy = pytest.importorskip("numpy")
+        with self._client(embeddings="numpy", base64_embeddings=True) as client:
+            body = client.text_to_text(self.processor, {})
+
+        embedding = body["embeddings"][0]["embedding"]
+        assert embedding.dtype == numpy.float32
+        assert embedding.tolist() == self.float32
+
+    def test_invalid_format(self, monkeypatch):
+        """Test unknown formats and NumPy without the package are rejected."""
+        with pytest.raises(ValueError):
+            QueryFlowClient("http://localhost", "key", embeddings="tensor")
+        monkeypatch.setattr(discovery_sandbox, "numpy", None)
+        with pytest.raises(ImportError):
+            QueryFlowClient("http://localhost", "key", embeddings="numpy")
+
+    def test_async(self):
+        """Test the asyncio client decodes vectors in the same way."""
+
+        async def run():
+            async with AsyncQueryFlowClient(
+                "http://localhost",
+                "key",
+                embeddings="array",
+                base64_embeddings=True,
+                transport=MockTransport(self._handler),
+            ) as client:
+                return await client.text_to_text(self.processor, {})
+
+        body = asyncio.run(run())
+
+        assert body["embeddings"][0]["embedding"] == array("f", self.vector)
+
+
+def _decode(*chunks: bytes):
+    """Feed the chunks to a new SSEDecoder and return every decoded event."""
+    decoder = SSEDecoder()
+    events = []
+    for chunk in chunks:
+        events.extend(decoder.feed(chunk))
+    return events + decoder.close()
+
+
+class TestSSEDecoder:
+    """Tests for the SSEDecoder class."""
+
+    def test_multiline_data(self):
+        """Test data lines of one event are joined with newlines."""
+        event_data = [
+            "".join(random.choices(string.ascii_letters, k=5)) for _ in range(5)
+        ]
+        event_text = "\n".join(["data: " + content for content in event_data])
+        assert _decode(event_text.encode() + b"\n\n") == [
+            ServerSentEvent("\n".join(event_data))
+        ]
+
+    def test_data_with_colons(self):
+        """Test only the first colon separates the field name from the value."""
+        assert _decode(b'data: {"url": "https://example.com"}\n\n') == [
+            ServerSentEvent('{"url": "https://example.com"}')
+        ]
+
+    def test_event_split_across_chunks(self):
+        """Test events are decoded regardless of where the network splits them."""
+        stream = "data: first\n\ndata: second: part\ndata: ñandú\n\n".encode()
+        expected = [
+            ServerSentEvent("first"),
+            ServerSentEvent("second: part\nñandú"),
+        ]
+        assert _decode(stream) == expected
+        assert _decode(*(stream[i : i + 1] for i in range(len(stream)))) == expected
+        assert _decode(stream[:9], stream[9:20], stream[20:]) == expected
+
+    def test_line_endings(self):
+        """Test CRLF, CR and LF line endings, including a CRLF split across chunks."""
+        assert _decode(b"data: a\r", b"\ndata: b\r\n\r\ndata: c\r\rdata: d\n\n") == [
+            ServerSentEvent("a\nb"),
+            ServerSentEvent("c"),
+            ServerSentEvent("d"),
+        ]
+
+    def test_typed_fields(self):
+        """Test the event, id and retry fields are parsed and comments are ignored."""
+        events = _decode(
+            b"\xef\xbb\xbf: keep-alive\n",
+            b"event: token\nid: 7\nretry: 1500\ndata: hi\n\n",
+            b"retry: soon\ndata:no space\n\n",
+        )
+        assert events == [
+            ServerSentEvent("hi", "token", "7", 1500),
+            ServerSentEvent("no space", "message", "7", 1500),
+        ]
+
+    def test_events_without_data(self):
+        """Test blocks without data lines are not dispatched."""
+        assert _decode(b"event: ping\n\n: comment\n\ndata: x\n\n") == [
+            ServerSentEvent("x")
+        ]
+
+    def test_unterminated_event(self):
+        """Test the last event is dispatched when the stream ends without a blank line."""
+        decoder = SSEDecoder()
+        assert decoder.feed(b"data: done") == []
+        assert decoder.close() == [ServerSentEvent("done")]
+
+
+class TestQueryFlowClient:
+    """Tests for the QueryFlowClient class."""
+
+    @pytest.fixture
+    def queryflow_client(self):
+        """Yield a QueryFlowClient object and close it afterwards."""
+        client_url = "".join(random.choices(string.ascii_letters, k=5))
+        client_api_key = "".join(random.choices(string.ascii_letters, k=5))
+        with QueryFlowClient(client_url, client_api_key) as client:
+            yield client
+
+    def test_context_manager_closes_client(self):
+        """Test that leaving the context closes the connection pool."""
+        with QueryFlowClient("http://localhost", "key") as client:
+            assert not client._client.is_closed
+        assert client._client.is_closed
+
+    def test_close(self):
+        """Test the close method closes the connection pool."""
+        client = QueryFlowClient("http://localhost", "key")
+        client.close()
+        assert client._client.is_closed
+
+    def test_text_to_text_processor(self, queryflow_client):
+        """Test the text_to_text method with a new Processor entity."""
+        credential_type = "".join(random.choices(string.ascii_letters, k=5))
+        credential_secret = {
+            "".join(random.choices(string.ascii_letters, k=5)): "".join(
+                random.choices(string.ascii_letters, k=5)
+            )
+        }
+        credential = Credential(credential_type, credential_secret)
+
+        server_type = "".join(random.choices(string.ascii_letters, k=5))
+        server_config = {
+            "".join(random.choices(string.ascii_letters, k=5)): "".join(
+                random.choices(string.ascii_letters, k=5)
+            )
+        }
+        server = Server(server_type, server_config, credential)
+
+        processor_type = "".join(random.choices(string.ascii_letters, k=5))
+        processor_config = {
+            "".join(random.choices(string.ascii_letters, k=5)): "".join(
+                random.choices(string.ascii_letters, k=5)
+            )
+        }
+        processor = Processor(processor_type, processor_config, server)
+
+        request_input = {
+            "".join(random.choices(string.ascii_letters, k=5)): "".join(
+                random.choices(string.ascii_letters, k=5)
+            )
+        }
+        request_data = queryflow_client.codec.encode(
+            {
+                "processor": {
+                    "type": processor_type,
+                    "config": processor_config,
+                    "server": {
+                        "type": server_type,
+                        "config": server_config,
+                        "credential": {
+                            "type": credential_type,
+                            "secret": credential_secret,
+                        },
+                    },
+                },
+                "input": request_input,
+            }
+        )
+        response_data = {
+            "".join(random.choices(string.ascii_letters, k=5)): "".join(
+                random.choices(string.ascii_letters, k=5)
+            )
+        }
+        response = Response(200, content=json.dumps(response_data))
+
+        when(response).raise_for_status().thenReturn(response)
+        when(queryflow_client._client).post(
+            url=queryflow_client.url + queryflow_client.SANDBOX_PATH,
+            params={},
+            content=request_data,
+            headers={
+                "x-api-key": queryflow_client.api_key,
+                "Content-Type": "application/json",
+            },
+            timeout=None,
+        ).thenReturn(response)
+
+        result = queryflow_client.text_to_text(processor, request_input)
+        assert result == response_data
+        unstub()
+
+    def test_text_to_text_processor_no_content(self, queryflow_client):
+        """Test the text_to_text method with a new Processor that returns 204."""
+        processor_type = "".join(random.choices(string.ascii_letters, k=5))
+        processor_config = {
+            "".join(random.choices(string.ascii_letters, k=5)): "".join(
+                random.choices(string.ascii_letters, k=5)
+            )
+        }
+        processor = Processor(processor_type, processor_config)
+
+        request_input = {
+            "".join(random.choices(string.ascii_letters, k=5)): "".join(
+                random.choices(string.ascii_letters, k=5)
+            )
+        }
+        request_data = queryflow_client.codec.encode(
+            {
+                "processor": {
+                    "type": processor_type,
+                    "config": processor_config,
+                    "server": None,
+                },
+                "input": request_input,
+            }
+        )
+        response = Response(204)
+
+        when(queryflow_client._client).post(
+            url=queryflow_client.url + queryflow_client.SANDBOX_PATH,
+            params={},
+            content=request_data,
+            headers={
+                "x-api-key": queryflow_client.api_key,
+                "Content-Type": "application/json",
+            },
+            timeout=None,
+        ).thenReturn(response)
+
+        result = queryflow_client.text_to_text(processor, request_input)
+        assert result == {}
+        unstub()
+
+    def test_text_to_text_stdlib_codec(self):
+        """Test the text_to_text method with the json built-in module codec."""
+        processor = Processor("openai", {"action": "embeddings"})
+        response_data = {"embeddings": [{"embedding": [0.5, 0.25]}]}
+        response = Response(200, content=json.dumps(response_data))
+
+        with QueryFlowClient("http://localhost", "key", codec=JSONCodec()) as client:
+            when(response).raise_for_status().thenReturn(response)
+            when(client._client).post(
+                url="http://localhost" + client.SANDBOX_PATH,
+                params={},
+                content=b'{"processor":{"type":"openai","config":{"action":"embeddings"},'
+                b'"server":null},"input":{"text":"hello"}}',
+                headers={"x-api-key": "key", "Content-Type": "application/json"},
+                timeout=None,
+            ).thenReturn(response)
+
+            assert client.text_to_text(processor, {"text": "hello"}) == response_data
+        unstub()
+
+    def test_text_to_text_cached(self):
+        """Test repeated text_to_text calls are answered from the response cache."""
+        processor = Processor("openai", {"action": "embeddings"})
+        response = Response(200, content=json.dumps({"embeddings": [[0.5]]}))
+        when(response).raise_for_status().thenReturn(response)
+
+        with QueryFlowClient("http://localhost", "key", cache=ResponseCache()) as client:
+            when(client._client).post(...).thenReturn(response)
+
+            first = client.text_to_text(processor, {"text": "hello"})
+            second = client.text_to_text(processor, {"text": "hello"})
+
+            assert first == second == {"embeddings": [[0.5]]}
+            assert first is not second
+            verify(client._client, times=1).post(...)
+            assert client.cache.hits == 1
+            assert client.cache.misses == 1
+
+            client.text_to_text(processor, {"text": "other"})
+            verify(client._client, times=2).post(...)
+        unstub()
+
+    def test_text_to_text_cache_opt_in(self):
+        """Test only processor types that opted in are cached."""
+        processor = Processor("elasticsearch", {"action": "store"})
+        response = Response(204)
+        cache = ResponseCache(processor_types=["openai"])
+
+        with QueryFlowClient("http://localhost", "key", cache=cache) as client:
+            when(client._client).post(...).thenReturn(response)
+
+            client.text_to_text(processor, {})
+            client.text_to_text(processor, {})
+
+            verify(client._client, times=2).post(...)
+            assert len(cache) == 0
+        unstub()
+
+    def test_invalidate_cache(self):
+        """Test cached responses are removed by processor and input."""
+        processor = Processor("openai", {"action": "embeddings"})
+        processor_id = str(uuid.uuid4())
+        response = Response(204)
+
+        with QueryFlowClient("http://localhost", "key", cache=ResponseCache()) as client:
+            when(client._client).post(...).thenReturn(response)
+            client.text_to_text(processor, {"text": "a"})
+            client.text_to_text(processor, {"text": "b"})
+            client.text_to_text(processor_id, {"text": "a"})
+
+            assert client.invalidate_cache(processor, {"text": "a"}) == 1
+            assert client.invalidate_cache(processor_id) == 1
+            assert client.invalidate_cache() == 1
+        unstub()
+
+        with QueryFlowClient("http://localhost", "key") as client:
+            assert client.invalidate_cache() == 0
+
+    def test_text_to_text_coalesced(self):
+        """Test identical text_to_text calls in flight share a single request."""
+        processor = Processor("elasticsearch", {"action": "autocomplete"})
+        release = threading.Event()
+        sent = []
+
+        def post(**request):
+            sent.append(request)
+            release.wait(5)
+            response = Response(200, content=b'{"suggestions": []}')
+            when(response).raise_for_status().thenReturn(response)
+            return response
+
+        with QueryFlowClient("http://localhost", "key", coalesce=True) as client:
+            when(client._client).post(...).thenAnswer(post)
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                futures = [
+                    executor.submit(client.text_to_text, processor, {"q": "a"})
+                    for _ in range(4)
+                ]
+                deadline = time.monotonic() + 5
+                while client.single_flight.coalesced < 3 and time.monotonic() < deadline:
+                    time.sleep(0.001)
+                release.set()
+                results = [future.result() for future in futures]
+
+            assert results == [{"suggestions": []}] * 4
+            assert len(sent) == 1
+            assert client.single_flight.coalesced == 3
+        unstub()
+
+    def test_coalesced_call_timeout(self):
+        """Test identical calls sent with different timeouts are not coalesced."""
+        processor_id = str(uuid.uuid4())
+        release = threading.Event()
+        sent = []
+
+        def post(**request):
+            sent.append(request["params"])
+            release.wait(5)
+            return Response(204)
+
+        with QueryFlowClient("http://localhost", "key", coalesce=True) as client:
+            when(client._client).post(...).thenAnswer(post)
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                futures = [
+                    executor.submit(client.text_to_text, processor_id, {}, timeout)
+                    for timeout in ("PT0.1S", "PT30S")
+                ]
+                deadline = time.monotonic() + 5
+                while len(sent) < 2 and time.monotonic() < deadline:
+                    time.sleep(0.001)
+                release.set()
+
+                assert [future.result() for future in futures] == [{}, {}]
+            assert sorted(params["timeout"] for params in sent) == ["PT0.1S", "PT30S"]
+            assert client.single_flight.coalesced == 0
+        unstub()
+
+    def test_coalesced_call_deadline(self):
+        """Test a caller waiting on a slow identical call still meets its deadline."""
+        processor = Processor("elasticsearch", {"action": "autocomplete"})
+        release = threading.Event()
+
+        def handler(request):
+            release.wait(5)
+            return Response(200, json={"suggestions": []})
+
+        sequence = QueryFlowSequence([QueryFlowSequenceProcessor(processor)])
+        with QueryFlowClient(
+            "http://localhost", "key", coalesce=True, transport=MockTransport(handler)
+        ) as client:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                leader = executor.submit(client.text_to_text, processor, {"q": "a"})
+                while not client.single_flight.calls:
+                    time.sleep(0.001)
+                start = time.monotonic()
+                with pytest.raises(DeadlineExceeded):
+                    client.execute(sequence, {"q": "a"}, deadline=0.1)
+                waited = time.monotonic() - start
+                release.set()
+
+                assert leader.result() == {"suggestions": []}
+        assert waited < 1
+
+    def test_coalesced_call_without_deadline(self):
+        """Test a call without a deadline does not share the request of a deadline."""
+        processor_id = str(uuid.uuid4())
+        sent, answered = threading.Event(), threading.Event()
+
+        def post(**request):
+            if "timeout" not in request["params"]:
+                answered.set()
+                return Response(
+                    200, content=b'{"status": "ok"}', request=Request("POST", "/")
+                )
+            sent.set()
+            answered.wait(5)
+            raise ReadTimeout("", request=Request("POST", request["url"]))
+
+        sequence = QueryFlowSequence([QueryFlowSequenceProcessor(processor_id)])
+        with QueryFlowClient("http://localhost", "key", coalesce=True) as client:
+            when(client._client).post(...).thenAnswer(post)
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                leader = executor.submit(
+                    client.execute, sequence, {"q": "a"}, deadline=0.2
+                )
+                sent.wait(5)
+
+                assert client.text_to_text(processor_id, {"q": "a"}) == {
+                    "status": "ok"
+                }
+                with pytest.raises((ReadTimeout, DeadlineExceeded)):
+                    leader.result()
+            assert client.single_flight.coalesced == 0
+        unstub()
+
+    def test_text_to_text_hedged(self):
+        """Test a slow text_to_text call is hedged and the first response is used."""
+        processor = Processor("openai", {"action": "embeddings"})
+        release = threading.Event()
+        responses = [b'{"from": "primary"}', b'{"from": "hedge"}']
+
+        def post(**request):
+            content = responses.pop(0)
+            if content == b'{"from": "primary"}':
+                release.wait(5)
+            response = Response(200, content=content)
+            when(response).raise_for_status().thenReturn(response)
+            return response
+
+        hedging = HedgingPolicy(delay=0.01, budget=1)
+        with QueryFlowClient("http://localhost", "key", hedging=hedging) as client:
+            when(client._client).post(...).thenAnswer(post)
+            try:
+                assert client.text_to_text(processor, {}) == {"from": "hedge"}
+            finally:
+                release.set()
+
+        assert hedging.requests == 1
+        assert hedging.hedges == 1
+        unstub()
+
+    def test_hedge_executor_created_once(self):
+        """Test concurrent first hedged calls share a single executor."""
+        created = []
+
+        def executor(**kwargs):
+            time.sleep(0.01)
+            created.append(ThreadPoolExecutor(**kwargs))
+            return created[-1]
+
+        hedging = HedgingPolicy(delay=0.01, budget=1)
+        with QueryFlowClient("http://localhost", "key", hedging=hedging) as client:
+            when(discovery_sandbox).ThreadPoolExecutor(...).thenAnswer(executor)
+            with ThreadPoolExecutor(max_workers=8) as callers:
+                executors = set(
+                    callers.map(lambda _: client._start_hedge_executor(), range(8))
+                )
+            unstub()
+
+        assert executors == set(created)
+        assert len(created) == 1
+        assert created[0]._shutdown
+
+    def test_text_to_text_not_hedged(self):
+        """Test calls are not hedged for non-idempotent actions or without budget."""
+        store = Processor("elasticsearch", {"action": "store"})
+        embeddings = Processor("openai", {"action": "embeddings"})
+
+        def post(**request):
+            time.sleep(0.02)
+            return Response(204)
+
+        hedging = HedgingPolicy(delay=0.001, budget=0.1)
+        with QueryFlowClient("http://localhost", "key", hedging=hedging) as client:
+            when(client._client).post(...).thenAnswer(post)
+
+            assert client.text_to_text(store, {}) == {}
+            assert hedging.requests == 0
+            assert client.text_to_text(embeddings, {}) == {}
+            assert hedging.requests == 1
+            assert hedging.hedges == 0
+            verify(client._client, times=2).post(...)
+        unstub()
+
+    def test_text_to_text_retried(self):
+        """Test a transient failure is retried after the Retry-After wait."""
+        statuses = [503, 200]
+
+        def post(**request):
+            response = Response(
+                statuses.pop(0),
+                content=b'{"status": "ok"}',
+                headers={"Retry-After": "0"},
+                request=Request("POST", request["url"]),
+            )
+            return response
+
+        retry = RetryPolicy(max_attempts=3, backoff=5)
+        with QueryFlowClient("http://localhost", "key", retry=retry) as client:
+            when(client._client).post(...).thenAnswer(post)
+
+            assert client.text_to_text(str(uuid.uuid4()), {}) == {"status": "ok"}
+            verify(client._client, times=2).post(...)
+        assert retry.retries == 1
+        unstub()
+
+    def test_text_to_text_not_retried(self):
+        """Test client errors are raised without retrying."""
+
+        def post(**request):
+            return Response(400, request=Request("POST", request["url"]))
+
+        retry = RetryPolicy(max_attempts=3, backoff=0)
+        with QueryFlowClient("http://localhost", "key", retry=retry) as client:
+            when(client._client).post(...).thenAnswer(post)
+
+            with pytest.raises(HTTPStatusError):
+                client.text_to_text(str(uuid.uuid4()), {})
+            verify(client._client, times=1).post(...)
+        assert retry.retries == 0
+        unstub()
+
+    def test_text_to_text_store_not_retried(self):
+        """Test a store processor is not sent again after a read timeout."""
+        text = "".join(random.choices(string.ascii_letters, k=8))
+        processor = Processor("elasticsearch", {"action": "store", "index": text})
+
+        def post(**request):
+            raise ReadTimeout("", request=Request("POST", request["url"]))
+
+        retry = RetryPolicy(max_attempts=3, backoff=0)
+        with QueryFlowClient("http://localhost", "key", retry=retry) as client:
+            when(client._client).post(...).thenAnswer(post)
+
+            with pytest.raises(ReadTimeout):
+                client.text_to_text(processor, {})
+            verify(client._client, times=1).post(...)
+        assert retry.retries == 0
+        unstub()
+
+    def test_text_to_text_circuit_open(self):
+        """Test calls fail fast once the circuit of the endpoint opens."""
+        processor_id = str(uuid.uuid4())
+
+        def post(**request):
+            return Response(502, request=Request("POST", request["url"]))
+
+        breaker = CircuitBreaker(failure_threshold=2, recovery_time=60)
+        with QueryFlowClient(
+            "http://localhost", "key", circuit_breaker=breaker
+        ) as client:
+            when(client._client).post(...).thenAnswer(post)
+
+            for _ in range(2):
+                with pytest.raises(HTTPStatusError):
+                    client.text_to_text(processor_id, {})
+            with pytest.raises(CircuitOpenError):
+                client.text_to_text(processor_id, {})
+            verify(client._client, times=2).post(...)
+        unstub()
+
+    def test_text_to_text_rate_limited(self):
+        """Test calls to a server type are paced at its rate."""
+        processor = Processor("openai-embeddings", {}, Server("openai", {}))
+        limiter = RateLimiter({"openai": 50}, burst=1)
+        with QueryFlowClient("http://localhost", "key", rate_limiter=limiter) as client:
+            when(client._client).post(...).thenReturn(
+                Response(200, content=b"{}", request=Request("POST", client.url))
+            )
+
+            start = time.monotonic()
+            for _ in range(4):
+                client.text_to_text(processor, {})
+
+            assert time.monotonic() - start >= 0.06
+            assert limiter.waits == 3
+        unstub()
+
+    def test_text_to_text_rate_limit_deadline(self):
+        """Test a call whose rate limit wait outlives the deadline is not sent."""
+        processor = Processor("openai-embeddings", {}, Server("openai", {}))
+        limiter = RateLimiter({"openai": 1}, burst=1)
+        sequence = QueryFlowSequence([QueryFlowSequenceProcessor(processor)] * 2)
+        with QueryFlowClient("http://localhost", "key", rate_limiter=limiter) as client:
+            when(client._client).post(...).thenReturn(
+                Response(200, content=b"{}", request=Request("POST", client.url))
+            )
+
+            with pytest.raises(DeadlineExceeded):
+                client.execute(sequence, {}, deadline=0.5)
+            verify(client._client, times=1).post(...)
+        unstub()
+
+    def test_text_to_text_adaptive_concurrency(self):
+        """Test a 429 response shrinks the concurrency limit and frees its slot."""
+        processor = Processor("openai-embeddings", {}, Server("openai", {}))
+        concurrency = AdaptiveConcurrency(initial_limit=4)
+        with QueryFlowClient(
+            "http://localhost", "key", concurrency=concurrency
+        ) as client:
+            when(client._client).post(...).thenReturn(
+                Response(429, request=Request("POST", client.url))
+            )
+
+            with pytest.raises(HTTPStatusError):
+                client.text_to_text(processor, {})
+
+            assert concurrency.limit("openai") == 2
+            assert concurrency.acquire("openai", timeout=0)
+            assert concurrency.acquire("openai", timeout=0)
+            assert not concurrency.acquire("openai", timeout=0)
+        unstub()
+
+    def test_observers(self):
+        """Test observers receive one event per request until they are removed."""
+        processor = Processor("openai", {"action": "embeddings"})
+        events = []
+
+        def post(**request):
+            trace = request["extensions"]["trace"]
+            trace("connection.connect_tcp.started", {})
+            trace("connection.connect_tcp.complete", {})
+            trace("http11.send_request_headers.started", {})
+            trace("http11.receive_response_headers.complete", {})
+            return Response(
+                200,
+                content=b'{"data": []}',
+                request=Request("POST", request["url"]),
+            )
+
+        with QueryFlowClient("http://localhost", "key") as client:
+            when(client._client).post(...).thenAnswer(post)
+            client.add_observer(events.append)
+
+            assert client.text_to_text(processor, {"input": "text"}) == {"data": []}
+            client.remove_observer(events.append)
+            with pytest.raises(ValueError):
+                client.remove_observer(events.append)
+
+        assert len(events) == 1
+        event = events[0]
+        assert event.processor_type == "openai"
+        assert event.endpoint == client.url + client.SANDBOX_PATH + " [openai]"
+        assert event.status == 200
+        assert event.connection_reused is False
+        assert event.connect_time is not None
+        assert 0 <= event.time_to_first_byte <= event.duration
+        assert event.response_bytes == len(b'{"data": []}')
+        assert event.request_bytes > len(b'{"input":"text"}')
+        unstub()
+
+    def test_observers_not_registered(self, queryflow_client):
+        """Test requests are not instrumented without observers."""
+        processor_id = str(uuid.uuid4())
+        when(queryflow_client._client).post(...).thenReturn(Response(204))
+
+        queryflow_client.text_to_text(processor_id, {})
+
+        verify(queryflow_client._client).post(
+            url=queryflow_client.url + queryflow_client.SANDBOX_PATH + processor_id,
+            params={},
+            content=b"{}",
+            headers=...,
+            timeout=None,
+        )
+        unstub()
+
+    def test_observers_failed_request(self):
+        """Test observers receive the event of every failed attempt."""
+        events = []
+
+        def post(**request):
+            return Response(503, request=Request("POST", request["url"]))
+
+        retry = RetryPolicy(max_attempts=2, backoff=0)
+        with QueryFlowClient("http://localhost", "key", retry=retry) as client:
+            when(client._client).post(...).thenAnswer(post)
+            client.add_observer(events.append)
+
+            with pytest.raises(HTTPStatusError):
+                client.text_to_text(str(uuid.uuid4()), {})
+
+        assert [event.status for event in events] == [503, 503]
+        assert all(isinstance(event.error, HTTPStatusError) for event in events)
+        unstub()
+
+    def test_observers_stage(self, queryflow_client):
+        """Test events are labeled with the sequence stage that sent them."""
+        events = []
+        processors = {str(uuid.uuid4()): name for name in ["embed", "search", "rank"]}
+        when(queryflow_client._client).post(...).thenReturn(Response(204))
+        queryflow_client.add_observer(events.append)
+        ids = list(processors)
+        sequence = QueryFlowSequence(
+            [
+                QueryFlowSequenceProcessor(ids[0], name="embed"),
+                QueryFlowParallel(
+                    {"vector": QueryFlowSequenceProcessor(ids[1])},
+                    name="retrieve",
+                ),
+                QueryFlowSequenceProcessor(ids[2]),
+            ]
+        )
+
+        queryflow_client.execute(sequence, {})
+        with stage("direct"):
+            queryflow_client.text_to_text(ids[0], {})
+        queryflow_client.execute_many(sequence, [{}])
+
+        assert [event.stage for event in events] == [
+            "embed",
+            "retrieve.vector.0",
+            "2",
+            "direct",
+            "embed",
+            "retrieve.vector.0",
+            "2",
+        ]
+        unstub()
+
+    def test_observers_stream(self, queryflow_client):
+        """Test stream events report the number of events received."""
+        events = []
+        stream_mock = mock()
+        response = mock(Response)
+        response.status_code = 200
+        response.num_bytes_downloaded = 30
+        when(response).iter_bytes().thenReturn(
+            [b"data: a\n\ndata: b\n\n", b"data: c\n\n"]
+        )
+        when(stream_mock).__enter__().thenReturn(response)
+        when(stream_mock).__exit__(...).thenReturn()
+        when(queryflow_client._client).stream(...).thenReturn(stream_mock)
+        queryflow_client.add_observer(events.append)
+
+        assert list(queryflow_client.text_to_stream(str(uuid.uuid4()), {})) == [
+            "a",
+            "b",
+            "c",
+        ]
+
+        assert len(events) == 1
+        assert events[0].stream
+        assert events[0].events == 3
+        assert events[0].response_bytes == 30
+        assert events[0].time_to_first_event <= events[0].duration
+        unstub()
+
+    def test_processor_payload_cached(self, queryflow_client):
+        """Test the serialized payload of a frozen processor is reused."""
+        processor = Processor(
+            "openai",
+            {"action": "embeddings"},
+            Server("openai", {}, Credential("openai", {"apiKey": "key"})),
+            frozen=True,
+        )
+
+        payload, key = queryflow_client._processor_payload(processor)
+
+        assert json.loads(payload) == {
+            "type": "openai",
+            "config": {"action": "embeddings"},
+            "server": {
+                "type": "openai",
+                "config": {},
+                "credential": {"type": "openai", "secret": {"apiKey": "key"}},
+            },
+        }
+        assert queryflow_client._processor_payload(processor)[0] is payload
+        assert queryflow_client._processor_key(processor) == key
+
+    def test_processor_payload_frozen_server(self):
+        """Test new processors around a frozen server reuse its serialized payload."""
+        encoded = []
+
+        class CountingCodec(JSONCodec):
+            def encode(self, obj):
+                encoded.append(obj)
+                return super().encode(obj)
+
+        password = "".join(random.choices(string.ascii_letters, k=8))
+        config = {"servers": ["http://localhost:9200"]}
+        server = Server(
+            "elasticsearch", config, Credential("elasticsearch", {"password": password})
+        )
+        unfrozen = pickle.loads(pickle.dumps(server))
+        server.freeze()
+        codec = CountingCodec()
+        with QueryFlowClient("http://localhost", "key", codec=codec) as client:
+            for index in ("a", "b"):
+                processor = Processor("elasticsearch", {"index": index}, server)
+                payload, key = client._processor_payload(processor)
+
+                assert payload == JSONCodec().encode(processor)
+                copy = Processor("elasticsearch", {"index": index}, unfrozen)
+                assert key == client._processor_key(copy)
+
+        assert [obj for obj in encoded if isinstance(obj, Server)] == [server]
+
+    def test_processor_payload_modified(self, queryflow_client):
+        """Test a processor that is not frozen sends its fields as they are now."""
+        credential = Credential("openai", {"apiKey": "key"})
+        server = Server("openai", {}, credential)
+        processor = Processor("openai", {"action": "embeddings"}, server)
+        _, key = queryflow_client._processor_payload(processor)
+
+        processor.config["query"] = "second"
+        payload, modified_key = queryflow_client._processor_payload(processor)
+        assert json.loads(payload)["config"]["query"] == "second"
+        assert modified_key != key
+
+        credential.secret["apiKey"] = "other"
+        payload = json.loads(queryflow_client._processor_payload(processor)[0])
+        assert payload["server"]["credential"]["secret"] == {"apiKey": "other"}
+
+        server.credential = None
+        payload = json.loads(queryflow_client._processor_payload(processor)[0])
+        assert payload["server"]["credential"] is None
+
+    def test_text_to_text_modified_processor(self):
+        """Test a processor modified in place is sent and cached with its new config."""
+        sent = []
+
+        def handler(request):
+            sent.append(json.loads(request.content)["processor"]["config"])
+            return Response(200, json={"query": sent[-1]["query"]})
+
+        processor = Processor("openai", {"action": "embeddings", "query": "first"})
+        with QueryFlowClient(
+            "http://localhost",
+            "key",
+            cache=ResponseCache(processor_types={"openai"}),
+            coalesce=True,
+            transport=MockTransport(handler),
+        ) as client:
+            assert client.text_to_text(processor, {}) == {"query": "first"}
+            processor.config["query"] = "second"
+            assert client.text_to_text(processor, {}) == {"query": "second"}
+
+        assert [config["query"] for config in sent] == ["first", "second"]
+
+    def test_text_to_text_uuid(self, queryflow_client):
+        """Test the text_to_text method with the uuid of an existing Processor."""
+        processor_id = str(uuid.uuid4())
+        request_input = {
+            "".join(random.choices(string.ascii_letters, k=5)): "".join(
+                random.choices(string.ascii_letters, k=5)
+            )
+        }
+        response_data = {
+            "".join(random.choices(string.ascii_letters, k=5)): "".join(
+                random.choices(string.ascii_letters, k=5)
+            )
+        }
+        response = Response(200, content=json.dumps(response_data))
+        when(response).raise_for_status().thenReturn(response)
+
+        when(queryflow_client._client).post(
+            url=queryflow_client.url + queryflow_client.SANDBOX_PATH + processor_id,
+            params={},
+            content=queryflow_client.codec.encode(request_input),
+            headers={
+                "x-api-key": queryflow_client.api_key,
+                "Content-Type": "application/json",
+            },
+            timeout=None,
+        ).thenReturn(response)
+
+        result = queryflow_client.text_to_text(processor_id, request_input)
+        assert result == response_data
+        unstub()
+
+    def test_text_to_text_uuid_no_content(self, queryflow_client):
+        """Tests the text_to_text method with the uuid of a Processor that returns 204."""
+        processor_id = str(uuid.uuid4())
+        request_input = {
+            "".join(random.choices(string.ascii_letters, k=5)): "".join(
+                random.choices(string.ascii_letters, k=5)
+            )
+        }
+        response = Response(204)
+        when(response).raise_for_status().thenReturn(response)
+
+        when(queryflow_client._client).post(
+            url=queryflow_client.url + queryflow_client.SANDBOX_PATH + processor_id,
+            params={},
+            content=queryflow_client.codec.encode(request_input),
+            headers={
+                "x-api-key": queryflow_client.api_key,
+                "Content-Type": "application/json",
+            },
+            timeout=None,
+        ).thenReturn(response)
+
+        result = queryflow_client.text_to_text(processor_id, request_input)
+        assert result == {}
+        unstub()
+
+    def test_text_to_stream_processor(self, queryflow_client):
+        """Test the text_to_stream method with a new Processor entity."""
+        credential_type = "".join(random.choices(string.ascii_letters, k=5))
+        credential_secret = {
+            "".join(random.choices(string.ascii_letters, k=5)): "".join(
+                random.choices(string.ascii_letters, k=5)
+            )
+        }
+        credential = Credential(credential_type, credential_secret)
+
+        server_type = "".join(random.choices(string.ascii_letters, k=5))
+        server_config = {
+            "".join(random.choices(string.ascii_letters, k=5)): "".join(
+                random.choices(string.ascii_letters, k=5)
+            )
+        }
+        server = Server(server_type, server_config, credential)
+
+        processor_type = "".join(random.choices(string.ascii_letters, k=5))
+        processor_config = {
+            "".join(random.choices(string.ascii_letters, k=5)): "".join(
+                random.choices(string.ascii_letters, k=5)
+            )
+        }
+        processor = Processor(processor_type, processor_config, server)
+
+        request_input = {
+            "".join(random.choices(string.ascii_letters, k=5)): "".join(
+                random.choices(string.ascii_letters, k=5)
+            )
+        }
+        request_data = queryflow_client.codec.encode(
+            {
+                "processor": {
+                    "type": processor_type,
+                    "config": processor_config,
+                    "server": {
+                        "type": server_type,
+                        "config": server_config,
+                        "credential": {
+                            "type": credential_type,
+                            "secret": credential_secret,
+                        },
+                    },
+                },
+                "input": request_input,
+            }
+        )
+        event_data = [
+            "".join(random.choices(string.ascii_letters, k=5)) for _ in range(5)
+        ]
+
+        stream_mock = mock()
+        response = mock(Response)
+
+        when(response).iter_bytes().thenReturn(
+            [f"data: {event}\n\n".encode() for event in event_data]
+        )
+        when(stream_mock).__enter__().thenReturn(response)
+        when(stream_mock).__exit__().thenReturn()
+        when(queryflow_client._client).stream(
+            "POST",
+            url=queryflow_client.url + queryflow_client.SANDBOX_PATH,
+            params={},
+            content=request_data,
+            headers={
+                "x-api-key": queryflow_client.api_key,
+                "Content-Type": "application/json",
+                "Accept": "text/event-stream",
+            },
+            timeout=None,
+        ).thenReturn(stream_mock)
+
+        result = queryflow_client.text_to_stream(processor, request_input)
+        assert event_data == [chunk for chunk in result]
+        unstub()
+
+    def test_text_to_stream_uuid(self, queryflow_client):
+        """Test the text_to_stream method with the uuid of an existing Processor."""
+        processor_id = str(uuid.uuid4())
+        request_input = {
+            "".join(random.choices(string.ascii_letters, k=5)): "".join(
+                random.choices(string.ascii_letters, k=5)
+            )
+        }
+        event_data = [
+            "".join(random.choices(string.ascii_letters, k=5)) for _ in range(5)
+        ]
+
+        stream_mock = mock()
+        response = mock(Response)
+
+        when(response).iter_bytes().thenReturn(
+            [f"data: {event}\n\n".encode() for event in event_data]
+        )
+        when(stream_mock).__enter__().thenReturn(response)
+        when(stream_mock).__exit__().thenReturn()
+        when(queryflow_client._client).stream(
+            "POST",
+            url=queryflow_client.url + queryflow_client.SANDBOX_PATH + processor_id,
+            params={},
+            content=queryflow_client.codec.encode(request_input),
+            headers={
+                "x-api-key": queryflow_client.api_key,
+                "Content-Type": "application/json",
+                "Accept": "text/event-stream",
+            },
+            timeout=None,
+        ).thenReturn(stream_mock)
+
+        result = queryflow_client.text_to_stream(processor_id, request_input)
+        assert event_data == [chunk for chunk in result]
+        unstub()
+
+    def test_text_to_text_many(self, queryflow_client):
+        """Test the text_to_text_many method returns results in input order."""
+        processor_id = str(uuid.uuid4())
+        inputs = [{"index": index} for index in range(20)]
+        for input in inputs:
+            when(queryflow_client).text_to_text(processor_id, input, None).thenReturn(
+                {"output": input["index"]}
+            )
+
+        results = queryflow_client.text_to_text_many(
+            processor_id, inputs, max_concurrency=4
+        )
+
+        assert [result.index for result in results] == list(range(20))
+        assert [result.output for result in results] == [
+            {"output": index} for index in range(20)
+        ]
+        assert all(result.ok for result in results)
+        unstub()
+
+    def test_text_to_text_many_reports_failures(self, queryflow_client):
+        """Test the text_to_text_many method reports failures per item."""
+        processor_id = str(uuid.uuid4())
+        inputs = [{"index": index} for index in range(3)]
+        error = HTTPStatusError(message="", request=None, response=mock(Response))
+        when(queryflow_client).text_to_text(processor_id, inputs[0], None).thenReturn(
+            {}
+        )
+        when(queryflow_client).text_to_text(processor_id, inputs[1], None).thenRaise(
+            error
+        )
+        when(queryflow_client).text_to_text(processor_id, inputs[2], None).thenReturn(
+            {}
+        )
+
+        results = queryflow_client.text_to_text_many(processor_id, inputs)
+
+        assert [result.ok for result in results] == [True, False, True]
+        assert results[1].error is error
+        assert results[1].output is None
+        assert results[1].input == inputs[1]
+        unstub()
+
+    def test_text_to_text_imap(self, queryflow_client):
+        """Test the text_to_text_imap method yields every result from a lazy iterable."""
+        processor_id = str(uuid.uuid4())
+        inputs = [{"index": index} for index in range(10)]
+        for input in inputs:
+            when(queryflow_client).text_to_text(processor_id, input, "PT1S").thenReturn(
+                input
+            )
+
+        results = list(
+            queryflow_client.text_to_text_imap(
+                processor_id, iter(inputs), max_concurrency=3, timeout="PT1S"
+            )
+        )
+
+        assert all(isinstance(result, BatchResult) for result in results)
+        assert sorted(result.index for result in results) == list(range(10))
+        assert all(result.output == result.input for result in results)
+        unstub()
+
+    def test_execute(self, queryflow_client):
+        """Tests the execute method."""
+        original_input = {
+            "".join(random.choices(string.ascii_letters, k=5)): "".join(
+                random.choices(string.ascii_letters, k=5)
+            )
+        }
+
+        current_input = original_input
+        processors = [mock(Processor) for _ in range(5)]
+        for processor in processors:
+            output = {
+                "".join(random.choices(string.ascii_letters, k=5)): "".join(
+                    random.choices(string.ascii_letters, k=5)
+                )
+            }
+            when(queryflow_client).text_to_text(
+                processor, current_input, None
+            ).thenReturn(output)
+            current_input = output
+
+        queryflow_sequence = QueryFlowSequence(
+            [QueryFlowSequenceProcessor(processor) for processor in processors]
+        )
+
+        assert output == queryflow_client.execute(queryflow_sequence, original_input)
+        unstub()
+
+    def test_execute_system_exit(self, queryflow_client):
+        """Tests the execute method when a processor execution fails."""
+        request_input = {
+            "".join(random.choices(string.ascii_letters, k=5)): "".join(
+                random.choices(string.ascii_letters, k=5)
+            )
+        }
+
+        response_text = "".join(random.choices(string.ascii_letters, k=5))
+        processor = mock(Processor)
+        response = mock(Response)
+        status_error = HTTPStatusError(response=response, message="", request=None)
+
+        response.text = response_text
+        status_error.response = response
+
+        when(queryflow_client).text_to_text(processor, request_input, None).thenRaise(
+            status_error
+        )
+
+        with pytest.raises(SystemExit) as excinfo:
+            queryflow_client.execute(
+                QueryFlowSequence([QueryFlowSequenceProcessor(processor)]),
+                request_input,
+            )
+
+        assert response_text == excinfo.value.code
+        unstub()
+
+    def test_execute_parallel(self, queryflow_client):
+        """Test the branches of a parallel step run concurrently and are merged."""
+        embed, keyword, autocomplete, complete = (str(uuid.uuid4()) for _ in range(4))
+        barrier = threading.Barrier(3, timeout=5)
+
+        def text_to_text(processor, input, timeout):
+            if processor == complete:
+                return {"answer": input}
+            barrier.wait()
+            return {"from": processor, "query": input["query"]}
+
+        when(queryflow_client).text_to_text(...).thenAnswer(text_to_text)
+        sequence = QueryFlowSequence(
+            [
+                QueryFlowParallel(
+                    {
+                        "embed": QueryFlowSequenceProcessor(embed),
+                        "keyword": QueryFlowSequence(
+                            [QueryFlowSequenceProcessor(keyword)]
+                        ),
+                        "autocomplete": QueryFlowSequenceProcessor(autocomplete),
+                        "query": QueryFlowSequence([]),
+                    },
+                    merge=lambda outputs: {
+                        name: output.get("from") for name, output in outputs.items()
+                    },
+                ),
+                QueryFlowSequenceProcessor(complete),
+            ]
+        )
+
+        result = queryflow_client.execute(sequence, {"query": "q"})
+
+        assert result == {
+            "answer": {
+                "embed": embed,
+                "keyword": keyword,
+                "autocomplete": autocomplete,
+                "query": None,
+            }
+        }
+        unstub()
+
+    def test_execute_stream(self, queryflow_client):
+        """Test the last step is streamed with the output of the previous steps."""
+        search, complete = str(uuid.uuid4()), str(uuid.uuid4())
+        stages = []
+
+        def text_to_text(processor, input, timeout):
+            stages.append(current_stage())
+            return {"hits": [input["query"]]}
+
+        def text_to_stream(processor, input, timeout):
+            stages.append(current_stage())
+            for token in input["hits"][0].split():
+                yield token
+
+        when(queryflow_client).text_to_text(...).thenAnswer(text_to_text)
+        when(queryflow_client).text_to_stream(...).thenAnswer(text_to_stream)
+        sequence = QueryFlowSequence(
+            [
+                QueryFlowSequenceProcessor(search, name="search"),
+                QueryFlowSequenceProcessor(complete, name="complete"),
+            ]
+        )
+
+        received = []
+        for token in queryflow_client.execute_stream(sequence, {"query": "a b c"}):
+            received.append((token, current_stage()))
+
+        assert received == [("a", None), ("b", None), ("c", None)]
+        assert stages == ["search", "complete"]
+        unstub()
+
+    def test_execute_stream_requires_processor_last(self, queryflow_client):
+        """Test a sequence ending with a parallel step cannot be streamed."""
+        sequence = QueryFlowSequence(
+            [QueryFlowParallel({"a": QueryFlowSequenceProcessor(str(uuid.uuid4()))})]
+        )
+
+        with pytest.raises(ValueError):
+            list(queryflow_client.execute_stream(sequence, {}))
+
+    def test_execute_stream_deadline(self, queryflow_client):
+        """Test a stream that outlives the deadline stops with DeadlineExceeded."""
+
+        def text_to_stream(processor, input, timeout):
+            for token in range(10):
+                time.sleep(0.02)
+                yield token
+
+        when(queryflow_client).text_to_stream(...).thenAnswer(text_to_stream)
+        sequence = QueryFlowSequence([QueryFlowSequenceProcessor(str(uuid.uuid4()))])
+        received = []
+
+        with pytest.raises(DeadlineExceeded):
+            for token in queryflow_client.execute_stream(sequence, {}, deadline=0.05):
+                received.append(token)
+
+        assert received[:1] == [0]
+        assert len(received) < 10
+        unstub()
+
+    def test_execute_parallel_failure(self, queryflow_client):
+        """Test a failing branch aborts the execution."""
+        processor = str(uuid.uuid4())
+        response = mock(Response)
+        response.text = "".join(random.choices(string.ascii_letters, k=5))
+        status_error = HTTPStatusError(response=response, message="", request=None)
+        when(queryflow_client).text_to_text(processor, {}, None).thenRaise(
+            status_error
+        )
+        sequence = QueryFlowSequence(
+            [
+                QueryFlowParallel(
+                    {
+                        "failing": QueryFlowSequenceProcessor(processor),
+                        "passing": QueryFlowSequence([]),
+                    }
+                )
+            ]
+        )
+
+        with pytest.raises(SystemExit) as excinfo:
+            queryflow_client.execute(sequence, {})
+
+        assert response.text == excinfo.value.code
+        unstub()
+
+    @pytest.mark.parametrize(
+        "value, seconds",
+        [
+            ("PT30S", 30),
+            ("PT1.5S", 1.5),
+            ("PT2M", 120),
+            ("P1DT1H", 90000),
+            ("30", None),
+        ],
+    )
+    def test_parse_duration(self, value, seconds):
+        """Test ISO 8601 durations are parsed into seconds."""
+        assert discovery_sandbox._parse_duration(value) == seconds
+
+    def test_execute_deadline_timeouts(self, queryflow_client):
+        """Test each request only gets the remaining budget of the deadline."""
+        first, second = str(uuid.uuid4()), str(uuid.uuid4())
+        requests = []
+
+        def post(**request):
+            requests.append(request)
+            time.sleep(0.05)
+            return Response(204, request=Request("POST", request["url"]))
+
+        when(queryflow_client._client).post(...).thenAnswer(post)
+        sequence = QueryFlowSequence(
+            [
+                QueryFlowSequenceProcessor(first, "PT0.5S"),
+                QueryFlowSequenceProcessor(second, "PT1M"),
+            ]
+        )
+
+        assert queryflow_client.execute(sequence, {}, deadline=10) == {}
+
+        assert requests[0]["params"] == {"timeout": "PT0.5S"}
+        assert 9.9 < requests[0]["timeout"] <= 10
+        server_timeout = discovery_sandbox._parse_duration(
+            requests[1]["params"]["timeout"]
+        )
+        assert 9.8 < server_timeout < 9.96
+        assert requests[1]["timeout"] == pytest.approx(server_timeout, abs=0.001)
+        unstub()
+
+    def test_execute_deadline_exceeded(self, queryflow_client):
+        """Test the execution stops once the deadline runs out."""
+        first, second = str(uuid.uuid4()), str(uuid.uuid4())
+
+        def post(**request):
+            time.sleep(0.05)
+            return Response(204, request=Request("POST", request["url"]))
+
+        when(queryflow_client._client).post(...).thenAnswer(post)
+        sequence = QueryFlowSequence(
+            [QueryFlowSequenceProcessor(first), QueryFlowSequenceProcessor(second)]
+        )
+
+        with pytest.raises(DeadlineExceeded) as excinfo:
+            queryflow_client.execute(sequence, {}, deadline=0.02)
+
+        assert excinfo.value.deadline == 0.02
+        verify(queryflow_client._client, times=1).post(...)
+        unstub()
+
+    def test_execute_deadline_socket_timeout(self, queryflow_client):
+        """Test a socket timeout at the deadline is reported as DeadlineExceeded."""
+
+        def post(**request):
+            time.sleep(request["timeout"])
+            raise ReadTimeout("")
+
+        when(queryflow_client._client).post(...).thenAnswer(post)
+        sequence = QueryFlowSequence([QueryFlowSequenceProcessor(str(uuid.uuid4()))])
+
+        with pytest.raises(DeadlineExceeded):
+            queryflow_client.execute(sequence, {}, deadline=0.02)
+        unstub()
+
+    def test_execute_deadline_limits_retries(self):
+        """Test retries are not attempted when their backoff outlives the deadline."""
+
+        def post(**request):
+            return Response(503, request=Request("POST", request["url"]))
+
+        retry = RetryPolicy(backoff=5, jitter=False)
+        with QueryFlowClient("http://localhost", "key", retry=retry) as client:
+            when(client._client).post(...).thenAnswer(post)
+            sequence = QueryFlowSequence(
+                [QueryFlowSequenceProcessor(str(uuid.uuid4()))]
+            )
+
+            with pytest.raises(SystemExit):
+                client.execute(sequence, {}, deadline=1)
+            verify(client._client, times=1).post(...)
+        unstub()
+
+    def test_execute_many_pipelined(self, queryflow_client):
+        """Test execute_many overlaps the stages of consecutive inputs."""
+        embed, search = str(uuid.uuid4()), str(uuid.uuid4())
+        searched = [threading.Event() for _ in range(4)]
+        overlapped = []
+
+        def text_to_text(processor, input, timeout):
+            if processor == embed:
+                if input["index"] > 0:
+                    overlapped.append(searched[input["index"] - 1].wait(5))
+                return {"index": input["index"], "vector": [input["index"]]}
+            searched[input["index"]].set()
+            return {"index": input["index"], "hits": input["vector"]}
+
+        when(queryflow_client).text_to_text(...).thenAnswer(text_to_text)
+        sequence = QueryFlowSequence(
+            [
+                QueryFlowSequenceProcessor(embed, concurrency=1),
+                QueryFlowSequenceProcessor(search, concurrency=1),
+            ]
+        )
+
+        results = queryflow_client.execute_many(
+            sequence, [{"index": index} for index in range(4)]
+        )
+
+        assert overlapped == [True] * 3
+        assert [result.output for result in results] == [
+            {"index": index, "hits": [index]} for index in range(4)
+        ]
+        assert [result.input for result in results] == [
+            {"index": index} for index in range(4)
+        ]
+        unstub()
+
+    def test_execute_many_reports_failures(self, queryflow_client):
+        """Test a failed input skips the remaining stages and is reported."""
+        first, second = str(uuid.uuid4()), str(uuid.uuid4())
+        error = HTTPStatusError(message="", request=None, response=mock(Response))
+        calls = []
+
+        def text_to_text(processor, input, timeout):
+            calls.append((processor, input["index"]))
+            if processor == first and input["index"] == 1:
+                raise error
+            return input
+
+        when(queryflow_client).text_to_text(...).thenAnswer(text_to_text)
+        sequence = QueryFlowSequence(
+            [QueryFlowSequenceProcessor(first), QueryFlowSequenceProcessor(second)]
+        )
+
+        results = queryflow_client.execute_many(
+            sequence, ({"index": index} for index in range(3)), queue_size=1
+        )
+
+        assert [result.ok for result in results] == [True, False, True]
+        assert results[1].error is error
+        assert results[1].output is None
+        assert (second, 1) not in calls
+        assert len(calls) == 5
+        unstub()
+
+
+class _AsyncStream:
+    """Async context manager standing in for ``httpx.AsyncClient.stream``."""
+
+    def __init__(self, response):
+        self.response = response
+
+    async def __aenter__(self):
+        return self.response
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+async def _aiter(items):
+    """Return an async iterator over the given items."""
+    for item in items:
+        yield item
+
+
+class TestAsyncQueryFlowClient:
+    """Tests for the AsyncQueryFlowClient class."""
 
     @pytest.fixture
     def queryflow_client(self):
-        """Return a QueryFlowClient object."""
+        """Yield an AsyncQueryFlowClient object and close it afterwards."""
         client_url = "".join(random.choices(string.ascii_letters, k=5))
         client_api_key = "".join(random.choices(string.ascii_letters, k=5))
-        return QueryFlowClient(client_url, client_api_key)
+        client = AsyncQueryFlowClient(client_url, client_api_key)
+        yield client
+        asyncio.run(client.aclose())
+
+    def test_async_context_manager_closes_client(self):
+        """Test that leaving the async context closes the connection pool."""
+
+        async def run():
+            async with AsyncQueryFlowClient("http://localhost", "key") as client:
+                assert not client._client.is_closed
+            return client
+
+        assert asyncio.run(run())._client.is_closed
 
     def test_text_to_text_processor(self, queryflow_client):
         """Test the text_to_text method with a new Processor entity."""
         credential_type = "".join(random.choices(string.ascii_letters, k=5))
-        credential_secret = {
-            "".join(random.choices(string.ascii_letters, k=5)): "".join(
-                random.choices(string.ascii_letters, k=5)
-            )
-        }
-        credential = Credential(credential_type, credential_secret)
-
+        credential_secret = {"key": "".join(random.choices(string.ascii_letters, k=5))}
         server_type = "".join(random.choices(string.ascii_letters, k=5))
-        server_config = {
-            "".join(random.choices(string.ascii_letters, k=5)): "".join(
-                random.choices(string.ascii_letters, k=5)
-            )
-        }
-        server = Server(server_type, server_config, credential)
-
+        server_config = {"servers": ["".join(random.choices(string.ascii_letters, k=5))]}
         processor_type = "".join(random.choices(string.ascii_letters, k=5))
-        processor_config = {
-            "".join(random.choices(string.ascii_letters, k=5)): "".join(
-                random.choices(string.ascii_letters, k=5)
-            )
-        }
-        processor = Processor(processor_type, processor_config, server)
-
+        processor_config = {"".join(random.choices(string.ascii_letters, k=5)): "value"}
+        processor = Processor(
+            processor_type,
+            processor_config,
+            Server(server_type, server_config, Credential(credential_type, credential_secret)),
+        )
         request_input = {
             "".join(random.choices(string.ascii_letters, k=5)): "".join(
                 random.choices(string.ascii_letters, k=5)
             )
         }
-        request_data = json.dumps(
-            {"processor": processor, "input": request_input},
-            default=vars,
+        request_data = queryflow_client.codec.encode(
+            {
+                "processor": {
+                    "type": processor_type,
+                    "config": processor_config,
+                    "server": {
+                        "type": server_type,
+                        "config": server_config,
+                        "credential": {
+                            "type": credential_type,
+                            "secret": credential_secret,
+                        },
+                    },
+                },
+                "input": request_input,
+            }
         )
         response_data = {
             "".join(random.choices(string.ascii_letters, k=5)): "".join(
@@ -73,7 +1905,7 @@ class TestQueryFlowClient:
         response = Response(200, content=json.dumps(response_data))
 
         when(response).raise_for_status().thenReturn(response)
-        when(httpx).post(
+        when(queryflow_client._client).post(
             url=queryflow_client.url + queryflow_client.SANDBOX_PATH,
             params={},
             content=request_data,
@@ -84,35 +1916,24 @@ class TestQueryFlowClient:
             timeout=None,
         ).thenReturn(response)
 
-        result = queryflow_client.text_to_text(processor, request_input)
+        result = asyncio.run(queryflow_client.text_to_text(processor, request_input))
         assert result == response_data
         unstub()
 
-    def test_text_to_text_processor_no_content(self, queryflow_client):
-        """Test the text_to_text method with a new Processor that returns 204."""
-        processor_type = "".join(random.choices(string.ascii_letters, k=5))
-        processor_config = {
-            "".join(random.choices(string.ascii_letters, k=5)): "".join(
-                random.choices(string.ascii_letters, k=5)
-            )
-        }
-        processor = Processor(processor_type, processor_config)
-
+    def test_text_to_text_uuid_no_content(self, queryflow_client):
+        """Test the text_to_text method with the uuid of a Processor that returns 204."""
+        processor_id = str(uuid.uuid4())
         request_input = {
             "".join(random.choices(string.ascii_letters, k=5)): "".join(
                 random.choices(string.ascii_letters, k=5)
             )
         }
-        request_data = json.dumps(
-            {"processor": processor, "input": request_input},
-            default=vars,
-        )
         response = Response(204)
 
-        when(httpx).post(
-            url=queryflow_client.url + queryflow_client.SANDBOX_PATH,
-            params={},
-            content=request_data,
+        when(queryflow_client._client).post(
+            url=queryflow_client.url + queryflow_client.SANDBOX_PATH + processor_id,
+            params={"timeout": "PT1S"},
+            content=queryflow_client.codec.encode(request_input),
             headers={
                 "x-api-key": queryflow_client.api_key,
                 "Content-Type": "application/json",
@@ -120,124 +1941,149 @@ class TestQueryFlowClient:
             timeout=None,
         ).thenReturn(response)
 
-        result = queryflow_client.text_to_text(processor, request_input)
+        result = asyncio.run(
+            queryflow_client.text_to_text(processor_id, request_input, "PT1S")
+        )
         assert result == {}
         unstub()
 
-    def test_text_to_text_uuid(self, queryflow_client):
-        """Test the text_to_text method with the uuid of an existing Processor."""
+    def test_text_to_text_coalesced(self):
+        """Test identical text_to_text coroutines in flight share a single request."""
         processor_id = str(uuid.uuid4())
-        request_input = {
-            "".join(random.choices(string.ascii_letters, k=5)): "".join(
-                random.choices(string.ascii_letters, k=5)
-            )
-        }
-        response_data = {
-            "".join(random.choices(string.ascii_letters, k=5)): "".join(
-                random.choices(string.ascii_letters, k=5)
-            )
-        }
-        response = Response(200, content=json.dumps(response_data))
-        when(response).raise_for_status().thenReturn(response)
 
-        when(httpx).post(
-            url=queryflow_client.url + queryflow_client.SANDBOX_PATH + processor_id,
-            params={},
-            json=request_input,
-            headers={"x-api-key": queryflow_client.api_key},
-            timeout=None,
-        ).thenReturn(response)
+        async def post(**request):
+            await asyncio.sleep(0.01)
+            return Response(204)
 
-        result = queryflow_client.text_to_text(processor_id, request_input)
-        assert result == response_data
+        async def run():
+            async with AsyncQueryFlowClient(
+                "http://localhost", "key", coalesce=True
+            ) as client:
+                when(client._client).post(...).thenAnswer(post)
+                results = await asyncio.gather(
+                    *(client.text_to_text(processor_id, {"q": "a"}) for _ in range(3))
+                )
+                return client, results
+
+        client, results = asyncio.run(run())
+        assert results == [{}, {}, {}]
+        assert client.single_flight.calls == 1
+        assert client.single_flight.coalesced == 2
         unstub()
 
-    def test_text_to_text_uuid_no_content(self, queryflow_client):
-        """Tests the text_to_text method with the uuid of a Processor that returns 204."""
+    def test_coalesced_call_without_deadline(self):
+        """Test a coroutine without a deadline does not share a deadline request."""
         processor_id = str(uuid.uuid4())
-        request_input = {
-            "".join(random.choices(string.ascii_letters, k=5)): "".join(
-                random.choices(string.ascii_letters, k=5)
-            )
-        }
-        response = Response(204)
-        when(response).raise_for_status().thenReturn(response)
 
-        when(httpx).post(
-            url=queryflow_client.url + queryflow_client.SANDBOX_PATH + processor_id,
-            params={},
-            json=request_input,
-            headers={"x-api-key": queryflow_client.api_key},
-            timeout=None,
-        ).thenReturn(response)
+        async def post(**request):
+            if "timeout" not in request["params"]:
+                return Response(
+                    200, content=b'{"status": "ok"}', request=Request("POST", "/")
+                )
+            await asyncio.sleep(0.05)
+            raise ReadTimeout("", request=Request("POST", request["url"]))
 
-        result = queryflow_client.text_to_text(processor_id, request_input)
-        assert result == {}
+        async def run():
+            async with AsyncQueryFlowClient(
+                "http://localhost", "key", coalesce=True
+            ) as client:
+                when(client._client).post(...).thenAnswer(post)
+                sequence = QueryFlowSequence([QueryFlowSequenceProcessor(processor_id)])
+                leader = asyncio.ensure_future(
+                    client.execute(sequence, {"q": "a"}, deadline=0.2)
+                )
+                await asyncio.sleep(0.01)
+                result = await client.text_to_text(processor_id, {"q": "a"})
+                with pytest.raises((ReadTimeout, DeadlineExceeded)):
+                    await leader
+                return client, result
+
+        client, result = asyncio.run(run())
+        assert result == {"status": "ok"}
+        assert client.single_flight.coalesced == 0
         unstub()
 
-    def test_text_to_stream_processor(self, queryflow_client):
-        """Test the text_to_stream method with a new Processor entity."""
-        credential_type = "".join(random.choices(string.ascii_letters, k=5))
-        credential_secret = {
-            "".join(random.choices(string.ascii_letters, k=5)): "".join(
-                random.choices(string.ascii_letters, k=5)
-            )
-        }
-        credential = Credential(credential_type, credential_secret)
+    def test_text_to_text_hedged(self):
+        """Test a slow text_to_text coroutine is hedged and the loser is cancelled."""
+        processor = Processor("elasticsearch", {"action": "vector"})
+        cancelled = []
 
-        server_type = "".join(random.choices(string.ascii_letters, k=5))
-        server_config = {
-            "".join(random.choices(string.ascii_letters, k=5)): "".join(
-                random.choices(string.ascii_letters, k=5)
-            )
-        }
-        server = Server(server_type, server_config, credential)
+        async def post(**request):
+            if not cancelled:
+                cancelled.append(False)
+                try:
+                    await asyncio.sleep(5)
+                except asyncio.CancelledError:
+                    cancelled[0] = True
+                    raise
+            response = Response(200, content=b'{"hits": []}')
+            when(response).raise_for_status().thenReturn(response)
+            return response
 
-        processor_type = "".join(random.choices(string.ascii_letters, k=5))
-        processor_config = {
-            "".join(random.choices(string.ascii_letters, k=5)): "".join(
-                random.choices(string.ascii_letters, k=5)
-            )
-        }
-        processor = Processor(processor_type, processor_config, server)
+        hedging = HedgingPolicy(delay=0.01, budget=1)
 
-        request_input = {
-            "".join(random.choices(string.ascii_letters, k=5)): "".join(
-                random.choices(string.ascii_letters, k=5)
-            )
-        }
-        request_data = json.dumps(
-            {"processor": processor, "input": request_input},
-            default=vars,
-        )
-        event_data = [
-            "".join(random.choices(string.ascii_letters, k=5)) for _ in range(5)
+        async def run():
+            async with AsyncQueryFlowClient(
+                "http://localhost", "key", hedging=hedging
+            ) as client:
+                when(client._client).post(...).thenAnswer(post)
+                result = await client.text_to_text(processor, {})
+                await asyncio.sleep(0)
+                return result
+
+        assert asyncio.run(run()) == {"hits": []}
+        assert cancelled == [True]
+        assert hedging.hedges == 1
+        unstub()
+
+    def test_text_to_text_retried(self):
+        """Test a transient failure of a coroutine call is retried."""
+        responses = [
+            Response(503, request=Request("POST", "http://localhost")),
+            Response(
+                200,
+                content=b'{"status": "ok"}',
+                request=Request("POST", "http://localhost"),
+            ),
         ]
+        retry = RetryPolicy(max_attempts=2, backoff=0.001)
 
-        stream_mock = mock()
-        response = mock(Response)
+        async def run():
+            async with AsyncQueryFlowClient(
+                "http://localhost", "key", retry=retry
+            ) as client:
+                when(client._client).post(...).thenReturn(*responses)
+                return await client.text_to_text(str(uuid.uuid4()), {})
 
-        when(response).iter_text().thenReturn(event_data)
-        when(stream_mock).__enter__().thenReturn(response)
-        when(stream_mock).__exit__().thenReturn()
-        when(httpx).stream(
-            "POST",
-            url=queryflow_client.url + queryflow_client.SANDBOX_PATH,
-            params={},
-            content=request_data,
-            headers={
-                "x-api-key": queryflow_client.api_key,
-                "Content-Type": "application/json",
-                "Accept": "text/event-stream",
-            },
-            timeout=None,
-        ).thenReturn(stream_mock)
+        assert asyncio.run(run()) == {"status": "ok"}
+        assert retry.retries == 1
+        unstub()
 
-        for event in event_data:
-            when(queryflow_client)._parse_data(event).thenReturn(event)
+    def test_text_to_text_adaptive_concurrency(self):
+        """Test coroutine calls beyond the concurrency limit wait for a slot."""
+        processor = Processor("openai-embeddings", {}, Server("openai", {}))
+        concurrency = AdaptiveConcurrency(initial_limit=2, max_limit=2)
+        in_flight, peak = 0, 0
 
-        result = queryflow_client.text_to_stream(processor, request_input)
-        assert event_data == [chunk for chunk in result]
+        async def post(**request):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return Response(200, content=b"{}", request=Request("POST", request["url"]))
+
+        async def run():
+            async with AsyncQueryFlowClient(
+                "http://localhost", "key", concurrency=concurrency
+            ) as client:
+                when(client._client).post(...).thenAnswer(post)
+                return await asyncio.gather(
+                    *(client.text_to_text(processor, {}) for _ in range(6))
+                )
+
+        assert asyncio.run(run()) == [{}] * 6
+        assert peak == 2
         unstub()
 
     def test_text_to_stream_uuid(self, queryflow_client):
@@ -252,29 +2098,262 @@ class TestQueryFlowClient:
             "".join(random.choices(string.ascii_letters, k=5)) for _ in range(5)
         ]
 
-        stream_mock = mock()
         response = mock(Response)
-
-        when(response).iter_text().thenReturn(event_data)
-        when(stream_mock).__enter__().thenReturn(response)
-        when(stream_mock).__exit__().thenReturn()
-        when(httpx).stream(
+        when(response).aiter_bytes().thenReturn(
+            _aiter([f"data: {event}\n\n".encode() for event in event_data])
+        )
+        when(queryflow_client._client).stream(
             "POST",
             url=queryflow_client.url + queryflow_client.SANDBOX_PATH + processor_id,
             params={},
-            json=request_input,
+            content=queryflow_client.codec.encode(request_input),
             headers={
                 "x-api-key": queryflow_client.api_key,
+                "Content-Type": "application/json",
                 "Accept": "text/event-stream",
             },
             timeout=None,
-        ).thenReturn(stream_mock)
+        ).thenReturn(_AsyncStream(response))
 
-        for event in event_data:
-            when(queryflow_client)._parse_data(event).thenReturn(event)
+        async def collect():
+            return [
+                chunk
+                async for chunk in queryflow_client.text_to_stream(
+                    processor_id, request_input
+                )
+            ]
 
-        result = queryflow_client.text_to_stream(processor_id, request_input)
-        assert event_data == [chunk for chunk in result]
+        assert event_data == asyncio.run(collect())
+        unstub()
+
+    def test_text_to_text_many(self, queryflow_client):
+        """Test the text_to_text_many method returns results in input order."""
+        processor_id = str(uuid.uuid4())
+        inputs = [{"index": index} for index in range(10)]
+        error = ValueError()
+        for input in inputs:
+            stub = when(queryflow_client).text_to_text(processor_id, input, None)
+            if input["index"] == 5:
+                stub.thenRaise(error)
+            else:
+                stub.thenReturn(asyncio.sleep(0.01 * (10 - input["index"]), input))
+
+        results = asyncio.run(
+            queryflow_client.text_to_text_many(processor_id, inputs, max_concurrency=3)
+        )
+
+        assert [result.index for result in results] == list(range(10))
+        assert [result.ok for result in results] == [index != 5 for index in range(10)]
+        assert results[5].error is error
+        assert results[0].output == inputs[0]
+        unstub()
+
+    def test_execute_parallel(self, queryflow_client):
+        """Test the branches of a parallel step run concurrently as coroutines."""
+        first, second = str(uuid.uuid4()), str(uuid.uuid4())
+        started = []
+
+        async def text_to_text(processor, input, timeout):
+            started.append(processor)
+            while len(started) < 2:
+                await asyncio.sleep(0)
+            return {"from": processor}
+
+        when(queryflow_client).text_to_text(...).thenAnswer(text_to_text)
+        sequence = QueryFlowSequence(
+            [
+                QueryFlowParallel(
+                    {
+                        "first": QueryFlowSequenceProcessor(first),
+                        "second": QueryFlowSequenceProcessor(second),
+                    }
+                )
+            ]
+        )
+
+        result = asyncio.wait_for(queryflow_client.execute(sequence, {}), 5)
+
+        assert asyncio.run(result) == {
+            "first": {"from": first},
+            "second": {"from": second},
+        }
+        unstub()
+
+    def test_execute_parallel_cancels_branches(self, queryflow_client):
+        """Test a failing branch cancels the other branches."""
+        failing, slow = str(uuid.uuid4()), str(uuid.uuid4())
+        cancelled = []
+
+        async def text_to_text(processor, input, timeout):
+            if processor == failing:
+                raise ValueError()
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(processor)
+                raise
+
+        async def run():
+            try:
+                await queryflow_client.execute(sequence, {})
+            finally:
+                await asyncio.sleep(0)
+
+        when(queryflow_client).text_to_text(...).thenAnswer(text_to_text)
+        sequence = QueryFlowSequence(
+            [
+                QueryFlowParallel(
+                    {
+                        "failing": QueryFlowSequenceProcessor(failing),
+                        "slow": QueryFlowSequenceProcessor(slow),
+                    }
+                )
+            ]
+        )
+
+        with pytest.raises(ValueError):
+            asyncio.run(run())
+        assert cancelled == [slow]
+        unstub()
+
+    def test_observers(self, queryflow_client):
+        """Test observers receive events of coroutine requests."""
+        events = []
+
+        async def post(**request):
+            await request["extensions"]["trace"](
+                "http11.send_request_headers.started", {}
+            )
+            return Response(204)
+
+        when(queryflow_client._client).post(...).thenAnswer(post)
+        queryflow_client.add_observer(events.append)
+
+        assert asyncio.run(queryflow_client.text_to_text(str(uuid.uuid4()), {})) == {}
+
+        assert len(events) == 1
+        assert events[0].status == 204
+        assert events[0].connection_reused is True
+        unstub()
+
+    def test_execute_deadline_exceeded(self, queryflow_client):
+        """Test a slow execution is cancelled when the deadline runs out."""
+        cancelled = []
+
+        async def post(**request):
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(request["params"]["timeout"])
+                raise
+
+        when(queryflow_client._client).post(...).thenAnswer(post)
+        sequence = QueryFlowSequence([QueryFlowSequenceProcessor(str(uuid.uuid4()))])
+
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            asyncio.run(queryflow_client.execute(sequence, {}, deadline=0.05))
+
+        assert time.monotonic() - start < 1
+        assert len(cancelled) == 1
+        assert discovery_sandbox._parse_duration(cancelled[0]) <= 0.05
+        unstub()
+
+    def test_execute_stream(self, queryflow_client):
+        """Test tokens of the last step are yielded as they arrive."""
+        search, complete = str(uuid.uuid4()), str(uuid.uuid4())
+        more = asyncio.Event()
+
+        async def text_to_text(processor, input, timeout):
+            return {"hits": [input["query"]]}
+
+        async def text_to_stream(processor, input, timeout):
+            yield f"{current_stage()}:{input['hits'][0]}"
+            await more.wait()
+            yield "done"
+
+        when(queryflow_client).text_to_text(...).thenAnswer(text_to_text)
+        when(queryflow_client).text_to_stream(...).thenAnswer(text_to_stream)
+        sequence = QueryFlowSequence(
+            [
+                QueryFlowSequenceProcessor(search),
+                QueryFlowSequenceProcessor(complete, name="complete"),
+            ]
+        )
+
+        async def run():
+            received = []
+            async for token in queryflow_client.execute_stream(
+                sequence, {"query": "q"}, deadline=5
+            ):
+                received.append((token, current_stage()))
+                more.set()
+            return received, discovery_sandbox._deadline.get()
+
+        received, deadline = asyncio.run(run())
+
+        assert received == [("complete:q", None), ("done", None)]
+        assert deadline is None
+        unstub()
+
+    def test_execute_stream_deadline(self, queryflow_client):
+        """Test a stalled stream is cancelled when the deadline runs out."""
+
+        async def text_to_stream(processor, input, timeout):
+            yield "first"
+            await asyncio.sleep(5)
+            yield "second"
+
+        when(queryflow_client).text_to_stream(...).thenAnswer(text_to_stream)
+        sequence = QueryFlowSequence([QueryFlowSequenceProcessor(str(uuid.uuid4()))])
+        received = []
+
+        async def run():
+            async for token in queryflow_client.execute_stream(
+                sequence, {}, deadline=0.05
+            ):
+                received.append(token)
+
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            asyncio.run(run())
+
+        assert time.monotonic() - start < 1
+        assert received == ["first"]
+        unstub()
+
+    async def _execute_many(self, client, sequence, inputs):
+        """Run execute_many on the client."""
+        return await client.execute_many(sequence, inputs, max_concurrency=2)
+
+    def test_execute_many(self, queryflow_client):
+        """Test execute_many runs every input through every stage in order."""
+        double, increment = str(uuid.uuid4()), str(uuid.uuid4())
+
+        async def text_to_text(processor, input, timeout):
+            await asyncio.sleep(random.random() / 100)
+            if processor == double:
+                return {"value": input["value"] * 2}
+            if input["value"] == 6:
+                raise ValueError()
+            return {"value": input["value"] + 1}
+
+        when(queryflow_client).text_to_text(...).thenAnswer(text_to_text)
+        sequence = QueryFlowSequence(
+            [QueryFlowSequenceProcessor(double), QueryFlowSequenceProcessor(increment)]
+        )
+
+        results = asyncio.run(
+            self._execute_many(
+                queryflow_client, sequence, [{"value": value} for value in range(10)]
+            )
+        )
+
+        assert [result.index for result in results] == list(range(10))
+        assert [result.output for result in results] == [
+            {"value": value * 2 + 1} if value != 3 else None for value in range(10)
+        ]
+        assert isinstance(results[3].error, ValueError)
         unstub()
 
     def test_execute(self, queryflow_client):
@@ -295,14 +2374,16 @@ class TestQueryFlowClient:
             }
             when(queryflow_client).text_to_text(
                 processor, current_input, None
-            ).thenReturn(output)
+            ).thenReturn(asyncio.sleep(0, output))
             current_input = output
 
         queryflow_sequence = QueryFlowSequence(
             [QueryFlowSequenceProcessor(processor) for processor in processors]
         )
 
-        assert output == queryflow_client.execute(queryflow_sequence, original_input)
+        assert output == asyncio.run(
+            queryflow_client.execute(queryflow_sequence, original_input)
+        )
         unstub()
 
     def test_execute_system_exit(self, queryflow_client):
@@ -316,28 +2397,20 @@ class TestQueryFlowClient:
         response_text = "".join(random.choices(string.ascii_letters, k=5))
         processor = mock(Processor)
         response = mock(Response)
-        status_error = HTTPStatusError(response=response, message="", request=None)
-
         response.text = response_text
-        status_error.response = response
+        status_error = HTTPStatusError(response=response, message="", request=None)
 
         when(queryflow_client).text_to_text(processor, request_input, None).thenRaise(
             status_error
         )
 
         with pytest.raises(SystemExit) as excinfo:
-            queryflow_client.execute(
-                QueryFlowSequence([QueryFlowSequenceProcessor(processor)]),
-                request_input,
+            asyncio.run(
+                queryflow_client.execute(
+                    QueryFlowSequence([QueryFlowSequenceProcessor(processor)]),
+                    request_input,
+                )
             )
 
         assert response_text == excinfo.value.code
         unstub()
-
-    def test_parse_data(self, queryflow_client):
-        """Test the _parse_data method."""
-        event_data = [
-            "".join(random.choices(string.ascii_letters, k=5)) for _ in range(5)
-        ]
-        event_text = "\n".join(["data: " + content for content in event_data])
-        assert "\n".join(event_data) == queryflow_client._parse_data(event_text)
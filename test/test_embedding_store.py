@@ -0,0 +1,83 @@
+"""Tests for the embedding_store module."""
+
+import random
+import string
+from array import array
+
+from mockito import mock, verify, when
+
+from sandbox.embedding_store import EmbeddingStore
+
+
+def _text():
+    """Return a random text."""
+    return "".join(random.choices(string.ascii_letters, k=20))
+
+
+def _vector(dimensions: int = 8):
+    """Return a random vector of float32 representable values."""
+    return array("f", [random.uniform(-1, 1) for _ in range(dimensions)]).tolist()
+
+
+class TestEmbeddingStore:
+    """Tests for the EmbeddingStore class."""
+
+    def test_get_and_put(self):
+        """Test stored vectors are returned for the same model and text."""
+        text = _text()
+        vector = _vector()
+
+        with EmbeddingStore() as store:
+            assert store.get("model", text) is None
+            store.put("model", text, vector)
+
+            assert store.get("model", text) == vector
+            assert store.get("other-model", text) is None
+            assert len(store) == 1
+
+    def test_put_replaces(self):
+        """Test storing a vector again replaces the previous one."""
+        text = _text()
+        vector = _vector()
+
+        with EmbeddingStore() as store:
+            store.put("model", text, _vector())
+            store.put("model", text, vector)
+
+            assert store.get("model", text) == vector
+            assert len(store) == 1
+
+    def test_float32_storage(self):
+        """Test vectors are stored as packed float32 values."""
+        text = _text()
+
+        with EmbeddingStore() as store:
+            store.put("model", text, [0.1] * 1536)
+            blob = store._connection.execute("SELECT vector FROM embeddings").fetchone()[0]
+
+            assert len(blob) == 1536 * 4
+            assert store.get("model", text) == array("f", [0.1] * 1536).tolist()
+
+    def test_persistence(self, tmp_path):
+        """Test vectors survive reopening the database."""
+        path = tmp_path / "embeddings.db"
+        text = _text()
+        vector = _vector()
+
+        with EmbeddingStore(path) as store:
+            store.put("model", text, vector)
+        with EmbeddingStore(path) as store:
+            assert store.get("model", text) == vector
+
+    def test_get_or_create(self):
+        """Test the embedding function is only called for texts that are not stored."""
+        text = _text()
+        vector = _vector()
+        embedder = mock()
+        when(embedder).embed(text).thenReturn(vector)
+
+        with EmbeddingStore() as store:
+            assert store.get_or_create("model", text, embedder.embed) == vector
+            assert store.get_or_create("model", text, embedder.embed) == vector
+
+        verify(embedder, times=1).embed(text)
@@ -0,0 +1,169 @@
+"""Tests for the metrics module."""
+
+import math
+
+import httpx
+import pytest
+
+from sandbox.metrics import Counter, Histogram, MetricsObserver, MetricsRegistry
+from sandbox.observers import RequestEvent
+
+
+class TestHistogram:
+    """Tests for the Histogram class."""
+
+    def test_observe(self):
+        """Test observations are counted in cumulative buckets."""
+        histogram = Histogram([1, 2, 4])
+        for value in [0.5, 1, 1.5, 3, 10]:
+            histogram.observe(value)
+
+        assert histogram.buckets == (1, 2, 4, math.inf)
+        assert histogram.cumulative_counts() == [2, 3, 4, 5]
+        assert histogram.count == 5
+        assert histogram.sum == 16
+
+    def test_quantile(self):
+        """Test quantiles are interpolated within their bucket."""
+        histogram = Histogram([0.1, 0.2, 0.4])
+        for _ in range(50):
+            histogram.observe(0.05)
+        for _ in range(50):
+            histogram.observe(0.3)
+
+        assert histogram.quantile(0.5) == pytest.approx(0.1)
+        assert histogram.quantile(0.75) == pytest.approx(0.3)
+        assert histogram.quantile(0.99) == pytest.approx(0.396)
+        assert Histogram().quantile(0.5) is None
+
+    def test_quantile_in_infinite_bucket(self):
+        """Test quantiles above the largest bound report that bound."""
+        histogram = Histogram([1])
+        histogram.observe(100)
+
+        assert histogram.quantile(0.99) == 1
+
+
+class TestMetricsRegistry:
+    """Tests for the MetricsRegistry class."""
+
+    def test_metrics_by_labels(self):
+        """Test metrics are created once per name and labels."""
+        registry = MetricsRegistry()
+
+        counter = registry.counter("requests_total", "Requests.", {"type": "openai"})
+        assert registry.counter("requests_total", "", {"type": "openai"}) is counter
+        assert registry.counter("requests_total", "", {"type": "es"}) is not counter
+        with pytest.raises(ValueError):
+            registry.histogram("requests_total", "")
+        with pytest.raises(ValueError):
+            Counter().inc(-1)
+
+    def test_to_prometheus(self):
+        """Test the Prometheus text exposition format."""
+        registry = MetricsRegistry()
+        registry.counter("requests_total", "Requests.", {"type": 'a"b'}).inc(2)
+        histogram = registry.histogram(
+            "duration_seconds", "Duration.", {"type": "a"}, buckets=[0.5, 1]
+        )
+        histogram.observe(0.25)
+        histogram.observe(2)
+
+        assert registry.to_prometheus() == (
+            "# HELP duration_seconds Duration.\n"
+            "# TYPE duration_seconds histogram\n"
+            'duration_seconds_bucket{type="a",le="0.5"} 1\n'
+            'duration_seconds_bucket{type="a",le="1"} 1\n'
+            'duration_seconds_bucket{type="a",le="+Inf"} 2\n'
+            'duration_seconds_sum{type="a"} 2.25\n'
+            'duration_seconds_count{type="a"} 2\n'
+            "# HELP requests_total Requests.\n"
+            "# TYPE requests_total counter\n"
+            'requests_total{type="a\\"b"} 2\n'
+        )
+
+    def test_to_dict(self):
+        """Test the JSON export includes the histogram quantiles."""
+        registry = MetricsRegistry()
+        registry.counter("requests_total", "Requests.").inc()
+        registry.histogram("duration_seconds", "Duration.", buckets=[1]).observe(0.5)
+
+        assert registry.to_dict() == {
+            "duration_seconds": {
+                "type": "histogram",
+                "help": "Duration.",
+                "metrics": [
+                    {
+                        "labels": {},
+                        "count": 1,
+                        "sum": 0.5,
+                        "p50": 0.5,
+                        "p95": 0.95,
+                        "p99": 0.99,
+                    }
+                ],
+            },
+            "requests_total": {
+                "type": "counter",
+                "help": "Requests.",
+                "metrics": [{"labels": {}, "value": 1}],
+            },
+        }
+
+    def test_serve(self):
+        """Test the metrics are served over HTTP."""
+        registry = MetricsRegistry()
+        registry.counter("requests_total", "Requests.").inc()
+
+        with registry.serve() as server:
+            prometheus = httpx.get(server.url + "/metrics")
+            exported = httpx.get(server.url + "/metrics.json")
+            missing = httpx.get(server.url + "/")
+
+        assert prometheus.text == registry.to_prometheus()
+        assert prometheus.headers["Content-Type"].startswith("text/plain")
+        assert exported.json() == registry.to_dict()
+        assert missing.status_code == 404
+
+
+class TestMetricsObserver:
+    """Tests for the MetricsObserver class."""
+
+    def _event(self, processor_type, stage, duration, status=200):
+        """Return a completed RequestEvent."""
+        event = RequestEvent(processor_type, None, "url", stage=stage)
+        event.status = status
+        event.duration = duration
+        event.time_to_first_byte = duration / 2
+        event.connection_reused = True
+        event.request_bytes = 10
+        event.response_bytes = 100
+        return event
+
+    def test_aggregates_by_processor_type_and_stage(self):
+        """Test request metrics are labeled by processor type and stage."""
+        registry = MetricsRegistry()
+        observer = MetricsObserver(registry)
+        for _ in range(10):
+            observer(self._event("openai", "vectorize_query", 0.2))
+            observer(self._event("elasticsearch", "es_vector_search", 0.02))
+        observer(self._event(None, None, 1, status=None))
+
+        metrics = registry.to_dict()
+
+        durations = {
+            (metric["labels"]["processor_type"], metric["labels"]["stage"]): metric
+            for metric in metrics["queryflow_request_duration_seconds"]["metrics"]
+        }
+        assert durations["openai", "vectorize_query"]["count"] == 10
+        assert 0.1 < durations["openai", "vectorize_query"]["p50"] <= 0.25
+        assert durations["elasticsearch", "es_vector_search"]["p99"] <= 0.025
+        assert durations["uuid", ""]["count"] == 1
+        statuses = {}
+        for metric in metrics["queryflow_requests_total"]["metrics"]:
+            status = metric["labels"]["status"]
+            statuses[status] = statuses.get(status, 0) + metric["value"]
+        assert statuses == {"200": 20, "error": 1}
+        response_bytes = metrics["queryflow_response_bytes_total"]["metrics"]
+        assert sum(metric["value"] for metric in response_bytes) == 2100
+        assert "queryflow_connections_opened_total" not in metrics
@@ -0,0 +1,98 @@
+"""Tests for the observers module."""
+
+import httpx
+from mockito import unstub, when
+
+from sandbox import observers
+from sandbox.observers import RequestEvent, RequestTrace, current_stage, stage
+
+
+class TestStage:
+    """Tests for the stage context manager."""
+
+    def test_nested_stages(self):
+        """Test stage blocks label the current stage and restore the outer one."""
+        assert current_stage() is None
+        with stage("outer"):
+            with stage("inner"):
+                assert current_stage() == "inner"
+            assert current_stage() == "outer"
+        assert current_stage() is None
+
+
+class TestRequestTrace:
+    """Tests for the RequestTrace class."""
+
+    def _trace(self, stream=False):
+        """Return a RequestTrace started at time 10."""
+        when(observers.time).monotonic().thenReturn(10.0)
+        return RequestTrace(RequestEvent("openai", None, "url [openai]", stream), 42)
+
+    def test_new_connection(self):
+        """Test the timings of a request that opened a new connection."""
+        trace = self._trace()
+        for now, name in [
+            (10.5, "connection.connect_tcp.started"),
+            (10.75, "connection.connect_tcp.complete"),
+            (11.0, "connection.start_tls.complete"),
+            (11.0, "http11.send_request_headers.started"),
+            (12.0, "http11.receive_response_headers.complete"),
+        ]:
+            when(observers.time).monotonic().thenReturn(now)
+            trace.trace(name, {})
+        when(observers.time).monotonic().thenReturn(12.5)
+
+        event = trace.finish(httpx.Response(200, content=b'{"a": 1}'))
+
+        assert event.connection_reused is False
+        assert event.connect_time == 0.5
+        assert event.time_to_first_byte == 2.0
+        assert event.duration == 2.5
+        assert event.status == 200
+        assert event.request_bytes == 42
+        assert event.response_bytes == 8
+        assert event.ok
+        unstub()
+
+    def test_reused_connection(self):
+        """Test a request on a pooled connection has no connect time."""
+        trace = self._trace()
+        trace.trace("http11.send_request_headers.started", {})
+
+        event = trace.finish(httpx.Response(204))
+
+        assert event.connection_reused is True
+        assert event.connect_time is None
+        assert event.status == 204
+        unstub()
+
+    def test_error(self):
+        """Test the status of a failed response is taken from the error."""
+        trace = self._trace()
+        request = httpx.Request("POST", "http://localhost")
+        response = httpx.Response(503, request=request)
+        error = httpx.HTTPStatusError("", request=request, response=response)
+
+        event = trace.finish(error=error)
+
+        assert event.status == 503
+        assert event.error is error
+        assert not event.ok
+        assert event.time_to_first_byte is None
+        unstub()
+
+    def test_stream_events(self):
+        """Test the time to first event and events per second of a stream."""
+        trace = self._trace(stream=True)
+        for now in [10.25, 10.5, 11.0, 11.5]:
+            when(observers.time).monotonic().thenReturn(now)
+            trace.stream_event()
+        when(observers.time).monotonic().thenReturn(12.0)
+
+        event = trace.finish()
+
+        assert event.time_to_first_event == 0.25
+        assert event.events == 4
+        assert event.events_per_second == 2.0
+        assert RequestEvent(None, "id", "url").events_per_second is None
+        unstub()
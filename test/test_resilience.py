@@ -0,0 +1,377 @@
+"""Tests for the resilience module."""
+
+import asyncio
+import random
+import threading
+
+import httpx
+import pytest
+from mockito import unstub, when
+
+from sandbox import resilience
+from sandbox.resilience import (
+    IDEMPOTENT_ACTIONS,
+    AdaptiveConcurrency,
+    CircuitBreaker,
+    CircuitOpenError,
+    HedgingPolicy,
+    RateLimiter,
+    RetryPolicy,
+)
+
+
+def _status_error(status, headers=None):
+    """Return the HTTPStatusError raised for a response with the given status."""
+    request = httpx.Request("POST", "http://localhost")
+    response = httpx.Response(status, headers=headers, request=request)
+    return httpx.HTTPStatusError("", request=request, response=response)
+
+
+class TestRetryPolicy:
+    """Tests for the RetryPolicy class."""
+
+    def test_exponential_backoff(self):
+        """Test waits double per attempt and are capped at the maximum backoff."""
+        policy = RetryPolicy(max_attempts=10, backoff=0.5, max_backoff=3, jitter=False)
+        error = _status_error(503)
+
+        assert [policy.delay(error, attempt) for attempt in range(1, 6)] == [
+            0.5,
+            1.0,
+            2.0,
+            3,
+            3,
+        ]
+        assert policy.retries == 5
+
+    def test_jitter(self):
+        """Test jittered waits stay between zero and the backoff."""
+        policy = RetryPolicy(max_attempts=10, backoff=1)
+        error = httpx.ConnectError("")
+
+        for _ in range(100):
+            assert 0 <= policy.delay(error, 3) <= 4
+
+    def test_retry_after(self):
+        """Test the Retry-After header overrides the backoff within the cap."""
+        policy = RetryPolicy(backoff=0.5, max_backoff=10)
+
+        assert policy.delay(_status_error(429, {"Retry-After": "7"}), 1) == 7
+        assert policy.delay(_status_error(429, {"Retry-After": "120"}), 1) == 10
+        date = "Wed, 21 Oct 2015 07:28:00 GMT"
+        assert policy.delay(_status_error(503, {"Retry-After": date}), 1) == 0
+
+    def test_not_retried(self):
+        """Test permanent errors and exhausted attempts are not retried."""
+        policy = RetryPolicy(max_attempts=3)
+
+        assert policy.delay(_status_error(400), 1) is None
+        assert policy.delay(_status_error(500), 1) is None
+        assert policy.delay(ValueError(), 1) is None
+        assert policy.delay(_status_error(503), 3) is None
+        assert policy.retries == 0
+        policy = RetryPolicy(statuses=[500])
+        assert policy.delay(_status_error(500), 1, "search") is not None
+
+    def test_non_idempotent_action(self):
+        """Test errors after the request may have been sent are not retried for it."""
+        policy = RetryPolicy(max_attempts=3)
+        action = random.choice(["store", "chat-completion", None])
+
+        assert policy.delay(httpx.ReadTimeout(""), 1, action) is None
+        assert policy.delay(httpx.RemoteProtocolError(""), 1, action) is None
+        assert policy.delay(_status_error(502), 1, action) is None
+        assert policy.delay(_status_error(500), 1, action) is None
+        assert policy.delay(httpx.ConnectError(""), 1, action) is not None
+        assert policy.delay(httpx.PoolTimeout(""), 1, action) is not None
+        assert policy.delay(_status_error(429), 1, action) is not None
+        assert policy.delay(httpx.ReadTimeout(""), 1, "search") is not None
+        assert policy.retries == 4
+
+
+class TestCircuitBreaker:
+    """Tests for the CircuitBreaker class."""
+
+    def test_opens_after_consecutive_failures(self):
+        """Test the circuit opens after the threshold of consecutive failures."""
+        breaker = CircuitBreaker(failure_threshold=3, recovery_time=30)
+        when(resilience.time).monotonic().thenReturn(100.0)
+
+        breaker.failure("a", _status_error(503))
+        breaker.failure("a", _status_error(503))
+        breaker.success("a")
+        breaker.failure("a", _status_error(503))
+        breaker.failure("a", httpx.ReadTimeout(""))
+        assert breaker.state("a") == CircuitBreaker.CLOSED
+        breaker.failure("a", _status_error(500))
+        assert breaker.state("a") == CircuitBreaker.OPEN
+        assert breaker.state("b") == CircuitBreaker.CLOSED
+
+        when(resilience.time).monotonic().thenReturn(110.0)
+        with pytest.raises(CircuitOpenError) as error:
+            breaker.before("a")
+        assert error.value.endpoint == "a"
+        assert error.value.retry_after == 20
+        breaker.before("b")
+        unstub()
+
+    def test_client_errors_do_not_open(self):
+        """Test errors that are not transient count as successful round trips."""
+        breaker = CircuitBreaker(failure_threshold=1)
+
+        breaker.failure("a", _status_error(404))
+        breaker.before("a")
+        assert breaker.state("a") == CircuitBreaker.CLOSED
+
+    def test_half_open_trial(self):
+        """Test a single trial is let through after the recovery time."""
+        breaker = CircuitBreaker(failure_threshold=1, recovery_time=30)
+        when(resilience.time).monotonic().thenReturn(100.0)
+        breaker.failure("a", _status_error(502))
+
+        when(resilience.time).monotonic().thenReturn(130.0)
+        assert breaker.state("a") == CircuitBreaker.HALF_OPEN
+        breaker.before("a")
+        with pytest.raises(CircuitOpenError):
+            breaker.before("a")
+
+        breaker.failure("a", _status_error(502))
+        assert breaker.state("a") == CircuitBreaker.OPEN
+
+        when(resilience.time).monotonic().thenReturn(160.0)
+        breaker.before("a")
+        breaker.success("a")
+        assert breaker.state("a") == CircuitBreaker.CLOSED
+        breaker.before("a")
+        unstub()
+
+    def test_abandoned_trial(self):
+        """Test a cancelled trial lets the next request through."""
+        breaker = CircuitBreaker(failure_threshold=1, recovery_time=0)
+        breaker.failure("a", _status_error(502))
+
+        breaker.before("a")
+        breaker.abandon("a")
+        breaker.before("a")
+
+
+class TestHedgingPolicy:
+    """Tests for the HedgingPolicy class."""
+
+    def test_accepts(self):
+        """Test only idempotent actions of opted-in processor types are hedged."""
+        policy = HedgingPolicy(processor_types=["openai"])
+
+        assert policy.accepts("openai", "embeddings")
+        assert not policy.accepts("openai", "chat-completion")
+        assert not policy.accepts("elasticsearch", "vector")
+        assert not policy.accepts(None, None)
+        assert HedgingPolicy().accepts("elasticsearch", "vector")
+        assert HedgingPolicy(actions=["native"]).accepts("elasticsearch", "native")
+        assert "embeddings" in IDEMPOTENT_ACTIONS
+
+    def test_fixed_delay(self):
+        """Test a fixed delay ignores the observed latencies."""
+        policy = HedgingPolicy(delay=0.25)
+        for _ in range(100):
+            policy.record(5.0)
+        assert policy.hedge_delay() == 0.25
+
+    def test_percentile_delay(self):
+        """Test the delay follows the percentile once enough latencies are observed."""
+        policy = HedgingPolicy(percentile=0.95, initial_delay=2.0, min_samples=10)
+        latencies = [index / 100 for index in range(1, 101)]
+        random.shuffle(latencies)
+
+        for latency in latencies[:9]:
+            policy.record(latency)
+        assert policy.hedge_delay() == 2.0
+
+        for latency in latencies[9:]:
+            policy.record(latency)
+        assert policy.hedge_delay() == 0.95
+
+    def test_budget(self):
+        """Test hedges are limited to the budgeted fraction of requests."""
+        policy = HedgingPolicy(budget=0.25, max_tokens=2)
+
+        hedged = 0
+        for _ in range(20):
+            policy.start()
+            hedged += policy.acquire()
+
+        assert hedged == 5
+        assert policy.requests == 20
+        assert policy.hedges == 5
+
+    def test_budget_saves_up_to_max_tokens(self):
+        """Test unused budget is saved up to the maximum number of tokens."""
+        policy = HedgingPolicy(budget=0.5, max_tokens=2)
+        for _ in range(10):
+            policy.start()
+
+        assert policy.acquire()
+        assert policy.acquire()
+        assert not policy.acquire()
+
+
+class TestRateLimiter:
+    """Tests for the RateLimiter class."""
+
+    def test_burst_then_paced(self):
+        """Test a full bucket sends a burst and then spaces requests at the rate."""
+        when(resilience.time).monotonic().thenReturn(100.0)
+        limiter = RateLimiter({"openai": 10}, burst=2)
+
+        delays = [limiter.reserve("openai") for _ in range(4)]
+
+        assert delays == pytest.approx([0, 0, 0.1, 0.2])
+        assert limiter.waits == 2
+        unstub()
+
+    def test_refill(self):
+        """Test the bucket refills with time, up to the burst."""
+        when(resilience.time).monotonic().thenReturn(100.0)
+        limiter = RateLimiter({"openai": 10}, burst=2)
+        for _ in range(2):
+            limiter.reserve("openai")
+
+        when(resilience.time).monotonic().thenReturn(200.0)
+
+        assert [limiter.reserve("openai") for _ in range(3)] == pytest.approx(
+            [0, 0, 0.1]
+        )
+        unstub()
+
+    def test_rates_per_server_type(self):
+        """Test each server type has its own bucket and rate."""
+        when(resilience.time).monotonic().thenReturn(100.0)
+        limiter = RateLimiter({"openai": 1, "elasticsearch": 100}, default_rate=None)
+
+        assert limiter.reserve("openai") == 0
+        assert limiter.reserve("openai") == pytest.approx(1)
+        assert limiter.reserve("elasticsearch") == 0
+        assert all(limiter.reserve("other") == 0 for _ in range(100))
+        assert all(limiter.reserve(None) == 0 for _ in range(100))
+        unstub()
+
+    def test_per_credential(self):
+        """Test credentials of the same server type get separate buckets."""
+        when(resilience.time).monotonic().thenReturn(100.0)
+        shared = RateLimiter({"openai": 1})
+        separate = RateLimiter({"openai": 1}, per_credential=True)
+
+        assert shared.reserve("openai", "a") == 0
+        assert shared.reserve("openai", "b") == pytest.approx(1)
+        assert separate.reserve("openai", "a") == 0
+        assert separate.reserve("openai", "b") == 0
+        unstub()
+
+
+class TestAdaptiveConcurrency:
+    """Tests for the AdaptiveConcurrency class."""
+
+    def _send(self, limit, start, end, error=None, server_type="openai"):
+        """Acquire a slot and release it with a request sent at start."""
+        when(resilience.time).monotonic().thenReturn(end)
+        assert limit.acquire(server_type, timeout=0)
+        limit.release(server_type, None, start, error)
+
+    def test_additive_increase(self):
+        """Test successful requests of a window in use grow the limit by 1/limit."""
+        limit = AdaptiveConcurrency(initial_limit=4, max_limit=5)
+        for _ in range(3):
+            assert limit.acquire("openai", timeout=0)
+        when(resilience.time).monotonic().thenReturn(1.0)
+        limit.release("openai", None, 0.0)
+
+        assert limit.limit("openai") == pytest.approx(4.25)
+        for _ in range(20):
+            self._send(limit, 0.0, 1.0)
+        assert limit.limit("openai") == 5
+        unstub()
+
+    def test_idle_window_does_not_grow(self):
+        """Test requests that do not use the window leave the limit unchanged."""
+        limit = AdaptiveConcurrency(initial_limit=8)
+        for _ in range(10):
+            self._send(limit, 0.0, 1.0)
+
+        assert limit.limit("openai") == 8
+        unstub()
+
+    def test_multiplicative_decrease_once_per_event(self):
+        """Test a burst of 429 responses halves the limit only once."""
+        limit = AdaptiveConcurrency(initial_limit=16, min_limit=2)
+        for _ in range(5):
+            self._send(limit, 10.0, 11.0, _status_error(429))
+
+        assert limit.limit("openai") == 8
+        assert limit.decreases == 1
+
+        for _ in range(3):
+            self._send(limit, 12.0, 13.0, _status_error(503))
+            self._send(limit, 14.0, 15.0, _status_error(503))
+        assert limit.limit("openai") == 2
+        unstub()
+
+    def test_other_errors_keep_limit(self):
+        """Test errors that are not congestion neither grow nor shrink the limit."""
+        limit = AdaptiveConcurrency(initial_limit=1)
+        self._send(limit, 0.0, 1.0, _status_error(400))
+        self._send(limit, 0.0, 1.0, _status_error(500))
+
+        assert limit.limit("openai") == 1
+        unstub()
+
+    def test_latency_spike(self):
+        """Test a latency above the tolerance decreases the limit."""
+        limit = AdaptiveConcurrency(initial_limit=1, latency_tolerance=2.0)
+        self._send(limit, 0.0, 1.0)
+        self._send(limit, 1.0, 2.5)
+        assert limit.decreases == 0
+
+        self._send(limit, 3.0, 6.0)
+
+        assert limit.decreases == 1
+        unstub()
+
+    def test_windows_per_server_type(self):
+        """Test each server type has its own window."""
+        limit = AdaptiveConcurrency(initial_limit=1)
+
+        assert limit.acquire("openai", timeout=0)
+        assert not limit.acquire("openai", timeout=0)
+        assert limit.acquire("elasticsearch", timeout=0)
+
+    def test_acquire_waits_for_release(self):
+        """Test a request beyond the limit waits until a slot is released."""
+        limit = AdaptiveConcurrency(initial_limit=1)
+        assert limit.acquire("openai")
+        acquired = threading.Event()
+
+        def acquire():
+            limit.acquire("openai")
+            acquired.set()
+
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        assert not acquired.wait(0.05)
+        limit.release("openai")
+        assert acquired.wait(1)
+        thread.join()
+
+    def test_acquire_async(self):
+        """Test coroutines wait for a slot without blocking the event loop."""
+        limit = AdaptiveConcurrency(initial_limit=1)
+
+        async def run():
+            assert await limit.acquire_async("openai")
+            assert not await limit.acquire_async("openai", timeout=0.01)
+            waiter = asyncio.ensure_future(limit.acquire_async("openai"))
+            await asyncio.sleep(0.01)
+            assert not waiter.done()
+            limit.release("openai")
+            return await asyncio.wait_for(waiter, 1)
+
+        assert asyncio.run(run())
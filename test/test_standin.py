@@ -0,0 +1,44 @@
+"""Tests for the stand-in server of the benchmarks."""
+
+import os
+import socket
+import sys
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+from standin import StandInServer  # noqa: E402
+
+
+class TestStandInServer:
+    """Tests for the StandInServer class."""
+
+    def test_concurrent_connections(self):
+        """Test connections opened before the server accepts any are all answered."""
+        server = StandInServer()
+        address = urlsplit(server.url)
+        connections = []
+        try:
+            for _ in range(64):
+                connections.append(
+                    socket.create_connection((address.hostname, address.port), 5)
+                )
+        except OSError:
+            server._server.server_close()
+            raise
+        try:
+            with server:
+                for connection in connections:
+                    connection.sendall(
+                        b"POST /v2/sandbox/ HTTP/1.1\r\nHost: localhost\r\n"
+                        b"Connection: close\r\nContent-Length: 2\r\n\r\n{}"
+                    )
+                statuses = [
+                    connection.makefile("rb").readline() for connection in connections
+                ]
+        finally:
+            for connection in connections:
+                connection.close()
+
+        assert statuses == [b"HTTP/1.1 200 OK\r\n"] * 64
+        assert server.requests == 64
@@ -0,0 +1,187 @@
+"""Tests for the transport module."""
+
+import asyncio
+import json
+import random
+import string
+import time
+
+import httpx
+import pytest
+
+from sandbox.discovery_sandbox import (
+    AsyncQueryFlowClient,
+    Credential,
+    Processor,
+    QueryFlowClient,
+    Server,
+)
+from sandbox.transport import (
+    AsyncRecordingTransport,
+    AsyncReplayTransport,
+    Exchange,
+    RecordingTransport,
+    ReplayMissError,
+    ReplayTransport,
+)
+
+
+def _random_string(length=10):
+    """Return a random ascii string."""
+    return "".join(random.choices(string.ascii_letters, k=length))
+
+
+class TestRecordAndReplay:
+    """Tests for recording sandbox traffic and replaying it offline."""
+
+    def setup_method(self):
+        """Prepare a processor with secrets and a fake sandbox API."""
+        self.api_key = _random_string()
+        self.secret = _random_string()
+        self.processor = Processor(
+            "openai",
+            {"model": _random_string()},
+            Server("openai", {}, Credential("openai", {"apiKey": self.secret})),
+        )
+        self.answer = {"text": _random_string()}
+
+    def _handler(self, request):
+        """Answer JSON requests after a delay and streams with three chunks."""
+        if "text/event-stream" in request.headers.get("Accept", ""):
+            return httpx.Response(
+                200,
+                headers={"Content-Type": "text/event-stream"},
+                content=iter([b"data: a\n\n", b"data: b\n\n", b"data: c\n\n"]),
+            )
+        time.sleep(0.05)
+        return httpx.Response(
+            200, json=self.answer, headers={"Set-Cookie": "session=secret"}
+        )
+
+    def _record(self, path):
+        """Record one call and one stream of the processor."""
+        transport = RecordingTransport(path, httpx.MockTransport(self._handler))
+        with QueryFlowClient("http://sandbox", self.api_key, transport=transport) as c:
+            assert c.text_to_text(self.processor, {"q": "x"}) == self.answer
+            assert list(c.text_to_stream(self.processor, {"q": "x"})) == [
+                "a",
+                "b",
+                "c",
+            ]
+
+    def test_replay(self, tmp_path):
+        """Test replayed calls and streams return the recorded responses."""
+        path = tmp_path / "recording.jsonl"
+        self._record(path)
+
+        transport = ReplayTransport(path)
+        api_key = _random_string()
+        with QueryFlowClient("http://replay", api_key, transport=transport) as c:
+            for _ in range(2):
+                assert c.text_to_text(self.processor, {"q": "x"}) == self.answer
+            assert list(c.text_to_stream(self.processor, {"q": "x"})) == [
+                "a",
+                "b",
+                "c",
+            ]
+
+    def test_recording_excludes_secrets(self, tmp_path):
+        """Test the api key, processor credentials and cookies are not recorded."""
+        path = tmp_path / "recording.jsonl"
+        self._record(path)
+
+        recording = path.read_text()
+        assert len(recording.splitlines()) == 2
+        assert self.api_key not in recording
+        assert self.secret not in recording
+        assert "session=secret" not in recording
+
+    def test_recorded_chunks(self, tmp_path):
+        """Test streamed responses keep their chunks and the timing of responses."""
+        path = tmp_path / "recording.jsonl"
+        self._record(path)
+
+        call, stream = [Exchange.from_json(line) for line in path.open()]
+        assert call.headers_time >= 0.05
+        assert [chunk for _, chunk in stream.chunks] == [
+            b"data: a\n\n",
+            b"data: b\n\n",
+            b"data: c\n\n",
+        ]
+
+    def test_replay_speed(self, tmp_path):
+        """Test a speed of 1 replays responses with their recorded latency."""
+        path = tmp_path / "recording.jsonl"
+        self._record(path)
+
+        transport = ReplayTransport(path, speed=1)
+        with QueryFlowClient("http://replay", self.api_key, transport=transport) as c:
+            start = time.monotonic()
+            c.text_to_text(self.processor, {"q": "x"})
+            assert time.monotonic() - start >= 0.05
+
+    def test_gzip_recording(self, tmp_path):
+        """Test recordings whose name ends in .gz are compressed."""
+        path = tmp_path / "recording.jsonl.gz"
+        self._record(path)
+
+        assert path.read_bytes()[:2] == b"\x1f\x8b"
+        transport = ReplayTransport(path)
+        with QueryFlowClient("http://replay", self.api_key, transport=transport) as c:
+            assert c.text_to_text(self.processor, {"q": "x"}) == self.answer
+
+    def test_replay_miss(self, tmp_path):
+        """Test requests that were never recorded raise ReplayMissError."""
+        path = tmp_path / "recording.jsonl"
+        self._record(path)
+
+        transport = ReplayTransport(path)
+        with QueryFlowClient("http://replay", self.api_key, transport=transport) as c:
+            with pytest.raises(ReplayMissError):
+                c.text_to_text(self.processor, {"q": "y"})
+
+    def test_binary_body(self):
+        """Test bodies that are not UTF-8 survive the round trip."""
+        body = bytes(range(256))
+        exchange = Exchange(
+            ("POST", "/v2/sandbox", "*/*", "digest"), 200, [], 0.1, [(0.1, body)]
+        )
+
+        restored = Exchange.from_json(exchange.to_json())
+
+        assert json.loads(exchange.to_json())["encoding"] == "base64"
+        assert restored.chunks == [(0.1, body)]
+        assert restored.key == exchange.key
+
+    def test_async_record_and_replay(self, tmp_path):
+        """Test the asyncio transports record and replay the same traffic."""
+        path = tmp_path / "recording.jsonl"
+
+        async def events():
+            for data in [b"a", b"b", b"c"]:
+                yield b"data: " + data + b"\n\n"
+
+        async def handler(request):
+            if "text/event-stream" in request.headers.get("Accept", ""):
+                return httpx.Response(
+                    200, headers={"Content-Type": "text/event-stream"}, content=events()
+                )
+            return httpx.Response(200, json=self.answer)
+
+        async def run(transport):
+            async with AsyncQueryFlowClient(
+                "http://sandbox", self.api_key, transport=transport
+            ) as client:
+                body = await client.text_to_text(self.processor, {"q": "x"})
+                received = [
+                    data
+                    async for data in client.text_to_stream(self.processor, {"q": "x"})
+                ]
+                return body, received
+
+        recorded = asyncio.run(
+            run(AsyncRecordingTransport(path, httpx.MockTransport(handler)))
+        )
+        replayed = asyncio.run(run(AsyncReplayTransport(path)))
+
+        assert recorded == replayed == (self.answer, ["a", "b", "c"])
@@ -1,6 +1,49 @@
 from pypdf import PdfReader
 import re
-from typing import List
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import BinaryIO, Iterable, Iterator, List, Tuple, Union
+
+WHITESPACE = re.compile(r'\s+')
+ARTIFACTS = re.compile(r'[^\w\s\.\,\!\?\;\:\-\(\)\[\]\{\}\"\'\/\@\#\$\%\&\*\+\=\<\>\~\`\|\\]')
+
+class Chunk:
+    """
+    A chunk stored as the character offsets of its text in a shared source text.
+    
+    Overlapping chunks share the source instead of each holding a copy of the
+    overlapping text, and the text of a chunk is only sliced when it is used.
+    """
+    __slots__ = ('source', 'start', 'end')
+    
+    def __init__(self, source: str, start: int, end: int):
+        """
+        Initialize the chunk.
+        
+        Args:
+            source: The cleaned text the chunk is taken from
+            start: Offset of the first character of the chunk in the source
+            end: Offset after the last character of the chunk in the source
+        """
+        self.source = source
+        self.start = start
+        self.end = end
+    
+    @property
+    def text(self) -> str:
+        """
+        The text of the chunk, sliced from the source.
+        """
+        return self.source[self.start:self.end]
+    
+    def __str__(self) -> str:
+        return self.text
+    
+    def __len__(self) -> int:
+        return self.end - self.start
+    
+    def __repr__(self) -> str:
+        return f"Chunk(start={self.start}, end={self.end})"
 
 class PDFChunker:
     def __init__(self, chunk_size: int = 1000, overlap_size: int = 200):
@@ -14,23 +57,34 @@ class PDFChunker:
         self.chunk_size = chunk_size
         self.overlap_size = overlap_size
     
-    def extract_text_from_pdf(self, pdf_path: str) -> str:
+    def extract_pages(self, pdf: Union[str, BinaryIO]) -> Iterator[str]:
         """
-        Extract text from PDF file.
+        Extract the text of a PDF one page at a time.
         
         Args:
-            pdf_path: Path to the PDF file
+            pdf: Path to the PDF file, or a binary stream such as io.BytesIO
             
-        Returns:
-            Extracted text as a single string
+        Yields:
+            The extracted text of each page
         """
         try:
-            reader = PdfReader(pdf_path)
-            context = "\n".join([page.extract_text() for page in reader.pages])
-            return context
+            reader = PdfReader(pdf)
+            for page in reader.pages:
+                yield page.extract_text()
         except Exception as e:
             print(f"Error reading PDF: {e}")
-            return ""
+    
+    def extract_text_from_pdf(self, pdf: Union[str, BinaryIO]) -> str:
+        """
+        Extract text from PDF file.
+        
+        Args:
+            pdf: Path to the PDF file, or a binary stream such as io.BytesIO
+            
+        Returns:
+            Extracted text as a single string
+        """
+        return "\n".join(self.extract_pages(pdf))
     
     def clean_text(self, text: str) -> str:
         """
@@ -43,9 +97,9 @@ class PDFChunker:
             Cleaned text
         """
         # Remove extra whitespace and normalize line breaks
-        text = re.sub(r'\s+', ' ', text)
+        text = WHITESPACE.sub(' ', text)
         # Remove common PDF artifacts
-        text = re.sub(r'[^\w\s\.\,\!\?\;\:\-\(\)\[\]\{\}\"\'\/\@\#\$\%\&\*\+\=\<\>\~\`\|\\]', '', text)
+        text = ARTIFACTS.sub('', text)
         return text.strip()
     
     def chunk_by_words(self, text: str) -> List[str]:
@@ -59,30 +113,114 @@ class PDFChunker:
             List of text chunks with word overlap
         """
         words = text.split()
-        if not words:
-            return []
+        offsets = self._word_offsets(words)
+        return [' '.join(words[start:end]) for start, end in self._chunk_bounds(offsets)]
+    
+    def chunk_spans(self, text: str) -> List[Chunk]:
+        """
+        Chunk text like chunk_by_words, as spans of a single copy of the text.
+        
+        Args:
+            text: Text to chunk
+            
+        Returns:
+            List of chunks whose text is the same as the chunk_by_words chunks
+        """
+        # With single spaces between words, the word offsets are character offsets
+        source = ' '.join(text.split())
+        if source == text:
+            # Cleaned text is already normalized, so share it instead of the copy
+            source = text
+        offsets = self._word_offsets(source.split())
+        return [
+            Chunk(source, offsets[start], offsets[end] - 1)
+            for start, end in self._chunk_bounds(offsets)
+        ]
+    
+    @staticmethod
+    def _word_offsets(words: List[str]) -> List[int]:
+        """
+        Calculate the number of characters before each word and after the last one.
         
-        chunks = []
+        offsets[i] counts the characters of the first i words with a space after
+        each word, so it is the position of word i in the words joined by spaces.
+        """
+        return list(accumulate((len(word) + 1 for word in words), initial=0))
+    
+    def _chunk_bounds(self, offsets: List[int]) -> Iterator[Tuple[int, int]]:
+        """
+        Find the start and end word index of every chunk.
+        
+        The size of the words between two indexes is a subtraction of their
+        offsets, so the chunk and overlap boundaries are found by bisection
+        instead of rescanning the words of each chunk.
+        """
+        word_count = len(offsets) - 1
         start_idx = 0
         
-        while start_idx < len(words):
-            # Calculate end index for current chunk
-            end_idx = start_idx + self._words_in_chunk(words[start_idx:])
-            end_idx = min(end_idx, len(words))
+        while start_idx < word_count:
+            # Last word that fits in the chunk, but at least one word
+            end_idx = bisect_right(
+                offsets, offsets[start_idx] + self.chunk_size, start_idx
+            ) - 1
+            end_idx = max(end_idx, start_idx + 1)
+            yield start_idx, end_idx
             
-            # Create chunk from words
-            chunk = ' '.join(words[start_idx:end_idx])
-            chunks.append(chunk)
+            # If we've reached the end, stop
+            if end_idx >= word_count:
+                return
             
-            # If we've reached the end, break
-            if end_idx >= len(words):
-                break
+            # First word of the chunk that fits in the overlap
+            overlap_idx = bisect_left(
+                offsets, offsets[end_idx] - self.overlap_size, start_idx, end_idx
+            )
+            start_idx = max(start_idx + 1, overlap_idx)
+    
+    def iter_chunks(self, words: Iterable[str]) -> Iterator[str]:
+        """
+        Chunk a stream of words using the word-based overlapping strategy.
+        
+        Only the words of the current chunk and the next one are kept, so the
+        words can come from a generator over a document of any size. The chunks
+        are the same as chunk_by_words returns for the joined words.
+        
+        Args:
+            words: Words to chunk
             
-            # Calculate overlap for next chunk
-            overlap_words = self._words_in_overlap(words[start_idx:end_idx])
-            start_idx = max(start_idx + 1, end_idx - overlap_words)
+        Yields:
+            Text chunks with word overlap
+        """
+        words = iter(words)
+        buffer = []
+        buffered_chars = 0
+        exhausted = False
         
-        return chunks
+        while True:
+            # Read words until the chunk size is exceeded, so the end of the
+            # current chunk does not depend on words that were not read yet
+            while not exhausted and buffered_chars <= self.chunk_size:
+                word = next(words, None)
+                if word is None:
+                    exhausted = True
+                    break
+                buffer.append(word)
+                buffered_chars += len(word) + 1
+            if not buffer:
+                return
+            
+            # Create chunk from words
+            end_idx = self._words_in_chunk(buffer)
+            yield ' '.join(buffer[:end_idx])
+            
+            # If we've reached the end, stop
+            if exhausted and end_idx >= len(buffer):
+                return
+            
+            # Drop the words before the overlap of the next chunk
+            overlap_words = self._words_in_overlap(buffer[:end_idx])
+            start_idx = max(1, end_idx - overlap_words)
+            buffered_chars -= sum(len(word) + 1 for word in buffer[:start_idx])
+            del buffer[:start_idx]
     
     def _words_in_chunk(self, words: List[str]) -> int:
         """
@@ -118,30 +256,60 @@ class PDFChunker:
         
         return word_count
     
-    def process_pdf(self, pdf_path: str) -> List[str]:
+    def iter_pdf_chunks(self, pdf: Union[str, BinaryIO]) -> Iterator[str]:
+        """
+        Extract, clean and chunk PDF content page by page.
+        
+        Pages are only read as the chunks are consumed and the chunks overlap
+        across page boundaries, so memory is bounded by the size of a page and
+        the first chunks are available before the whole PDF is parsed.
+        
+        Args:
+            pdf: Path to the PDF file, or a binary stream such as io.BytesIO
+            
+        Returns:
+            Iterator over the text chunks
+        """
+        words = (
+            word
+            for page in self.extract_pages(pdf)
+            for word in self.clean_text(page).split()
+        )
+        return self.iter_chunks(words)
+    
+    def process_pdf(self, pdf: Union[str, BinaryIO]) -> List[str]:
         """
         Complete pipeline to extract and chunk PDF content.
         
         Args:
-            pdf_path: Path to the PDF file
+            pdf: Path to the PDF file, or a binary stream such as io.BytesIO
             
         Returns:
             List of text chunks
         """
-        # Extract text
-        raw_text = self.extract_text_from_pdf(pdf_path)
-        if not raw_text:
-            return []
+        return list(self.iter_pdf_chunks(pdf))
+    
+    def process_pdf_spans(self, pdf: Union[str, BinaryIO]) -> List[Chunk]:
+        """
+        Complete pipeline to extract and chunk PDF content into spans.
         
-        # Clean text
-        cleaned_text = self.clean_text(raw_text)
+        The cleaned text of the whole PDF is kept once and shared by the chunks,
+        instead of every chunk holding a copy of its overlapping text.
         
-        # Chunk text
-        return self.chunk_by_words(cleaned_text)
+        Args:
+            pdf: Path to the PDF file, or a binary stream such as io.BytesIO
+            
+        Returns:
+            List of chunks
+        """
+        return self.chunk_spans(self.clean_text(self.extract_text_from_pdf(pdf)))
     
-    def print_chunk_stats(self, chunks: List[str]) -> None:
+    def print_chunk_stats(self, chunks: Union[List[str], List[Chunk]]) -> None:
         """
         Print statistics about the chunks.
+        
+        The overlap of Chunk spans is computed from their offsets, while text
+        chunks are compared character by character.
         """
         if not chunks:
             print("No chunks generated.")
@@ -156,10 +324,16 @@ class PDFChunker:
         
         # Show overlap analysis
         if len(chunks) > 1:
-            overlaps = []
-            for i in range(len(chunks) - 1):
-                overlap = self._calculate_overlap(chunks[i], chunks[i + 1])
-                overlaps.append(overlap)
+            if all(isinstance(chunk, Chunk) for chunk in chunks):
+                overlaps = [
+                    max(0, previous.end - chunk.start)
+                    for previous, chunk in zip(chunks, chunks[1:])
+                ]
+            else:
+                overlaps = []
+                for i in range(len(chunks) - 1):
+                    overlap = self._calculate_overlap(chunks[i], chunks[i + 1])
+                    overlaps.append(overlap)
             
             if overlaps:
                 avg_overlap = sum(overlaps) / len(overlaps)
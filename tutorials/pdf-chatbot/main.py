@@ -1,5 +1,5 @@
 import streamlit as st
-import tempfile
+import io
 import os
 import json
 from datetime import datetime
@@ -83,20 +83,13 @@ def display_index_badge():
 @st.cache_data(ttl=CONFIG['CACHE_TTL'])
 def process_pdf_cached(file_content, filename, chunk_size, overlap_size):
     """Cache PDF processing to avoid reprocessing same files"""
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-        tmp_file.write(file_content)
-        tmp_path = tmp_file.name
-    
     try:
+        # Pages are read from memory and chunked one at a time
         chunker = PDFChunker(chunk_size, overlap_size)
-        chunks = chunker.process_pdf(tmp_path)
-        return chunks
+        return chunker.process_pdf(io.BytesIO(file_content))
     except Exception as e:
         st.error(f"Error processing PDF {filename}: {str(e)}")
         return []
-    finally:
-        if os.path.exists(tmp_path):
-            os.unlink(tmp_path)
 
 def generate_embeddings(filename, chunks):
     """Generate embeddings for PDF chunks with progress tracking"""
@@ -1,11 +1,16 @@
 import os
 from dotenv import load_dotenv
 from sandbox.discovery_sandbox import QueryFlowClient, Credential, Server, Processor
+from sandbox.embedding_store import EmbeddingStore
 
 load_dotenv()
 
 qfc = QueryFlowClient(os.getenv("QF_HOST"), os.getenv("QF_KEY"))
 
+# Embeddings are persisted locally so unchanged text is never embedded twice
+EMBEDDING_MODEL = "text-embedding-3-small"
+embedding_store = EmbeddingStore(os.getenv("EMBEDDING_STORE", "embeddings.db"))
+
 # Credentials
 
 openai_credential = Credential("openai", {
@@ -17,9 +22,9 @@ elastic_credential = Credential("elasticsearch", {
     "password": os.getenv("ES_PASSWORD")
 })
 
-# Servers
+# Servers, frozen so every processor built around them reuses their serialized form
 
-oai_server = Server("openai", {}, openai_credential)
+oai_server = Server("openai", {}, openai_credential, frozen=True)
 
 es_server = Server("elasticsearch", { 
     "servers": [ os.getenv("ES_SERVER") ],
@@ -27,16 +32,19 @@ es_server = Server("elasticsearch", {
         "readTimeout": "30s",
         "connectTimeout": "1m"
     }
-}, elastic_credential)
+}, elastic_credential, frozen=True)
 
 # Processors
 
 def create_embeddings(text):
+    return embedding_store.get_or_create(EMBEDDING_MODEL, text, _openai_embeddings)
+
+def _openai_embeddings(text):
     vectorize_oai = Processor("openai", {
         "action": "embeddings",
         "user": "pureinsights",
         "input": text,
-        "model": "text-embedding-3-small"
+        "model": EMBEDDING_MODEL
     }, oai_server)
     return qfc.text_to_text(vectorize_oai, {})['embeddings'][0]['embedding']
 
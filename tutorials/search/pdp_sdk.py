@@ -1,11 +1,24 @@
 import os 
 from dotenv import load_dotenv
 from sandbox.discovery_sandbox import QueryFlowClient, Credential, Server, Processor
+from sandbox.embedding_store import EmbeddingStore
+from sandbox.metrics import MetricsObserver, MetricsRegistry
+from sandbox.observers import stage
 
 load_dotenv()
 
 qfc = QueryFlowClient(os.getenv("QF_HOST"), os.getenv("QF_KEY"))
 
+# Latency histograms per processor type and stage, served locally when METRICS_PORT is set
+metrics = MetricsRegistry()
+qfc.add_observer(MetricsObserver(metrics))
+if os.getenv("METRICS_PORT"):
+    metrics_server = metrics.serve(port=int(os.getenv("METRICS_PORT")))
+
+# Embeddings are persisted locally so unchanged text is never embedded twice
+EMBEDDING_MODEL = "text-embedding-3-small"
+embedding_store = EmbeddingStore(os.getenv("EMBEDDING_STORE", "embeddings.db"))
+
 # GENERATIVE ANSWERS PROMPT
 GEN_ANS_PROMPT = """
 You are an excellent question and answer, and chat completion system. Everything that you answer MUST be based on the information provided, use ONLY the information given below. Follow carefully the additional rules provided in the user prompt UNLESS they contradict these initial instructions. 
@@ -59,9 +72,9 @@ elastic_credential = Credential("elasticsearch", {
     "password": os.getenv("ES_PASSWORD")
 })
 
-# Servers
+# Servers, frozen so every processor built around them reuses their serialized form
 
-oai_server = Server("openai", {}, openai_credential)
+oai_server = Server("openai", {}, openai_credential, frozen=True)
 
 es_server = Server("elasticsearch", { 
     "servers": [ os.getenv("ES_SERVER") ],
@@ -69,7 +82,7 @@ es_server = Server("elasticsearch", {
         "readTimeout": "30s",
         "connectTimeout": "1m"
     }
-}, elastic_credential)
+}, elastic_credential, frozen=True)
 
 # Processors
 
@@ -149,11 +162,15 @@ def autocomplete_query(query, index='test_search', size=5):
     return qfc.text_to_text(es_autocomplete, {})
 
 def vectorize_query(query):
+    with stage("vectorize_query"):
+        return embedding_store.get_or_create(EMBEDDING_MODEL, query, _openai_embeddings)
+
+def _openai_embeddings(query):
     oai_vectorize = Processor("openai", {
         "action": "embeddings",
         "user": "pureinsights",
         "input": query,
-        "model": "text-embedding-3-small"
+        "model": EMBEDDING_MODEL
     }, oai_server)
     return qfc.text_to_text(oai_vectorize, {})['embeddings'][0]['embedding']
     
@@ -170,7 +187,8 @@ def es_vector_search(embeddings, index='test_search', field='vector'):
         "minScore": 0.6,
         "maxResults": 10
     }, es_server)
-    return qfc.text_to_text(es_vector_request, {})
+    with stage("es_vector_search"):
+        return qfc.text_to_text(es_vector_request, {})
 
 def es_chunks(vector_search_results):
     chunks = []